@@ -5,6 +5,7 @@ from PyInstaller.utils.hooks import collect_all
 datas = [('app.py', '.'), ('modules', 'modules'), ('recon_history.db', '.'), ('C:\\Users\\Administrator\\AppData\\Local\\Programs\\Python\\Python314\\Lib\\site-packages\\streamlit', 'streamlit')]
 binaries = []
 hiddenimports = ['streamlit', 'streamlit.web.cli', 'streamlit.web.server', 'streamlit.runtime', 'streamlit.runtime.scriptrunner', 'streamlit.runtime.scriptrunner.magic_funcs', 'streamlit.components.v1', 'altair', 'pandas', 'numpy', 'openpyxl', 'xlsxwriter', 'reportlab', 'reportlab.pdfgen', 'reportlab.lib', 'reportlab.lib.pagesizes', 'reportlab.lib.styles', 'reportlab.lib.units', 'reportlab.lib.colors', 'reportlab.lib.enums', 'reportlab.platypus', 'reportlab.platypus.tables', 'reportlab.platypus.flowables', 'reportlab.platypus.paragraph', 'sqlite3', 'uuid', 'modules.license_manager', 'modules.key_hashes']
+hiddenimports += ['modules.sheet_reader', 'python_calamine', 'modules.gstr2b_json', 'ijson', 'ijson.backends.python', 'ijson.backends.yajl2_c', 'modules.columnar', 'modules.upload_cache', 'pyarrow', 'pyarrow.parquet', 'modules.gstr2b_merger', 'modules.db_maintenance', 'modules.db_backends', 'modules.xlsx_formats', 'modules.xlsx_stream', 'modules.report_jobs', 'modules.recon_cube', 'modules.status_codes']
 datas += collect_data_files('streamlit')
 tmp_ret = collect_all('streamlit')
 datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
@@ -105,6 +105,9 @@ from modules.data_utils     import (load_data_preview, find_best_match,
                                     extract_meta_from_readme, standardize_invoice_numbers)
 from modules.core_engine    import run_reconciliation
 from modules.report_gen     import generate_excel, generate_vendor_split_zip
+from modules.report_jobs    import submit_reports, job_status, is_pending, read_artifact
+from modules.recon_cube     import build_cube
+from modules.status_codes   import Flag, ISSUE, Status, has_flag, status_flags, status_counts
 from modules.utils          import show_processing_animation
 from modules.email_tool     import (get_vendors_with_issues, generate_email_draft,
                                     generate_whatsapp_message, generate_whatsapp_message_multilang,
@@ -116,11 +119,24 @@ from modules.db_handler     import (init_db, save_reconciliation, get_history_li
                                     save_cdnr_to_history, log_action, get_audit_log,
                                     upsert_followup, get_followups, update_followup_status,
                                     save_followup_notice_sent, get_overdue_followups,
-                                    get_all_clients_itc_summary, compare_two_recons)
+                                    flush_writes,
+                                    get_all_clients_itc_summary, compare_two_recons,
+                                    get_vendor_trend, get_repeat_offenders, query_invoices,
+                                    load_reconciliation_filtered,
+                                    get_layout_profile, save_layout_profile,
+                                    export_database_bytes,
+                                    restore_database_bytes, DB_NAME,
+                                    search_history, backend)
 from modules.file_manager   import get_client_path, save_file_to_folder, open_folder
+from modules.db_maintenance import (run_maintenance, runs_due_for_archive, set_retention_policy,
+                                    get_retention_policies, get_archived_runs,
+                                    restore_archived_run, archiving_supported,
+                                    DEFAULT_KEEP_PERIODS)
 
 # --- PRE-PROCESSORS ---
 from modules.pre_processor  import smart_read_b2ba, process_amendments
+from modules.gstr2b_json    import is_json_upload, json_has_section
+from modules.gstr2b_merger  import merge_gstr2b_frames, start_merge_xlsx
 
 # --- CDNR ENGINE ---
 from modules.cdnr_processor    import process_cdnr_reconciliation
@@ -524,6 +540,43 @@ def make_template_excel():
     out.seek(0)
     return out.getvalue()
 
+def _recon_cube(key):
+    """
+    ReconCube of st.session_state[key] ('last_result' / 'cdnr_result'), built
+    once per result frame. Later edits to a result only touch party names,
+    which the cube doesn't hold; a new result is a new frame → a new cube.
+    """
+    df = st.session_state.get(key)
+    if df is None:
+        return None
+    cached = st.session_state.get(f'_cube_{key}')
+    if cached is None or cached[0] is not df:
+        cached = (df, build_cube(df))
+        st.session_state[f'_cube_{key}'] = cached
+    return cached[1]
+
+def _open_saved_run(recon_id):
+    """Loads a saved run into the session and jumps to its results."""
+    meta, df_loaded, df_cdnr, cdnr_summary = load_reconciliation(recon_id)
+    st.session_state['last_result']      = df_loaded
+    st.session_state['df_b_clean']       = df_loaded
+    st.session_state['df_g_clean']       = df_loaded
+    st.session_state['meta_gstin']       = meta['gstin']
+    st.session_state['meta_name']        = meta['company_name']
+    st.session_state['meta_fy']          = meta['fy']
+    st.session_state['meta_period']      = meta['period']
+    st.session_state.current_client_path = get_client_path(
+        meta['company_name'], meta['gstin'], meta['fy'], meta['period'])
+    st.session_state.current_recon_id    = recon_id
+    st.session_state.cdnr_result  = df_cdnr
+    st.session_state.cdnr_summary = cdnr_summary
+    _recon_cube('last_result'); _recon_cube('cdnr_result')
+    st.session_state['file_books_bytes'] = None
+    st.session_state['file_gst_bytes']   = None
+    st.session_state['merged_2b']        = None
+    st.session_state.app_stage = 'results'
+    st.rerun()
+
 # ==========================================
 # SIDEBAR — HISTORY
 # ==========================================
@@ -575,23 +628,7 @@ with st.sidebar:
                     c_open, c_del = st.columns([3, 1])
                     with c_open:
                         if st.button("📂 Open", key=f"hist_{row['id']}", use_container_width=True):
-                            meta, df_loaded, df_cdnr, cdnr_summary = load_reconciliation(row['id'])
-                            st.session_state['last_result']      = df_loaded
-                            st.session_state['df_b_clean']       = df_loaded
-                            st.session_state['df_g_clean']       = df_loaded
-                            st.session_state['meta_gstin']       = meta['gstin']
-                            st.session_state['meta_name']        = meta['company_name']
-                            st.session_state['meta_fy']          = meta['fy']
-                            st.session_state['meta_period']      = meta['period']
-                            st.session_state.current_client_path = get_client_path(
-                                meta['company_name'], meta['gstin'], meta['fy'], meta['period'])
-                            st.session_state.current_recon_id    = row['id']
-                            st.session_state.cdnr_result  = df_cdnr
-                            st.session_state.cdnr_summary = cdnr_summary
-                            st.session_state['file_books_bytes'] = None
-                            st.session_state['file_gst_bytes']   = None
-                            st.session_state.app_stage = 'results'
-                            st.rerun()
+                            _open_saved_run(row['id'])
                     with c_del:
                         if st.button("🗑️", key=f"del_{row['id']}", use_container_width=True, help="Delete permanently"):
                             delete_reconciliation(row['id'])
@@ -599,6 +636,28 @@ with st.sidebar:
     else:
         st.info("No saved history available.")
 
+    # Invoice search across every saved run
+    with st.expander("🔎 Invoice Search (all runs)", expanded=False):
+        inv_query = st.text_input("Invoice no. / GSTIN / party", key="inv_search_q",
+                                  placeholder="e.g. 4521 or 27AAACA")
+        if inv_query.strip():
+            try:
+                hits = search_history(inv_query)
+            except Exception as e:
+                hits = pd.DataFrame()
+                st.warning(f"Search failed: {e}")
+            if hits.empty:
+                st.caption("No invoices found.")
+            else:
+                st.caption(f"{len(hits)} invoice(s)" + (" — showing first 200" if len(hits) >= 200 else ""))
+                st.dataframe(hits.drop(columns=['recon_id']), hide_index=True, use_container_width=True)
+                runs = hits.drop_duplicates('recon_id')
+                pick = st.selectbox("Open run", runs['recon_id'].tolist(), key="inv_search_run",
+                                    format_func=lambda rid: "{client} · {fy} · {period}".format(
+                                        **runs.set_index('recon_id').loc[rid, ['client', 'fy', 'period']]))
+                if st.button("📂 Open run", key="inv_search_open", use_container_width=True):
+                    _open_saved_run(pick)
+
     # Audit log viewer
     if st.session_state.current_recon_id:
         with st.expander("📋 Audit Log", expanded=False):
@@ -609,6 +668,12 @@ with st.sidebar:
             else:
                 st.caption("No actions logged yet.")
 
+    # ── Queued audit / follow-up writes that failed since the last rerun ──────
+    _failed_writes = flush_writes()
+    if _failed_writes:
+        st.warning(f"⚠️ {len(_failed_writes)} audit / follow-up update(s) could not be saved: "
+                   f"{_failed_writes[-1][1]}")
+
     # ── Overdue Follow-up Reminder ────────────────────────────────────────────
     st.markdown("<hr style='border-color:rgba(255,255,255,0.08);margin:8px 0;'>", unsafe_allow_html=True)
     try:
@@ -753,135 +818,6 @@ if st.session_state.get('show_dashboard', True):
 # GSTR-2B MULTI-FILE MERGER (TOP CORNER)
 # ==========================================
 
-import copy as _copy
-import openpyxl as _openpyxl
-
-# NIC GSTR-2B: row number where actual data starts (everything before = header template)
-_GSTR2B_DATA_START = {
-    'B2B': 7, 'B2BA': 8, 'B2B-CDNR': 7, 'B2B-CDNRA': 8,
-    'IMPG': 7, 'IMPGSEZ': 7, 'ISD': 7, 'ISDA': 8,
-    'ECOMM': 7, 'ECOMMA': 8,
-    'B2B(REJECTED)': 7, 'B2BA(REJECTED)': 8,
-    'B2B-CDNR(REJECTED)': 7, 'B2B-CDNRA(REJECTED)': 8,
-    'ECO(REJECTED)': 7, 'ECOA(REJECTED)': 8, 'ISD(REJECTED)': 7,
-}
-
-def _copy_ws_row(src_ws, dst_ws, src_row, dst_row):
-    """Copy one row with cell values + styles from src to dst worksheet."""
-    for col_idx, src_cell in enumerate(src_ws[src_row], 1):
-        dst_cell = dst_ws.cell(row=dst_row, column=col_idx)
-        dst_cell.value = src_cell.value
-        if src_cell.has_style:
-            dst_cell.font      = _copy.copy(src_cell.font)
-            dst_cell.fill      = _copy.copy(src_cell.fill)
-            dst_cell.border    = _copy.copy(src_cell.border)
-            dst_cell.alignment = _copy.copy(src_cell.alignment)
-            dst_cell.number_format = src_cell.number_format
-
-def _copy_merged_cells(src_ws, dst_ws, up_to_row):
-    """Copy merged cell regions that lie within header rows."""
-    for rng in src_ws.merged_cells.ranges:
-        if rng.min_row <= up_to_row:
-            try:
-                dst_ws.merge_cells(str(rng))
-            except Exception:
-                pass
-
-def _get_sheet(wb, norm_name):
-    """Find a sheet in workbook by normalised (upper) name."""
-    for s in wb.sheetnames:
-        if s.strip().upper() == norm_name:
-            return s
-    return None
-
-def _extract_data_rows(wb, norm_name, data_start):
-    """Return list-of-tuples for data rows in the given sheet."""
-    sheet = _get_sheet(wb, norm_name)
-    if sheet is None:
-        return []
-    ws = wb[sheet]
-    rows = []
-    for r in range(data_start, ws.max_row + 1):
-        row = tuple(ws.cell(row=r, column=c).value for c in range(1, ws.max_column + 1))
-        if any(v is not None for v in row):
-            rows.append(row)
-    return rows
-
-def merge_gstr2b_files(uploaded_files):
-    """
-    Properly merges multiple NIC-format GSTR-2B Excel files.
-    - Preserves rows 1–(data_start-1) from the first file as template (title, sub-headers, merged cells)
-    - Stacks data rows from all files, deduplicating by GSTIN + Invoice No + Date
-    Returns (bytes, error_message).
-    """
-    workbooks = []
-    for f in uploaded_files:
-        try:
-            f.seek(0)
-            workbooks.append(_openpyxl.load_workbook(f, data_only=True))
-        except Exception as e:
-            st.warning(f"⚠️ Could not open `{f.name}`: {e}")
-
-    if not workbooks:
-        return None, "No readable GSTR-2B files."
-
-    template_wb = workbooks[0]
-    out_wb = _openpyxl.Workbook()
-    out_wb.remove(out_wb.active)
-
-    # Collect sheet order from first file, keep same sequence
-    for sheet_name in template_wb.sheetnames:
-        norm = sheet_name.strip().upper()
-        data_start = _GSTR2B_DATA_START.get(norm)
-        src_ws = template_wb[sheet_name]
-        dst_ws = out_wb.create_sheet(title=sheet_name)
-
-        # Copy column widths
-        for col_ltr, dim in src_ws.column_dimensions.items():
-            dst_ws.column_dimensions[col_ltr].width = dim.width or 14
-        for row_idx, dim in src_ws.row_dimensions.items():
-            if dim.height:
-                dst_ws.row_dimensions[row_idx].height = dim.height
-
-        if data_start is None:
-            # Non-data sheet (Read Me, ITC Available…) — copy as-is from template
-            for r in range(1, src_ws.max_row + 1):
-                _copy_ws_row(src_ws, dst_ws, r, r)
-            _copy_merged_cells(src_ws, dst_ws, src_ws.max_row)
-        else:
-            # 1 — Copy header rows exactly from template
-            for r in range(1, data_start):
-                _copy_ws_row(src_ws, dst_ws, r, r)
-            _copy_merged_cells(src_ws, dst_ws, data_start - 1)
-
-            # 2 — Collect + deduplicate data from all workbooks
-            seen_keys = set()
-            all_data  = []
-            for wb in workbooks:
-                for row in _extract_data_rows(wb, norm, data_start):
-                    # Dedup key: col0=GSTIN, col2=Invoice/Note No, col4=Date
-                    try:
-                        key = (str(row[0]).strip().upper(),
-                               str(row[2]).strip().upper(),
-                               str(row[4]).strip())
-                    except Exception:
-                        key = str(row[:5])
-                    if key not in seen_keys:
-                        seen_keys.add(key)
-                        all_data.append(row)
-
-            # 3 — Write merged data
-            for offset, data_row in enumerate(all_data):
-                write_row = data_start + offset
-                for col_idx, val in enumerate(data_row, 1):
-                    dst_ws.cell(row=write_row, column=col_idx).value = val
-
-    buf = io.BytesIO()
-    out_wb.save(buf)
-    buf.seek(0)
-    return buf.getvalue(), None
-
-
 # ── MERGER UI — top right corner via columns ─────────────────────────────────
 _merger_col, _merger_btn_col = st.columns([5, 1])
 with _merger_btn_col:
@@ -895,7 +831,7 @@ if st.session_state.get('show_merger', False):
                     padding:16px 24px; border-radius:12px; margin-bottom:16px;'>
             <h3 style='margin:0;color:white;'>🔀 GSTR-2B Multi-File Merger</h3>
             <p style='margin:4px 0 0 0; font-size:13px; opacity:0.85;'>
-                Combine multiple months' GSTR-2B files into a single consolidated Excel.
+                Combine multiple months' GSTR-2B files and reconcile them in one run (consolidated Excel optional).
                 Automatically deduplicates by GSTIN + Invoice No + Taxable Value.
             </p>
         </div>
@@ -920,21 +856,40 @@ if st.session_state.get('show_merger', False):
             for f in merger_files:
                 st.caption(f"📄 {f.name}  ({f.size/1024:.1f} KB)")
 
-            if st.button("▶️ Run Merge & Download", type="primary", use_container_width=True, key="run_merger"):
+            build_xlsx = st.checkbox("Also build the merged Excel for download (runs in background)",
+                                     value=False, key="merger_build_xlsx")
+            if st.button("▶️ Merge & Use for Reconciliation", type="primary", use_container_width=True, key="run_merger"):
                 with st.spinner("Merging files... deduplicating invoices..."):
-                    merged_bytes, err = merge_gstr2b_files(merger_files)
+                    merged, err = merge_gstr2b_frames(merger_files, warn=st.warning)
                 if err:
                     st.error(f"❌ Merge failed: {err}")
-                elif merged_bytes:
-                    st.success(f"✅ Merged {len(merger_files)} files successfully! Duplicates removed automatically.")
-                    st.download_button(
-                        label="📥 Download Merged GSTR-2B",
-                        data=merged_bytes,
-                        file_name=f"GSTR2B_Merged_{len(merger_files)}files.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        type="primary",
-                        use_container_width=True
-                    )
+                else:
+                    st.session_state['merged_2b'] = merged
+                    st.session_state['merged_2b_xlsx'] = start_merge_xlsx(merger_files) if build_xlsx else None
+                    st.success(f"✅ Merged {merged['files']} files — {len(merged['b2b']):,} B2B invoices after removing duplicates. "
+                               "The merged data is used as GSTR-2B in Step 1; no re-upload needed.")
+
+            xlsx_job = st.session_state.get('merged_2b_xlsx')
+            if xlsx_job is not None:
+                if not xlsx_job.done():
+                    st.info("⏳ Merged Excel is still being written…")
+                    st.button("🔄 Refresh", key="merger_refresh")
+                else:
+                    try:
+                        merged_bytes, err = xlsx_job.result()
+                    except Exception as e:
+                        merged_bytes, err = None, str(e)
+                    if err:
+                        st.error(f"❌ Merged Excel failed: {err}")
+                    elif merged_bytes:
+                        st.download_button(
+                            label="📥 Download Merged GSTR-2B",
+                            data=merged_bytes,
+                            file_name=f"GSTR2B_Merged_{len(merger_files)}files.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            type="primary",
+                            use_container_width=True
+                        )
         elif merger_files and len(merger_files) == 1:
             st.info("☝️ Please upload at least 2 GSTR-2B files to merge.")
 
@@ -985,7 +940,7 @@ if st.session_state.app_stage == 'setup':
           </div>
           <div style="background:#F0F4FF;border:2px solid #93C5FD;border-radius:14px;padding:16px 18px">
             <div style="font-size:13px;font-weight:800;color:#1D4ED8;margin-bottom:4px">🏛️ GSTR-2B Portal Data</div>
-            <div style="font-size:11px;color:#3B82F6">Download from GST Portal (NIC format)</div>
+            <div style="font-size:11px;color:#3B82F6">Download from GST Portal (NIC Excel or JSON)</div>
           </div>
         </div>
         """, unsafe_allow_html=True)
@@ -995,14 +950,26 @@ if st.session_state.app_stage == 'setup':
             file_books = st.file_uploader("Purchase Register", type=['xlsx','csv'],
                                           key="b_up", label_visibility="collapsed")
         with col2:
-            file_gst   = st.file_uploader("GSTR-2B Portal Data", type=['xlsx','csv'],
-                                          key="g_up", label_visibility="collapsed")
+            merged_2b = st.session_state.get('merged_2b')
+            if merged_2b:
+                file_gst = None
+                st.success(f"🔀 Using merged GSTR-2B — {merged_2b['files']} files, "
+                           f"{len(merged_2b['b2b']):,} invoices ({merged_2b['meta'][1] or 'multi-month'})")
+                if st.button("✖ Upload a single 2B instead", key="drop_merged_2b"):
+                    st.session_state['merged_2b'] = None
+                    st.rerun()
+            else:
+                file_gst   = st.file_uploader("GSTR-2B Portal Data", type=['xlsx','csv','json'],
+                                              key="g_up", label_visibility="collapsed")
 
-    if file_books and file_gst:
+    if file_books and (file_gst or merged_2b):
 
         # Save bytes for CDNR tab
         st.session_state['file_books_bytes'] = file_books.read(); file_books.seek(0)
-        st.session_state['file_gst_bytes']   = file_gst.read();   file_gst.seek(0)
+        if file_gst:
+            st.session_state['file_gst_bytes'] = file_gst.read();   file_gst.seek(0)
+        else:
+            st.session_state['file_gst_bytes'] = None
 
         st.divider()
         final_books_map = {}
@@ -1010,7 +977,10 @@ if st.session_state.app_stage == 'setup':
 
         # Load data
         df_b_raw = load_data_preview(file_books)
-        df_g_raw = load_data_preview(file_gst)
+        df_g_raw = merged_2b['b2b'].copy() if merged_2b else load_data_preview(file_gst)
+        # Layout attrs are captured now — amendments / filters below build new frames
+        books_attrs = dict(df_b_raw.attrs) if df_b_raw is not None else {}
+        gst_attrs   = dict(df_g_raw.attrs) if df_g_raw is not None else {}
 
         # --- DATA CONFIDENCE PANEL ---
         if df_b_raw is not None and df_g_raw is not None:
@@ -1050,36 +1020,57 @@ if st.session_state.app_stage == 'setup':
             st.divider()
 
         # B2BA amendments
-        file_gst.seek(0)
-        df_b2ba, status_msg = smart_read_b2ba(file_gst)
+        if merged_2b:
+            df_b2ba = merged_2b['b2ba'].copy() if merged_2b['b2ba'] is not None else None
+            status_msg = "Success" if df_b2ba is not None else "No B2BA sheet found."
+        else:
+            file_gst.seek(0)
+            df_b2ba, status_msg = smart_read_b2ba(file_gst)
         if df_b2ba is not None and not df_b2ba.empty:
             st.info(f"⚡ Processing B2B Amendments... Found {len(df_b2ba)} entries in B2BA.")
-            df_g_raw, deleted_count, added_count = process_amendments(df_g_raw, df_b2ba)
+            df_g_raw, deleted_count, added_count, amend_report = process_amendments(df_g_raw, df_b2ba, report=True)
             st.success(f"✅ B2B Amendments Applied: Removed {deleted_count} old invoices, Added {added_count} revised.")
+            if not amend_report.empty:
+                with st.expander(f"🔁 Amendment details ({len(amend_report)} entries)", expanded=False):
+                    st.dataframe(amend_report, use_container_width=True, hide_index=True)
         elif status_msg and "Critical" in str(status_msg):
             st.warning(status_msg)
 
-        file_gst.seek(0)
         try:
-            _xls_check = pd.ExcelFile(file_gst)
-            _has_cdnr  = any('cdnr' in s.lower() for s in _xls_check.sheet_names)
+            if merged_2b:
+                _has_cdnr = merged_2b['cdnr'] is not None
+            elif is_json_upload(file_gst):
+                _has_cdnr = json_has_section(file_gst, 'cdnr')
+            else:
+                file_gst.seek(0)
+                _xls_check = pd.ExcelFile(file_gst)
+                _has_cdnr  = any('cdnr' in s.lower() for s in _xls_check.sheet_names)
         except Exception:
             _has_cdnr  = False
-        file_gst.seek(0)
+        if file_gst:
+            file_gst.seek(0)
         if _has_cdnr:
             st.info("📋 CDNR sheet detected in GSTR-2B. Run **CDNR Reconciliation** from **Tab 2** after B2B recon.")
 
         # Auto-detect metadata
         det_fy, det_period, det_gstin, det_name = "2025 - 2026", "April", "", ""
-        meta_fy, meta_period, meta_gstin, meta_name = extract_meta_from_readme(file_gst)
+        meta_fy, meta_period, meta_gstin, meta_name = (merged_2b['meta'] if merged_2b
+                                                       else extract_meta_from_readme(file_gst))
         if meta_gstin: det_gstin  = meta_gstin
         if meta_name:  det_name   = meta_name
         if meta_fy:    det_fy     = meta_fy
         if meta_period: det_period = meta_period
 
+        # Known layouts (same ERP export / portal format seen before) reuse the confirmed mapping
+        books_layout = get_layout_profile(books_attrs.get('layout_fp'))
+        gst_layout   = get_layout_profile(gst_attrs.get('layout_fp'))
+
         # Column Mapper
         with st.expander("🛠️ Column Mapping Configuration", expanded=False):
-            st.caption(f"Auto-mapped using **{selected_software}** profile. Verify and adjust if needed.")
+            if books_layout and gst_layout:
+                st.caption("🧠 Known file layouts — sheet, header row and column mapping reused from your last confirmed run.")
+            else:
+                st.caption(f"Auto-mapped using **{selected_software}** profile. Verify and adjust if needed.")
             cols_books            = list(df_b_raw.columns) if df_b_raw is not None else []
             cols_gst              = list(df_g_raw.columns) if df_g_raw is not None else []
             cols_books_with_blank = ["<No Column / Blank>"] + cols_books
@@ -1104,15 +1095,20 @@ if st.session_state.app_stage == 'setup':
             with map_col1:
                 st.markdown(f"#### 📚 Purchase Register ({selected_software})")
                 for field in REQUIRED_FIELDS:
-                    suggested = smart_find_with_profile(field, cols_books_with_blank, software_profile, FIXED_BOOKS_MAPPING)
+                    remembered = books_layout['column_map'].get(field) if books_layout else None
+                    if remembered in cols_books_with_blank:
+                        suggested = remembered
+                    else:
+                        suggested = smart_find_with_profile(field, cols_books_with_blank, software_profile, FIXED_BOOKS_MAPPING)
                     idx = cols_books_with_blank.index(suggested) if suggested in cols_books_with_blank else 0
                     is_profile_match = suggested != "<No Column / Blank>" and suggested in cols_books_with_blank
-                    label = f"{field} {'✅' if is_profile_match else '⚠️'}"
+                    label = f"{field} {'🧠' if remembered in cols_books_with_blank else '✅' if is_profile_match else '⚠️'}"
                     final_books_map[field] = st.selectbox(label, cols_books_with_blank, index=idx, key=f"b_{field}")
             with map_col2:
                 st.markdown("#### 🏛️ GSTR-2B (Portal)")
                 for field in REQUIRED_FIELDS:
-                    suggested = find_best_match(field, cols_gst, FIXED_GST_MAPPING)
+                    remembered = gst_layout['column_map'].get(field) if gst_layout else None
+                    suggested = remembered if remembered in cols_gst else find_best_match(field, cols_gst, FIXED_GST_MAPPING)
                     idx = cols_gst.index(suggested) if suggested in cols_gst else 0
                     final_gst_map[field] = st.selectbox(f"{field} (GST)", cols_gst, index=idx, key=f"g_{field}")
 
@@ -1274,6 +1270,13 @@ if st.session_state.app_stage == 'setup':
             books_rename_map = {v: k for k, v in final_books_map.items() if v != "<No Column / Blank>"}
             gst_rename_map   = {v: k for k, v in final_gst_map.items()}
 
+            # Remember the confirmed layouts so the next upload from the same ERP skips mapping
+            try:
+                save_layout_profile(books_attrs, 'books', selected_software, final_books_map)
+                save_layout_profile(gst_attrs, 'gst', 'GSTR-2B', final_gst_map)
+            except Exception:
+                pass
+
             df_b_clean = df_b_raw.rename(columns=books_rename_map)
             df_g_clean = df_g_raw.rename(columns=gst_rename_map)
 
@@ -1366,10 +1369,10 @@ elif st.session_state.app_stage == 'processing':
         'fy':     st.session_state['meta_fy'],
         'period': st.session_state['meta_period']
     }
-    recon_id = save_reconciliation(meta, result)
+    st.session_state['last_result'] = result
+    recon_id = save_reconciliation(meta, result, cube=_recon_cube('last_result'))
     st.session_state.current_recon_id   = recon_id
     st.session_state.current_client_path = get_client_path(meta['name'], meta['gstin'], meta['fy'], meta['period'])
-    st.session_state['last_result'] = result
     log_action(recon_id, 'new_recon', {'invoices': len(result), 'tolerance': tol})
     st.session_state.app_stage = 'results'
     st.rerun()
@@ -1403,6 +1406,7 @@ elif st.session_state.app_stage == 'results':
             st.rerun()
 
     result = st.session_state['last_result']
+    cube   = _recon_cube('last_result')
     df_b   = st.session_state['df_b_clean']
     df_g   = st.session_state['df_g_clean']
     gstin  = st.session_state['meta_gstin']
@@ -1506,18 +1510,15 @@ elif st.session_state.app_stage == 'results':
         total_gst_val    = df_g['Taxable Value'].sum() if 'Taxable Value' in df_g.columns else 0
         diff_val         = total_books_val - total_gst_val
 
-        # Compute GST component totals from result
-        def _col_sum(df, col):
-            return float(pd.to_numeric(df[col], errors='coerce').fillna(0).sum()) if col in df.columns else 0.0
-        _books_igst = _col_sum(result, 'IGST_BOOKS'); _books_cgst = _col_sum(result, 'CGST_BOOKS'); _books_sgst = _col_sum(result, 'SGST_BOOKS')
-        _gst_igst   = _col_sum(result, 'IGST_GST');   _gst_cgst   = _col_sum(result, 'CGST_GST');   _gst_sgst   = _col_sum(result, 'SGST_GST')
+        # GST component totals from the result's cube
+        _books_igst = cube.total('igst_books'); _books_cgst = cube.total('cgst_books'); _books_sgst = cube.total('sgst_books')
+        _gst_igst   = cube.total('igst_gst');   _gst_cgst   = cube.total('cgst_gst');   _gst_sgst   = cube.total('sgst_gst')
         _books_total_gst = _books_igst + _books_cgst + _books_sgst
         _gst_total_gst   = _gst_igst   + _gst_cgst   + _gst_sgst
         _diff_gst        = _books_total_gst - _gst_total_gst
 
         # ── ITC Net Summary Banner ─────────────────────────────────────────────
-        _not_in_2b_df  = result[result['Recon_Status'] == 'Invoices Not in GSTR-2B']
-        _itc_blocked   = float(_not_in_2b_df['Final_Taxable'].sum()) if 'Final_Taxable' in _not_in_2b_df.columns else 0.0
+        _itc_blocked   = cube.total('final', Flag.NOT_IN_2B)
         _cdnr_itc      = float(st.session_state.cdnr_summary.get('net_itc_impact', 0)) if st.session_state.cdnr_summary else 0.0
         _net_eligible  = total_books_val - _itc_blocked + _cdnr_itc
 
@@ -1564,9 +1565,9 @@ elif st.session_state.app_stage == 'results':
 
         # ── 4 KPI tiles ───────────────────────────────────────────────────────
         _total_inv       = len(result)
-        _matched         = int((result['Recon_Status'].str.contains('Matched', na=False)).sum())
-        _not_in_2b_count = int((result['Recon_Status'] == 'Invoices Not in GSTR-2B').sum())
-        _mismatch        = int((result['Recon_Status'].str.contains('Mismatch', na=False)).sum())
+        _matched         = cube.count(Flag.MATCHED)
+        _not_in_2b_count = cube.count(Flag.NOT_IN_2B)
+        _mismatch        = cube.count(Flag.MISMATCH)
 
         def _kpi(label, val, bg='#FFFFFF', lc='#A8ABBB', vc='#1B2035'):
             return f"""<div style="background:{bg};border-radius:14px;padding:15px 16px;box-shadow:0 4px 24px rgba(0,0,0,.07)">
@@ -1584,8 +1585,6 @@ elif st.session_state.app_stage == 'results':
         """, unsafe_allow_html=True)
 
         # ── Donut + Risk Radar 2-col ──────────────────────────────────────────
-        summary_df = result['Recon_Status'].value_counts().reset_index()
-        summary_df.columns = ['Status', 'Count']
         _match_pct = int(_matched / max(_total_inv, 1) * 100)
         _not2b_pct = int(_not_in_2b_count / max(_total_inv, 1) * 100)
         _mis_pct   = int(_mismatch / max(_total_inv, 1) * 100)
@@ -1631,11 +1630,17 @@ elif st.session_state.app_stage == 'results':
             """, unsafe_allow_html=True)
 
         with _col_risk:
-            not_in_2b = result[result['Recon_Status'] == 'Invoices Not in GSTR-2B']
-            if not not_in_2b.empty:
-                risk_df = not_in_2b.groupby('Name of Party').agg(
-                    Missing_Count=('GSTIN','count'), Total_Value=('Final_Taxable','sum')
-                ).reset_index().sort_values('Total_Value', ascending=False).head(5)
+            if _not_in_2b_count:
+                # top vendors by GSTIN from the cube; names only for those five
+                _top = (cube.by_gstin(Flag.NOT_IN_2B)
+                        .sort_values('final', ascending=False).head(5))
+                _names = (result.loc[result['GSTIN'].isin(_top.index) &
+                                     (result['Recon_Status'] == 'Invoices Not in GSTR-2B'),
+                                     ['GSTIN', 'Name of Party']]
+                          .drop_duplicates('GSTIN').set_index('GSTIN')['Name of Party'])
+                risk_df = pd.DataFrame({'Name of Party': [_names.get(g, g) for g in _top.index],
+                                        'Missing_Count': _top['rows'].to_numpy(),
+                                        'Total_Value':   _top['final'].to_numpy()})
                 _max_risk = float(risk_df['Total_Value'].max())
                 _risk_rows = ""
                 for _ri, (_, _r) in enumerate(risk_df.iterrows(), 1):
@@ -1816,96 +1821,103 @@ elif st.session_state.app_stage == 'results':
 
             # ── DOWNLOAD SECTION ────────────────────────────────────────────
             _cdnr_rdy  = st.session_state.get('cdnr_result') is not None
-            _comb_rdy  = st.session_state.get('combined_report_bytes') is not None
-            _both_done = _cdnr_rdy  # B2B is always done if we're here
-
-            # Pre-generate all report bytes
-            _cdnr_r     = st.session_state.get('cdnr_result')
-            _cdnr_bytes = None
-            _b2b_bytes  = None
-            _itc_bytes  = None
-
-            if _cdnr_rdy:
-                try:
-                    _cdnr_bytes = generate_cdnr_excel(_cdnr_r, gstin, name, fy, period, b2b_full_df=result)
-                except Exception:
-                    _cdnr_bytes = None
-
-            try:
-                _b2b_bytes = generate_excel(result, gstin, name, fy, period)
-            except Exception:
-                _b2b_bytes = None
-
-            try:
-                _itc_bytes = create_itc_risk_pdf(result, name, gstin, period, fy).getvalue()
-            except Exception:
-                _itc_bytes = None
-
-            # Auto-generate Combined
-            if _both_done and not _comb_rdy:
-                with st.spinner("⚡ Building Combined Report..."):
-                    try:
-                        _auto_cb = generate_combined_excel(st.session_state['last_result'], st.session_state['cdnr_result'], gstin, name, fy, period)
-                        st.session_state['combined_report_bytes'] = _auto_cb
-                        _comb_rdy = True
-                    except Exception as _ae:
-                        st.warning(f"Could not build combined report: {_ae}")
-
-            _comb_bytes = st.session_state.get('combined_report_bytes')
+            _cdnr_r    = st.session_state.get('cdnr_result')
 
             _XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             _reports = [
-                {"n":"1","icon":"📋","title":"CDNR Reconciliation",     "desc":"Credit/Debit Note matching — all statuses",            "fname":f"CDNR_Reconciliation_{period}.xlsx",       "mime":_XLSX,             "bytes":_cdnr_bytes, "key":"dl_cdnr",     "badge":"#1352C9"},
-                {"n":"2","icon":"📘","title":"B2B Reconciliation",       "desc":"Full B2B matching with Executive Summary",             "fname":f"B2B_Reconciliation_Report_{period}.xlsx", "mime":_XLSX,             "bytes":_b2b_bytes,  "key":"dl_b2b",      "badge":"#0F6B3C"},
-                {"n":"3","icon":"📊","title":"Combined B2B + CDNR",      "desc":"Unified Executive Summary + all sheets in one Excel",  "fname":f"Combined_Reconciliation_{period}.xlsx",   "mime":_XLSX,             "bytes":_comb_bytes, "key":"dl_combined", "badge":"#B45309"},
-                {"n":"4","icon":"📑","title":"ITC Risk Summary (PDF)",   "desc":"One-pager ITC at risk — ready to share with your CA", "fname":f"ITC_Risk_Summary_{period}.pdf",           "mime":"application/pdf", "bytes":_itc_bytes,  "key":"dl_itc",      "badge":"#7C3AED"},
+                {"n":"1","icon":"📋","title":"CDNR Reconciliation",     "desc":"Credit/Debit Note matching — all statuses",            "fname":f"CDNR_Reconciliation_{period}.xlsx",       "mime":_XLSX,             "kind":"cdnr",     "key":"dl_cdnr",     "badge":"#1352C9"},
+                {"n":"2","icon":"📘","title":"B2B Reconciliation",       "desc":"Full B2B matching with Executive Summary",             "fname":f"B2B_Reconciliation_Report_{period}.xlsx", "mime":_XLSX,             "kind":"b2b",      "key":"dl_b2b",      "badge":"#0F6B3C"},
+                {"n":"3","icon":"📊","title":"Combined B2B + CDNR",      "desc":"Unified Executive Summary + all sheets in one Excel",  "fname":f"Combined_Reconciliation_{period}.xlsx",   "mime":_XLSX,             "kind":"combined", "key":"dl_combined", "badge":"#B45309"},
+                {"n":"4","icon":"📑","title":"ITC Risk Summary (PDF)",   "desc":"One-pager ITC at risk — ready to share with your CA", "fname":f"ITC_Risk_Summary_{period}.pdf",           "mime":"application/pdf", "kind":"itc",      "key":"dl_itc",      "badge":"#7C3AED"},
             ]
 
-            # Table header
-            st.markdown('<div style="display:grid;grid-template-columns:44px 1fr 130px;background:#0D1B40;border-radius:10px 10px 0 0;padding:10px 18px;font-size:10px;font-weight:800;color:rgba(255,255,255,.55);letter-spacing:.07em;text-transform:uppercase"><div>#</div><div>Report</div><div style="text-align:center">Download</div></div>', unsafe_allow_html=True)
-
-            for _rpt in _reports:
-                _is_rdy = _rpt["bytes"] is not None
-                _st_badge = ('<span style="background:#F0FDF7;color:#0F6B3C;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">✅ READY</span>' if _is_rdy else '<span style="background:#FFF1F2;color:#C7000A;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">⚠ NOT READY</span>')
-                _ci, _cb = st.columns([5, 1])
-                with _ci:
-                    st.markdown(
-                        f'<div style="display:grid;grid-template-columns:44px 1fr;align-items:center;padding:13px 18px;border:1.5px solid #E2E8F0;border-top:none;background:#fff">'
-                        f'<div style="width:30px;height:30px;border-radius:8px;background:{_rpt["badge"]}18;display:flex;align-items:center;justify-content:center;font-size:15px">{_rpt["icon"]}</div>'
-                        f'<div style="padding-left:12px"><span style="background:{_rpt["badge"]};color:#fff;border-radius:4px;padding:1px 7px;font-size:9px;font-weight:800;font-family:monospace;margin-right:7px">{_rpt["n"]}</span>'
-                        f'<b style="font-size:13px;color:#0D1B40">{_rpt["title"]}</b>'
-                        f'<div style="font-size:11px;color:#64748B;margin-top:2px">{_rpt["desc"]}</div>'
-                        f'<div style="margin-top:5px">{_st_badge}</div></div></div>',
-                        unsafe_allow_html=True)
-                with _cb:
+            # Reports build in the background (report_jobs) into the client folder;
+            # reruns reuse the running / finished job for the same data
+            _cdnr_cube = _recon_cube('cdnr_result')
+            _specs = [('b2b', _reports[1]["fname"], generate_excel, (result, gstin, name, fy, period),
+                       {'cube': cube}),
+                      ('itc', _reports[3]["fname"], create_itc_risk_pdf, (result, name, gstin, period, fy),
+                       {'cube': cube})]
+            if _cdnr_rdy:
+                _specs += [('cdnr', _reports[0]["fname"], generate_cdnr_excel,
+                            (_cdnr_r, gstin, name, fy, period),
+                            {'b2b_full_df': result, 'cube': _cdnr_cube, 'b2b_cube': cube}),
+                           ('combined', _reports[2]["fname"], generate_combined_excel,
+                            (result, _cdnr_r, gstin, name, fy, period),
+                            {'b2b_cube': cube, 'cdnr_cube': _cdnr_cube})]
+            try:
+                st.session_state['report_jobs'] = submit_reports(st.session_state.current_client_path, _specs)
+            except Exception as _je:
+                st.warning(f"Could not queue reports: {_je}")
+            _hub_jobs = st.session_state.get('report_jobs') or {}
+            _hub_pending = any(is_pending(job_status(_j)) for _j in _hub_jobs.values())
+
+            def _report_downloads():
+                _jobs = {k: job_status(j) for k, j in (st.session_state.get('report_jobs') or {}).items()}
+                for _rpt in _reports:
+                    _rpt["job"]   = _jobs.get(_rpt["kind"])
+                    _rpt["bytes"] = read_artifact(_rpt["job"])
+                if _jobs.get('combined') is not None and _reports[2]["bytes"] is not None:
+                    st.session_state['combined_report_bytes'] = _reports[2]["bytes"]
+
+                # Table header
+                st.markdown('<div style="display:grid;grid-template-columns:44px 1fr 130px;background:#0D1B40;border-radius:10px 10px 0 0;padding:10px 18px;font-size:10px;font-weight:800;color:rgba(255,255,255,.55);letter-spacing:.07em;text-transform:uppercase"><div>#</div><div>Report</div><div style="text-align:center">Download</div></div>', unsafe_allow_html=True)
+
+                for _rpt in _reports:
+                    _is_rdy = _rpt["bytes"] is not None
                     if _is_rdy:
-                        st.download_button("📥 Download", data=_rpt["bytes"], file_name=_rpt["fname"], mime=_rpt["mime"],
-                                           type="primary", use_container_width=True, key=_rpt["key"],
-                                           on_click=save_callback, args=(st.session_state.current_client_path, _rpt["fname"], _rpt["bytes"]))
+                        _st_badge = '<span style="background:#F0FDF7;color:#0F6B3C;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">✅ READY</span>'
+                    elif is_pending(_rpt["job"]):
+                        _st_badge = '<span style="background:#EFF6FF;color:#1352C9;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">⏳ GENERATING…</span>'
+                    elif _rpt["job"] is not None and _rpt["job"]["status"] == 'failed':
+                        _st_badge = f'<span style="background:#FFF1F2;color:#C7000A;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">❌ FAILED — {_rpt["job"]["error"]}</span>'
                     else:
-                        st.button("🔒 Not Ready", disabled=True, use_container_width=True, key=f'{_rpt["key"]}_locked')
-
-            st.markdown('<div style="border:1.5px solid #E2E8F0;border-top:none;border-radius:0 0 10px 10px;height:6px;background:#F8FAFC"></div>', unsafe_allow_html=True)
-            st.markdown("<div style='height:14px'></div>", unsafe_allow_html=True)
-
-            # ── DOWNLOAD ALL AS ZIP ──────────────────────────────────────────
-            _ready_rpts = [r for r in _reports if r["bytes"] is not None]
-            if _ready_rpts:
-                import zipfile as _zf, io as _io_z
-                _zbuf = _io_z.BytesIO()
-                with _zf.ZipFile(_zbuf, 'w', _zf.ZIP_DEFLATED) as _z:
-                    for _r in _ready_rpts:
-                        _z.writestr(_r["fname"], _r["bytes"])
-                _zbuf.seek(0)
-                _zname = f"GST_Reports_{name}_{period}.zip"
-                st.markdown(f'<div style="background:#0D1B40;border-radius:12px;padding:14px 20px;margin-bottom:6px"><div style="font-size:14px;font-weight:800;color:#fff">⚡ Download All {len(_ready_rpts)} Reports — One Click</div><div style="font-size:11px;color:rgba(255,255,255,.4);margin-top:2px">All ready reports bundled as a single ZIP file</div></div>', unsafe_allow_html=True)
-                st.download_button(f"📦 Download All {len(_ready_rpts)} Reports as ZIP",
-                    data=_zbuf.getvalue(), file_name=_zname, mime="application/zip",
-                    type="primary", use_container_width=True, key="dl_all_zip")
-
-            # ── Next step ────────────────────────────────────────────────────
-            if all(r["bytes"] is not None for r in _reports):
-                st.markdown('<div class="next-step-hint" style="margin-top:14px"><div style="font-size:11px;font-weight:800;color:#1352C9;letter-spacing:.07em;text-transform:uppercase;margin-bottom:5px">✅ All Reports Ready — Next Step</div><div style="font-size:14px;font-weight:800;color:#0D1B40"><span class="next-step-arrow">→</span> Click <b>💬 Send Notice (Tab 7)</b> to notify vendors with missing invoices</div></div>', unsafe_allow_html=True)
+                        _st_badge = '<span style="background:#FFF1F2;color:#C7000A;border-radius:20px;padding:2px 9px;font-size:9px;font-weight:800">⚠ NOT READY</span>'
+                    _ci, _cb = st.columns([5, 1])
+                    with _ci:
+                        st.markdown(
+                            f'<div style="display:grid;grid-template-columns:44px 1fr;align-items:center;padding:13px 18px;border:1.5px solid #E2E8F0;border-top:none;background:#fff">'
+                            f'<div style="width:30px;height:30px;border-radius:8px;background:{_rpt["badge"]}18;display:flex;align-items:center;justify-content:center;font-size:15px">{_rpt["icon"]}</div>'
+                            f'<div style="padding-left:12px"><span style="background:{_rpt["badge"]};color:#fff;border-radius:4px;padding:1px 7px;font-size:9px;font-weight:800;font-family:monospace;margin-right:7px">{_rpt["n"]}</span>'
+                            f'<b style="font-size:13px;color:#0D1B40">{_rpt["title"]}</b>'
+                            f'<div style="font-size:11px;color:#64748B;margin-top:2px">{_rpt["desc"]}</div>'
+                            f'<div style="margin-top:5px">{_st_badge}</div></div></div>',
+                            unsafe_allow_html=True)
+                    with _cb:
+                        if _is_rdy:
+                            st.download_button("📥 Download", data=_rpt["bytes"], file_name=_rpt["fname"], mime=_rpt["mime"],
+                                               type="primary", use_container_width=True, key=_rpt["key"])
+                        else:
+                            st.button("⏳ Generating" if is_pending(_rpt["job"]) else "🔒 Not Ready",
+                                      disabled=True, use_container_width=True, key=f'{_rpt["key"]}_locked')
+
+                st.markdown('<div style="border:1.5px solid #E2E8F0;border-top:none;border-radius:0 0 10px 10px;height:6px;background:#F8FAFC"></div>', unsafe_allow_html=True)
+                st.markdown("<div style='height:14px'></div>", unsafe_allow_html=True)
+
+                # ── DOWNLOAD ALL AS ZIP ──────────────────────────────────────────
+                _ready_rpts = [r for r in _reports if r["bytes"] is not None]
+                if _ready_rpts:
+                    import zipfile as _zf, io as _io_z
+                    _zbuf = _io_z.BytesIO()
+                    with _zf.ZipFile(_zbuf, 'w', _zf.ZIP_DEFLATED) as _z:
+                        for _r in _ready_rpts:
+                            _z.writestr(_r["fname"], _r["bytes"])
+                    _zbuf.seek(0)
+                    _zname = f"GST_Reports_{name}_{period}.zip"
+                    st.markdown(f'<div style="background:#0D1B40;border-radius:12px;padding:14px 20px;margin-bottom:6px"><div style="font-size:14px;font-weight:800;color:#fff">⚡ Download All {len(_ready_rpts)} Reports — One Click</div><div style="font-size:11px;color:rgba(255,255,255,.4);margin-top:2px">All ready reports bundled as a single ZIP file</div></div>', unsafe_allow_html=True)
+                    st.download_button(f"📦 Download All {len(_ready_rpts)} Reports as ZIP",
+                        data=_zbuf.getvalue(), file_name=_zname, mime="application/zip",
+                        type="primary", use_container_width=True, key="dl_all_zip")
+
+                # ── Next step ────────────────────────────────────────────────────
+                if all(r["bytes"] is not None for r in _reports):
+                    st.markdown('<div class="next-step-hint" style="margin-top:14px"><div style="font-size:11px;font-weight:800;color:#1352C9;letter-spacing:.07em;text-transform:uppercase;margin-bottom:5px">✅ All Reports Ready — Next Step</div><div style="font-size:14px;font-weight:800;color:#0D1B40"><span class="next-step-arrow">→</span> Click <b>💬 Send Notice (Tab 7)</b> to notify vendors with missing invoices</div></div>', unsafe_allow_html=True)
+
+                # Last job finished — one full rerun refreshes the workflow banner and stops polling
+                if _hub_pending and not any(is_pending(j) for j in _jobs.values()):
+                    st.rerun()
+
+            st.fragment(_report_downloads, run_every=2 if _hub_pending else None)()
 
     # ─────────────────────────────────────────────────────
     # TAB 3 — DETAILED DATA
@@ -1920,16 +1932,16 @@ elif st.session_state.app_stage == 'results':
             _live_search = st.text_input("🔍 Search vendor / invoice number", placeholder="Type to filter rows...", key="tab3_search")
 
         df_view = result_display.copy()
+        _rs = result_display['Recon_Status']
 
         if status_filter == "All Data":
             pass
         elif status_filter == "Matched":
-            df_view = result_display[result_display['Recon_Status'].str.contains('Matched', na=False) &
-                                     ~result_display['Recon_Status'].str.contains('AI', na=False)]
+            df_view = result_display[has_flag(_rs, Flag.MATCHED, without=Flag.AI)]
         elif status_filter == "Mismatch (Value)":
-            df_view = result_display[result_display['Recon_Status'].str.contains('Mismatch', na=False)]
+            df_view = result_display[has_flag(_rs, Flag.MISMATCH)]
         elif status_filter == "AI Matched":
-            df_view = result_display[result_display['Recon_Status'].str.contains('AI', na=False)].copy()
+            df_view = result_display[has_flag(_rs, Flag.AI)].copy()
             # Show confidence distribution summary
             if not df_view.empty and 'Match_Confidence' in df_view.columns:
                 _conf = df_view['Match_Confidence']
@@ -1955,17 +1967,12 @@ elif st.session_state.app_stage == 'results':
                 </div>""", unsafe_allow_html=True)
         elif status_filter == "Suggestions":
             # Exclude Group Match rows — those have their own dedicated filter
-            df_view = result_display[
-                result_display['Recon_Status'].str.contains('Suggestion', na=False) &
-                ~result_display['Recon_Status'].str.contains('Group Match', na=False)
-            ].copy()
+            df_view = result_display[has_flag(_rs, Flag.SUGGESTION, without=Flag.GROUP)].copy()
             if 'GSTIN_BOOKS' in df_view.columns and 'GSTIN_GST' in df_view.columns:
                 df_view.insert(0, 'GSTIN Match?',
                                np.where(df_view['GSTIN_BOOKS'] == df_view['GSTIN_GST'], '✅ Same', '❌ Different'))
         elif status_filter == "🔗 Group Match":
-            df_view = result_display[
-                result_display['Recon_Status'].str.contains('Group Match', na=False)
-            ].copy()
+            df_view = result_display[has_flag(_rs, Flag.GROUP)].copy()
             # Identify which side of the match each row is
             has_books = df_view.get('Taxable Value_BOOKS', pd.Series(dtype=float)).notna()
             has_gst   = df_view.get('Taxable Value_GST', pd.Series(dtype=float)).notna()
@@ -1975,7 +1982,7 @@ elif st.session_state.app_stage == 'results':
                 _gm_gstins = df_view['GSTIN'].dropna().unique()
                 st.info(f"🔗 **Group Match** — {len(df_view)} invoice row(s) across **{len(_gm_gstins)} GSTIN(s)** where total values match by GSTIN. These are paired suggestions — both Books and Portal sides shown separately.")
         elif status_filter == "Manually Linked":
-            df_view = result_display[result_display['Recon_Status'].str.contains('Manual', na=False)]
+            df_view = result_display[has_flag(_rs, Flag.MANUAL)]
         elif status_filter == "Not in 2B":
             df_view = result_display[result_display['Recon_Status'] == "Invoices Not in GSTR-2B"]
         elif status_filter == "Not in Books":
@@ -2058,10 +2065,10 @@ elif st.session_state.app_stage == 'results':
     # TAB 4 — SUPPLIER WISE
     # ─────────────────────────────────────────────────────
     with tab5:
-        pivot = result.groupby('Name of Party').agg(
+        pivot = result.assign(_not_in=has_flag(result['Recon_Status'], Flag.NOT_IN)).groupby('Name of Party').agg(
             Total_Invoices  =('GSTIN_BOOKS' if 'GSTIN_BOOKS' in result.columns else 'GSTIN', 'count'),
             Taxable_Value   =('Final_Taxable', 'sum'),
-            Unmatched_Count =('Recon_Status', lambda x: x.str.contains('Not in', na=False).sum())
+            Unmatched_Count =('_not_in', 'sum')
         ).reset_index().sort_values('Unmatched_Count', ascending=False)
         st.dataframe(
             pivot, use_container_width=True, hide_index=True,
@@ -2073,6 +2080,55 @@ elif st.session_state.app_stage == 'results':
             }
         )
 
+        # ── Across every saved run of this client (recon_rows / vendor_rollups) ──
+        st.markdown("---")
+        st.markdown("#### 📈 Supplier History Across Saved Runs")
+        _cl_name  = st.session_state.get('meta_name', '')
+        _cl_gstin = st.session_state.get('meta_gstin', '')
+        try:
+            _by = st.radio("Group by", ['month', 'quarter', 'year'], horizontal=True,
+                           key="vtrend_by", format_func=str.title)
+            _trend = get_vendor_trend(_cl_name, _cl_gstin, by=_by)
+            if _trend.empty:
+                st.caption("No saved runs for this client yet — save the reconciliation to start a trend.")
+            else:
+                _periods = list(dict.fromkeys(_trend['Period']))
+                _wide = (_trend.pivot_table(index=['GSTIN', 'Name of Party'], columns='Period',
+                                            values='itc_value', aggfunc='sum', fill_value=0)
+                               .reindex(columns=_periods))
+                _wide = _wide.loc[_wide.sum(axis=1).sort_values(ascending=False).index].reset_index()
+                st.caption("Open-issue ITC value (₹) per supplier, per period")
+                st.dataframe(_wide, use_container_width=True, hide_index=True,
+                             column_config={p: st.column_config.NumberColumn(p, format="₹ %.0f")
+                                            for p in _periods})
+
+            _repeat = get_repeat_offenders(client_gstin=_cl_gstin)
+            if not _repeat.empty:
+                st.markdown("**🔁 Repeat offenders** — missing from GSTR-2B in 2 or more runs")
+                st.dataframe(_repeat, use_container_width=True, hide_index=True,
+                             column_config={
+                                 "gstin": "GSTIN", "party": "Vendor",
+                                 "runs": st.column_config.NumberColumn("Runs"),
+                                 "invoices": st.column_config.NumberColumn("Invoices"),
+                                 "taxable": st.column_config.NumberColumn("Taxable (₹)", format="₹ %.2f"),
+                             })
+                _pick = st.selectbox("Supplier", _repeat['gstin'].tolist(), key="repeat_pick",
+                                     format_func=lambda g: f"{g} · {_repeat.set_index('gstin').loc[g, 'party']}")
+                _inv = query_invoices(gstin=_pick, statuses='Invoices Not in GSTR-2B',
+                                      client_gstin=_cl_gstin)
+                st.dataframe(_inv[['fy', 'period', 'inv_no_books', 'inv_date', 'taxable_books',
+                                   'igst_books', 'cgst_books', 'sgst_books', 'recon_id']],
+                             use_container_width=True, hide_index=True)
+                _run = st.selectbox("Full rows from run", sorted(_inv['recon_id'].unique(), reverse=True),
+                                    key="repeat_run",
+                                    format_func=lambda rid: "{fy} · {period}".format(
+                                        **_inv.drop_duplicates('recon_id').set_index('recon_id').loc[rid]))
+                _, _rows = load_reconciliation_filtered(int(_run), gstins=[_pick])
+                if _rows is not None:
+                    st.dataframe(_rows, use_container_width=True, hide_index=True)
+        except Exception as _hist_err:
+            st.warning(f"Could not load supplier history: {_hist_err}")
+
     # ─────────────────────────────────────────────────────
     # TAB 5 — MANUAL MATCHER
     # ─────────────────────────────────────────────────────
@@ -2182,14 +2238,14 @@ elif st.session_state.app_stage == 'results':
                     with st.expander("🗂️ Column Mapping Details", expanded=False):
                         st.dataframe(pd.DataFrame([{"Original Column": r, "→ Internal Name": i} for r, i in col_map.items()]), hide_index=True)
 
-                    imp_issue_mask = imp_df['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error', na=False)
+                    imp_issue_mask = has_flag(imp_df['Recon_Status'], ISSUE)
                     imp_vendors = sorted([v for v in imp_df[imp_issue_mask]['Name of Party'].dropna().astype(str).unique() if v and v != 'nan'])
 
                     if not imp_vendors:
                         st.info("No discrepancy vendors found. Check the 'Status' column values in your file.")
                     else:
                         st.markdown(f"**{len(imp_vendors)} vendor(s) with issues found.**")
-                        st_counts = imp_df[imp_issue_mask]['Recon_Status'].value_counts()
+                        st_counts = status_counts(imp_df[imp_issue_mask]['Recon_Status'])
                         if not st_counts.empty:
                             _cols_st = st.columns(min(len(st_counts), 4))
                             for i, (st_name, cnt) in enumerate(st_counts.items()):
@@ -2452,13 +2508,13 @@ elif st.session_state.app_stage == 'results':
 
         STATUS_FILTER_OPTS = {
             "All Issues":                  None,
-            "Not in GSTR-2B":              "Invoices Not in GSTR-2B",
-            "Not in Books":                "Invoices Not in Purchase Books",
-            "Value Mismatch":              "AI Matched (Mismatch)",
-            "Tax Error":                   "Matched (Tax Error)",
-            "Date Mismatch":               "AI Matched (Date Mismatch)",
-            "Invoice No. Mismatch":        "AI Matched (Invoice Mismatch)",
-            "Suggestions":                 "Suggestion",
+            "Not in GSTR-2B":              [Status.NOT_IN_2B],
+            "Not in Books":                [Status.NOT_IN_BOOKS],
+            "Value Mismatch":              [Status.AI_VALUE_MISMATCH],
+            "Tax Error":                   [Status.TAX_ERROR],
+            "Date Mismatch":               [Status.AI_DATE_MISMATCH],
+            "Invoice No. Mismatch":        [Status.AI_INVOICE_MISMATCH],
+            "Suggestions":                 [Status.SUGGESTION, Status.GROUP_SUGGESTION],
         }
 
         if issue_vendors:
@@ -2467,8 +2523,8 @@ elif st.session_state.app_stage == 'results':
                 bulk_status_filter = st.selectbox("Filter vendors by issue type:", list(STATUS_FILTER_OPTS.keys()), index=0, key="bulk_status_filter")
             selected_status_key = STATUS_FILTER_OPTS[bulk_status_filter]
             if selected_status_key:
-                filtered_vendors = [v for v in result[result['Recon_Status'].str.contains(
-                    selected_status_key.replace('(','\\(').replace(')','\\)'), na=False)]['Name of Party'].unique()
+                filtered_vendors = [v for v in result[result['Recon_Status'].isin(
+                    [s.label for s in selected_status_key])]['Name of Party'].unique()
                     if v and str(v) != 'nan']
             else:
                 filtered_vendors = issue_vendors
@@ -2484,7 +2540,7 @@ elif st.session_state.app_stage == 'results':
 
             if selected_vendors_bulk:
                 sel_df = result[result['Name of Party'].isin(selected_vendors_bulk)]
-                st_counts = sel_df[sel_df['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error', na=False)]['Recon_Status'].value_counts()
+                st_counts = status_counts(sel_df[has_flag(sel_df['Recon_Status'], ISSUE)]['Recon_Status'])
                 if not st_counts.empty:
                     cols_st = st.columns(min(len(st_counts), 4))
                     for i, (st_name, cnt) in enumerate(st_counts.items()):
@@ -2539,8 +2595,8 @@ elif st.session_state.app_stage == 'results':
 
             if selected_vendor:
                 v_df = result[(result['Name of Party'] == selected_vendor) &
-                               result['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error', na=False)]
-                v_counts = v_df['Recon_Status'].value_counts()
+                               has_flag(result['Recon_Status'], ISSUE)]
+                v_counts = status_counts(v_df['Recon_Status'])
                 if not v_counts.empty:
                     st.caption("Issues: " + " | ".join(
                         f"**{cnt}×** {st_n.replace('Invoices ','').replace('AI Matched ','')}"
@@ -2557,8 +2613,9 @@ elif st.session_state.app_stage == 'results':
                     st.markdown(f"**Language:** {_lang_sel}  *(change the language selector above)*")
 
                     # Also show targeted category options if applicable
-                    _v_has_2b = any('Not in GSTR-2B' in s for s in v_df['Recon_Status'].values)
-                    _v_has_nb = any('Not in Purchase Books' in s for s in v_df['Recon_Status'].values)
+                    _v_flags  = status_flags(v_df['Recon_Status'])
+                    _v_has_2b = bool((_v_flags & Flag.NOT_IN_2B).any())
+                    _v_has_nb = bool((_v_flags & Flag.NOT_IN_BOOKS).any())
 
                     _notice_type_opts = ["All Issues (Combined)"]
                     if _v_has_2b:   _notice_type_opts.append("🔴 Not in GSTR-2B Only")
@@ -2621,21 +2678,17 @@ elif st.session_state.app_stage == 'results':
             st.info("Open a reconciliation from the sidebar or run one to use the Follow-up Tracker.")
         else:
             # ── Only track "Not in GSTR-2B" — these are the vendors we follow up with
-            _FOLLOWUP_MASK = 'Not in GSTR-2B'
+            _followup_mask = has_flag(result['Recon_Status'], Flag.NOT_IN_2B)
             _all_issue_v = sorted(
-                result[
-                    result['Recon_Status'].str.contains(_FOLLOWUP_MASK, na=False)
-                ]['Name of Party'].dropna().unique().tolist()
+                result[_followup_mask]['Name of Party'].dropna().unique().tolist()
             )
             _all_issue_v = [v for v in _all_issue_v if v and str(v) != 'nan']
 
+            # queued: the background writer commits the whole vendor list in one batch
             for _av in _all_issue_v:
                 _av_gstin = str(result[result['Name of Party'] == _av]['GSTIN'].iloc[0]) \
                             if 'GSTIN' in result.columns and len(result[result['Name of Party'] == _av]) > 0 else ''
-                _av_df    = result[
-                    (result['Name of Party'] == _av) &
-                    result['Recon_Status'].str.contains(_FOLLOWUP_MASK, na=False)
-                ]
+                _av_df    = result[(result['Name of Party'] == _av) & _followup_mask]
                 _av_itc   = float(_av_df['Final_Taxable'].sum()) if 'Final_Taxable' in _av_df.columns else 0.0
                 upsert_followup(recon_id_now, _av, _av_gstin, len(_av_df), _av_itc)
 
@@ -2754,9 +2807,10 @@ elif st.session_state.app_stage == 'results':
             "Values handled separately from B2B — no pollution of B2B KPIs."
         )
 
+        _merged_cdnr = (st.session_state.get('merged_2b') or {}).get('cdnr')
         has_files = (
             st.session_state.get('file_books_bytes') is not None and
-            st.session_state.get('file_gst_bytes')   is not None
+            (st.session_state.get('file_gst_bytes') is not None or _merged_cdnr is not None)
         )
 
         if not has_files:
@@ -2769,11 +2823,13 @@ elif st.session_state.app_stage == 'results':
                 with st.spinner("Reading CDNR sheets, applying CDNRA amendments, and matching notes..."):
                     try:
                         file_b_io = io.BytesIO(st.session_state['file_books_bytes'])
-                        file_g_io = io.BytesIO(st.session_state['file_gst_bytes'])
+                        file_g_io = (io.BytesIO(st.session_state['file_gst_bytes'])
+                                     if st.session_state.get('file_gst_bytes') is not None else None)
                         cdnr_result, cdnr_summary = process_cdnr_reconciliation(
                             file_b_io, file_g_io,
                             tolerance  = st.session_state.get('tolerance',   5.0),
-                            smart_mode = st.session_state.get('smart_mode', False)
+                            smart_mode = st.session_state.get('smart_mode', False),
+                            df_gst_cdnr = _merged_cdnr if file_g_io is None else None
                         )
                         st.session_state.cdnr_result  = cdnr_result
                         st.session_state.cdnr_summary = cdnr_summary
@@ -2840,19 +2896,18 @@ elif st.session_state.app_stage == 'results':
                 cdnr_filter = st.selectbox("🔍 Filter CDNR View", cdnr_filter_opts, key="cdnr_filter")
 
                 CDNR_FILTER_MAP = {
-                    "CDNR Matched"             : r"CDNR Matched$",
-                    "CDNR Matched (Tax Error)" : r"Tax Error",
-                    "CDNR AI Matched"          : r"AI Matched",
-                    "CDNR Mismatch"            : r"Mismatch",
-                    "CDNR Not in GSTR-2B"      : r"Not in GSTR-2B",
-                    "CDNR Not in Books"        : r"Not in Books",
-                    "⚠️ CDNR Suggestions (Review GSTIN Match)": r"Suggestion",
+                    "CDNR Matched"             : Flag.EXACT,
+                    "CDNR Matched (Tax Error)" : Flag.TAX_ERROR,
+                    "CDNR AI Matched"          : Flag.AI,
+                    "CDNR Mismatch"            : Flag.MISMATCH,
+                    "CDNR Not in GSTR-2B"      : Flag.NOT_IN_2B,
+                    "CDNR Not in Books"        : Flag.NOT_IN_BOOKS,
+                    "⚠️ CDNR Suggestions (Review GSTIN Match)": Flag.SUGGESTION,
                 }
                 df_cdnr_view = cdnr_result.copy()
                 if cdnr_filter != "All Data":
-                    pat = CDNR_FILTER_MAP.get(cdnr_filter, cdnr_filter)
                     df_cdnr_view = cdnr_result[
-                        cdnr_result['Recon_Status_CDNR'].str.contains(pat, regex=True, na=False)
+                        has_flag(cdnr_result['Recon_Status_CDNR'], CDNR_FILTER_MAP[cdnr_filter])
                     ].copy()
 
                 # For Suggestions view: show GSTIN match status column
@@ -2977,10 +3032,15 @@ elif st.session_state.app_stage == 'results':
         st.markdown("#### 📤 Export Backup")
         st.caption("Downloads the complete `recon_history.db` — contains all reconciliation history, audit logs, and follow-up tracker data.")
 
-        _db_path = "recon_history.db"
-        if os.path.exists(_db_path):
-            with open(_db_path, "rb") as _dbf:
-                _db_bytes = _dbf.read()
+        _db_path  = DB_NAME
+        _local_db = backend().name == 'sqlite'
+        if not _local_db:
+            st.info(f"Connected to the shared server database ({backend().describe()}). "
+                    "Back it up on the server (e.g. pg_dump) — file export / restore applies "
+                    "to a local database only.")
+        elif os.path.exists(_db_path):
+            # WAL mode: the .db file alone may lag the -wal file — snapshot through the connection
+            _db_bytes = export_database_bytes()
             _bk_filename = f"GST_Backup_{pd.Timestamp.now().strftime('%Y%m%d_%H%M')}.db"
             st.download_button(
                 label="📥 Download Full Backup (.db)",
@@ -2991,7 +3051,7 @@ elif st.session_state.app_stage == 'results':
                 use_container_width=True,
                 help="Save this file safely. Use the Restore section below to load it on any PC."
             )
-            _db_size = os.path.getsize(_db_path) / 1024
+            _db_size = len(_db_bytes) / 1024
             st.caption(f"Database size: {_db_size:.1f} KB  |  File: {_db_path}")
         else:
             st.warning("No database file found yet. Run a reconciliation first.")
@@ -3012,7 +3072,7 @@ elif st.session_state.app_stage == 'results':
             help="Upload a .db file previously exported from this tool."
         )
 
-        if _restore_file:
+        if _restore_file and _local_db:
             _restore_bytes = _restore_file.read()
             st.info(f"File: **{_restore_file.name}** — {len(_restore_bytes)/1024:.1f} KB")
 
@@ -3027,9 +3087,7 @@ elif st.session_state.app_stage == 'results':
                         if _restore_bytes[:16] != b'SQLite format 3\x00':
                             st.error("❌ Invalid file — this does not appear to be a valid SQLite database.")
                         else:
-                            with open(_db_path, "wb") as _dbw:
-                                _dbw.write(_restore_bytes)
-                            init_db()  # run migrations on restored DB
+                            restore_database_bytes(_restore_bytes)  # also runs migrations
                             # Clear session so history reloads from restored DB
                             for _k in ['last_result','df_b_clean','df_g_clean','cdnr_result',
                                        'cdnr_summary','current_recon_id','current_client_path']:
@@ -3042,4 +3100,76 @@ elif st.session_state.app_stage == 'results':
                     except Exception as _re:
                         st.error(f"❌ Restore failed: {_re}")
 
+        st.markdown("---")
+
+        # ── MAINTENANCE ────────────────────────────────────────────────────
+        with st.expander("🧹 Database Maintenance (retention, archive, compaction)", expanded=False):
+            st.caption(
+                "Runs older than the retention window move to per-FY archive files in "
+                "`GST_Clients_Data/_archive` (with their audit log and follow-ups) and can be "
+                "brought back any time. Compaction returns freed space to disk. Safe to run while working."
+            )
+            _keep_default = st.number_input("Keep latest N periods per client (default)", min_value=1,
+                                            value=DEFAULT_KEEP_PERIODS, step=1, key="mnt_keep_default")
+
+            _hist_clients = get_history_list()[['company_name', 'gstin']].drop_duplicates()
+            if not _hist_clients.empty:
+                _pc1, _pc2, _pc3 = st.columns([3, 1, 1])
+                with _pc1:
+                    _pol_client = st.selectbox(
+                        "Client override", _hist_clients.itertuples(index=False),
+                        format_func=lambda r: f"{r.company_name} ({r.gstin})", key="mnt_pol_client")
+                with _pc2:
+                    _pol_keep = st.number_input("Keep periods", min_value=1, value=_keep_default,
+                                                step=1, key="mnt_pol_keep")
+                with _pc3:
+                    st.write("")
+                    if st.button("💾 Save", key="mnt_pol_save", use_container_width=True):
+                        set_retention_policy(_pol_client.company_name, _pol_client.gstin, _pol_keep)
+                        st.success("Policy saved.")
+            _policies = get_retention_policies()
+            if not _policies.empty:
+                st.dataframe(_policies, hide_index=True, use_container_width=True)
+
+            _due = runs_due_for_archive(_keep_default)
+            st.info(f"{len(_due)} run(s) currently outside their retention window.")
+            if not archiving_supported():
+                st.caption("Shared PostgreSQL database: runs are not archived to local files "
+                           "(other desks could not restore them) — maintenance only analyzes.")
+            if st.button("▶️ Run Maintenance", type="primary", key="mnt_run", use_container_width=True):
+                with st.spinner("Archiving and compacting..."):
+                    _rep = run_maintenance(_keep_default)
+                _m1, _m2, _m3 = st.columns(3)
+                _m1.metric("Runs archived", _rep['archived'])
+                _m2.metric("DB size", f"{_rep['size_after']/1048576:.1f} MB",
+                           delta=f"{(_rep['size_after'] - _rep['size_before'])/1048576:.1f} MB",
+                           delta_color="inverse")
+                _m3.metric("Time", f"{_rep['seconds']:.1f} s")
+                st.caption(" · ".join(f"{name}: {secs:.2f}s" for name, secs in _rep['steps']))
+                for _err in _rep['errors']:
+                    st.warning(_err)
+
+            _arch = get_archived_runs()
+            if not _arch.empty:
+                st.markdown("**Archived runs**")
+                st.dataframe(_arch[['company_name', 'gstin', 'fy', 'period', 'timestamp', 'archive_file']],
+                             hide_index=True, use_container_width=True)
+                _arch_pick = st.selectbox(
+                    "Bring back into history", _arch.itertuples(index=False),
+                    format_func=lambda r: f"{r.company_name} · {r.fy} · {r.period} ({str(r.timestamp)[:10]})",
+                    key="mnt_arch_pick")
+                if st.button("♻️ Restore Archived Run", key="mnt_arch_restore"):
+                    try:
+                        _restored = restore_archived_run(_arch_pick.archive_file, _arch_pick.recon_id)
+                        if _restored is None:
+                            st.error(f"❌ Archive file not found: {_arch_pick.archive_file} "
+                                     f"(run {_arch_pick.recon_id})")
+                        else:
+                            st.session_state['mnt_flash'] = "✅ Run restored — open it from Client History."
+                            st.rerun()
+                    except Exception as _ae:
+                        st.error(f"❌ Could not restore: {_ae}")
+            if st.session_state.get('mnt_flash'):
+                st.success(st.session_state.pop('mnt_flash'))
+
     # B2B Download now available in 📥 Downloads Hub (Tab 3)
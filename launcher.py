@@ -16,6 +16,7 @@ else:
 os.environ["STREAMLIT_GLOBAL_DEVELOPMENT_MODE"] = "false"
 os.environ["STREAMLIT_SERVER_HEADLESS"] = "true"
 
+import multiprocessing
 import socket
 import threading
 import webbrowser
@@ -59,4 +60,6 @@ def main():
     sys.exit(stcli.main())
 
 if __name__ == "__main__":
+    # Report workers (vendor split) re-launch this exe — let them run the worker, not the app
+    multiprocessing.freeze_support()
     main()
@@ -8,6 +8,9 @@
 import pandas as pd
 import numpy as np
 import streamlit as st
+from .gstr2b_json import is_json_upload, read_gstr2b_json
+from .upload_cache import disk_cached
+from .status_codes import Flag, Status, encode_statuses, status_flags
 
 # ────────────────────────────────────────────────────────────
 # HARDCODED COLUMN INDICES
@@ -178,8 +181,12 @@ def _merge(df_b, df_g, key, status, logic,
 # FILE READERS
 # ────────────────────────────────────────────────────────────
 
+@disk_cached('cdnr_2b')
 def read_raw_cdnr_2b(file_obj):
     try:
+        if is_json_upload(file_obj):
+            df = read_gstr2b_json(file_obj, ('cdnr',))['cdnr']
+            return df if not df.empty else None
         file_obj.seek(0)
         xls = pd.ExcelFile(file_obj)
         sheet = None
@@ -195,28 +202,34 @@ def read_raw_cdnr_2b(file_obj):
             return None
 
         raw = pd.read_excel(file_obj, sheet_name=sheet, header=G2B_HEADER_ROW)
-        if raw.shape[1] <= G2B_COL_CESS:
-            return None
-
-        df = pd.DataFrame({
-            'GSTIN'        : raw.iloc[:, G2B_COL_GSTIN].apply(_gstin),
-            'Trade Name'   : raw.iloc[:, G2B_COL_TRADNM].astype(str).str.strip(),
-            'Note Number'  : raw.iloc[:, G2B_COL_NOTENO].astype(str).str.strip(),
-            'Note Type'    : raw.iloc[:, G2B_COL_NOTYPE].apply(_type2b),
-            'Note Date'    : raw.iloc[:, G2B_COL_DATE].apply(_date),
-            'Taxable Value': raw.iloc[:, G2B_COL_TAXVAL].apply(_f),
-            'IGST'         : raw.iloc[:, G2B_COL_IGST].apply(_f),
-            'CGST'         : raw.iloc[:, G2B_COL_CGST].apply(_f),
-            'SGST'         : raw.iloc[:, G2B_COL_SGST].apply(_f),
-            'Cess'         : raw.iloc[:, G2B_COL_CESS].apply(_f),
-        })
-        df = df[df['GSTIN'].str.len() == 15].reset_index(drop=True)
-        return df
+        return cdnr_2b_from_raw(raw)
     except Exception as e:
         st.warning(f'[CDNR-2B Reader] {e}')
         return None
 
 
+def cdnr_2b_from_raw(raw):
+    """Positional 2B CDNR data rows → canonical note frame (None if too narrow)."""
+    if raw.shape[1] <= G2B_COL_CESS:
+        return None
+
+    df = pd.DataFrame({
+        'GSTIN'        : raw.iloc[:, G2B_COL_GSTIN].apply(_gstin),
+        'Trade Name'   : raw.iloc[:, G2B_COL_TRADNM].astype(str).str.strip(),
+        'Note Number'  : raw.iloc[:, G2B_COL_NOTENO].astype(str).str.strip(),
+        'Note Type'    : raw.iloc[:, G2B_COL_NOTYPE].apply(_type2b),
+        'Note Date'    : raw.iloc[:, G2B_COL_DATE].apply(_date),
+        'Taxable Value': raw.iloc[:, G2B_COL_TAXVAL].apply(_f),
+        'IGST'         : raw.iloc[:, G2B_COL_IGST].apply(_f),
+        'CGST'         : raw.iloc[:, G2B_COL_CGST].apply(_f),
+        'SGST'         : raw.iloc[:, G2B_COL_SGST].apply(_f),
+        'Cess'         : raw.iloc[:, G2B_COL_CESS].apply(_f),
+    })
+    df = df[df['GSTIN'].str.len() == 15].reset_index(drop=True)
+    return df
+
+
+@disk_cached('cdnr_books')
 def read_books_cdnr(file_obj):
     try:
         file_obj.seek(0)
@@ -255,8 +268,12 @@ def read_books_cdnr(file_obj):
         return None
 
 
+@disk_cached('cdnra')
 def read_raw_cdnra(file_obj):
     try:
+        if is_json_upload(file_obj):
+            df, orig = read_gstr2b_json(file_obj, ('cdnra',))['cdnra']
+            return (df, orig) if not df.empty else (None, None)
         file_obj.seek(0)
         xls  = pd.ExcelFile(file_obj)
         sheet = next((s for s in xls.sheet_names if 'cdnra' in s.strip().lower()), None)
@@ -452,7 +469,7 @@ def _post_process(df: pd.DataFrame, tmap: dict) -> pd.DataFrame:
         return df
 
     # ── Tax Error flag (identical logic to B2B engine) ─────
-    matched_mask    = df['Recon_Status_CDNR'].str.contains(r'CDNR Matched$', regex=True, na=False)
+    matched_mask    = df['Recon_Status_CDNR'] == Status.CDNR_MATCHED.label
     taxable_ok_mask = abs(_get(df, 'Taxable Value_BOOKS').fillna(0) -
                           _get(df, 'Taxable Value_GST').fillna(0)) < 1.0
     tax_diff_mask   = (
@@ -506,13 +523,14 @@ def _build_summary(df, df_b, df_g, del_n, add_n):
     if df is None or df.empty:
         return {}
     s = df['Recon_Status_CDNR']
+    f = status_flags(s)
     return {
         'total_books'        : len(df_b) if df_b is not None else 0,
         'total_gst'          : len(df_g) if df_g is not None else 0,
-        'matched_count'      : s.str.contains(r'CDNR Matched$',       regex=True, na=False).sum(),
+        'matched_count'      : (s == Status.CDNR_MATCHED.label).sum(),
         'tax_error_count'    : (s == 'CDNR Matched (Tax Error)').sum(),
-        'mismatch_count'     : s.str.contains('Mismatch',             na=False).sum(),
-        'ai_matched_count'   : s.str.contains('AI Matched',           na=False).sum(),
+        'mismatch_count'     : ((f & Flag.MISMATCH) != 0).sum(),
+        'ai_matched_count'   : ((f & Flag.AI) != 0).sum(),
         'not_in_2b_count'    : (s == 'CDNR Not in GSTR-2B').sum(),
         'not_in_books_count' : (s == 'CDNR Not in Books').sum(),
         'net_itc_impact'     : df.get('ITC_Impact', pd.Series(dtype=float)).sum(),
@@ -531,21 +549,23 @@ def _build_summary(df, df_b, df_g, del_n, add_n):
 # PUBLIC ORCHESTRATOR  (called from app.py Tab 6)
 # ────────────────────────────────────────────────────────────
 
-def process_cdnr_reconciliation(file_books, file_gst, tolerance=5.0, smart_mode=False):
+def process_cdnr_reconciliation(file_books, file_gst, tolerance=5.0, smart_mode=False,
+                                df_gst_cdnr=None):
     """
     Full pipeline:
       1. Read Books CDNR (hardcoded indices, header=3)
-      2. Read GSTR-2B CDNR (hardcoded indices, header=5)
+      2. Read GSTR-2B CDNR (hardcoded indices, header=5) — or use `df_gst_cdnr`
+         when the merger already produced the canonical frame
       3. CDNRA amendments — SKIPPED for now (to be added later)
       4. Run 6-step cascade engine
       5. Return (result_df, summary_dict)
     """
     df_b = read_books_cdnr(file_books)
-    df_g = read_raw_cdnr_2b(file_gst)
+    df_g = df_gst_cdnr.copy() if df_gst_cdnr is not None else read_raw_cdnr_2b(file_gst)
 
     # CDNRA disabled — will be enabled in a future release
     del_n = add_n = 0
 
-    result  = run_cdnr_reconciliation(df_b, df_g, tolerance)
+    result  = encode_statuses(run_cdnr_reconciliation(df_b, df_g, tolerance))
     summary = _build_summary(result, df_b, df_g, del_n, add_n)
     return result, summary
@@ -4,6 +4,11 @@ import numpy as np
 import pandas as pd
 import xlsxwriter
 
+from .recon_cube import build_cube
+from .status_codes import Flag, status_flags
+from .xlsx_formats import format_cache
+
+
 def _safe_date(series):
     temp = pd.to_datetime(series, dayfirst=True, errors='coerce')
     return temp.fillna(series)
@@ -57,12 +62,12 @@ SUG_DATE_BK=3; SUG_DATE_GT=13
 
 
 def generate_cdnr_excel(full_df, company_gstin, company_name, fy, period,
-                        b2b_full_df=None):
+                        b2b_full_df=None, cube=None, b2b_cube=None):
     output = io.BytesIO()
     writer = pd.ExcelWriter(output, engine='xlsxwriter', datetime_format='dd/mm/yyyy')
     wb     = writer.book
 
-    def _f(**kw): return wb.add_format(kw)
+    _f = format_cache(wb)
 
     FMT = {
         'orange' : _f(bold=True,bg_color='#ED7D31',border=1,font_color='white',align='center',valign='vcenter',text_wrap=True),
@@ -89,26 +94,15 @@ def generate_cdnr_excel(full_df, company_gstin, company_name, fy, period,
         ws.write(3,4,'Period:',    FMT['bold']); ws.write(3,5,period)
         ws.merge_range(4,0,4,n_cols,title,FMT['banner'])
 
-    def _money(df_s, col):
-        return float(df_s[col].fillna(0).sum()) if col in df_s.columns else 0.0
-
-    def _row8(df_s, use_books=True):
-        sx='_BOOKS' if use_books else '_GST'
-        tv=_money(df_s,'Taxable Value'+sx); ig=_money(df_s,'IGST'+sx)
-        cg=_money(df_s,'CGST'+sx); sg=_money(df_s,'SGST'+sx); tg=ig+cg+sg
-        return [len(df_s),tv,ig,cg,sg,0.0,tg,tv+tg]
-
     # Source totals for grid
-    cdnr_bk_df  = full_df[full_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in full_df.columns else full_df.iloc[0:0]
-    cdnr_gst_df = full_df[full_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in full_df.columns else full_df.iloc[0:0]
-    bk_cdnr  = _row8(cdnr_bk_df,  True)
-    gst_cdnr = _row8(cdnr_gst_df, False)
+    cube = cube or build_cube(full_df, 'Recon_Status_CDNR')
+    bk_cdnr  = cube.row8('books')
+    gst_cdnr = cube.row8('gst')
 
     if b2b_full_df is not None and not b2b_full_df.empty:
-        b2b_bk_df  = b2b_full_df[b2b_full_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in b2b_full_df.columns else b2b_full_df.iloc[0:0]
-        b2b_gst_df = b2b_full_df[b2b_full_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in b2b_full_df.columns else b2b_full_df.iloc[0:0]
-        bk_b2b  = _row8(b2b_bk_df,  True)
-        gst_b2b = _row8(b2b_gst_df, False)
+        b2b_cube = b2b_cube or build_cube(b2b_full_df, 'Recon_Status')
+        bk_b2b  = b2b_cube.row8('books')
+        gst_b2b = b2b_cube.row8('gst')
     else:
         bk_b2b  = [0]*8
         gst_b2b = [0]*8
@@ -253,23 +247,15 @@ def generate_cdnr_excel(full_df, company_gstin, company_name, fy, period,
     ws_sum.write(2,0,'F.Y.:',      FMT['bold']); ws_sum.write(2,1,fy)
     ws_sum.write(3,0,'Period:',    FMT['bold']); ws_sum.write(3,1,period)
 
-    s_col = full_df['Recon_Status_CDNR'] if 'Recon_Status_CDNR' in full_df.columns else pd.Series(dtype=str)
-    def _cs(pat):
-        try:    return full_df[s_col.str.contains(pat,na=False)]
-        except: return full_df.iloc[0:0]
-
-    cdnr_bkdf_s = full_df[full_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in full_df.columns else full_df.iloc[0:0]
-    cdnr_gstdf_s= full_df[full_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in full_df.columns else full_df.iloc[0:0]
-
     kpi_data=[
-        ('Books Notes',     len(cdnr_bkdf_s)),
-        ('Portal Notes',    len(cdnr_gstdf_s)),
-        ('Matched',         len(_cs(r'CDNR Matched$'))),
-        ('Mismatched',      len(_cs('Mismatch'))),
-        ('Not in GSTR-2B',  len(_cs('Not in GSTR-2B'))),
-        ('Not in Books',    len(_cs('Not in Books'))),
-        ('Suggestions',     len(_cs('Suggestion'))),
-        ('AI Matched',      len(_cs('AI Matched'))),
+        ('Books Notes',     cube.count(side='books')),
+        ('Portal Notes',    cube.count(side='gst')),
+        ('Matched',         cube.count(Flag.EXACT)),
+        ('Mismatched',      cube.count(Flag.MISMATCH)),
+        ('Not in GSTR-2B',  cube.count(Flag.NOT_IN_2B)),
+        ('Not in Books',    cube.count(Flag.NOT_IN_BOOKS)),
+        ('Suggestions',     cube.count(Flag.SUGGESTION)),
+        ('AI Matched',      cube.count(Flag.AI)),
     ]
     ws_sum.set_row(4,6)
     ws_sum.merge_range(5,0,5,15,'CDNR Reconciliation — Individual Record View',FBANNER)
@@ -349,14 +335,14 @@ def generate_cdnr_excel(full_df, company_gstin, company_name, fy, period,
     FTOT  = _f(bold=True,bg_color='#1F3864',font_color='white',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
     FTOT_L= _f(bold=True,bg_color='#1F3864',font_color='white',border=1,align='center',valign='vcenter',font_size=9)
     ws_sum.merge_range(tot_r,0,tot_r,5,'TOTALS',FTOT_L)
-    def _cs2(c): return float(full_df[c].fillna(0).sum()) if c in full_df.columns else 0.0
-    for ci,col in enumerate(['Taxable Value_BOOKS','IGST_BOOKS','CGST_BOOKS','SGST_BOOKS'],6):
-        ws_sum.write(tot_r,ci,_cs2(col),FTOT)
+    bk_tot, gst_tot = cube.totals('books'), cube.totals('gst')
+    for ci,v in enumerate(bk_tot[1:5],6):
+        ws_sum.write(tot_r,ci,v,FTOT)
     ws_sum.write(tot_r,10,'',FTOT_L); ws_sum.write(tot_r,11,'',FTOT_L); ws_sum.write(tot_r,12,'',FTOT_L)
-    for ci,col in enumerate(['Taxable Value_GST','IGST_GST','CGST_GST','SGST_GST'],13):
-        ws_sum.write(tot_r,ci,_cs2(col),FTOT)
-    ws_sum.write(tot_r,17,_cs2('Taxable Value_BOOKS')-_cs2('Taxable Value_GST'),FTOT)
-    ws_sum.write(tot_r,18,(_cs2('IGST_BOOKS')+_cs2('CGST_BOOKS')+_cs2('SGST_BOOKS'))-(_cs2('IGST_GST')+_cs2('CGST_GST')+_cs2('SGST_GST')),FTOT)
+    for ci,v in enumerate(gst_tot[1:5],13):
+        ws_sum.write(tot_r,ci,v,FTOT)
+    ws_sum.write(tot_r,17,bk_tot[1]-gst_tot[1],FTOT)
+    ws_sum.write(tot_r,18,bk_tot[6]-gst_tot[6],FTOT)
     ws_sum.write(tot_r,19,f'{total_rows} records',FTOT_L)
     ws_sum.set_row(tot_r,20)
 
@@ -369,15 +355,17 @@ def generate_cdnr_excel(full_df, company_gstin, company_name, fy, period,
     # ── DATA SHEETS ───────────────────────────────────────────────────────────
     # Re-establish s for filtering (s_col used in Reco Summary section above)
     s = full_df['Recon_Status_CDNR'] if 'Recon_Status_CDNR' in full_df.columns else full_df.get('Recon_Status_CDNR', full_df.iloc[:,0].where(False,''))
+    _flags = status_flags(s)
+    def _in(flag): return (_flags & flag) != 0          # integer tests on the status codes
     sheets_cfg=[
         ('All Data',              full_df,                                                 False),
-        ('CDNR Matched',          full_df[s.str.contains(r'CDNR Matched$',regex=True,na=False)], False),
+        ('CDNR Matched',          full_df[_in(Flag.EXACT)],                                False),
         ('CDNR Matched (Tax Error)',full_df[s=='CDNR Matched (Tax Error)'],                False),
-        ('CDNR Mismatch',         full_df[s.str.contains('Mismatch',na=False)],           False),
-        ('CDNR AI Matched',       full_df[s.str.contains('AI Matched',na=False)],         False),
-        ('Not In GSTR-2B',        full_df[s.str.contains('Not in GSTR-2B',na=False)],    False),
-        ('Not In Books',          full_df[s.str.contains('Not in Books',na=False)],       False),
-        ('CDNR Suggestions',      full_df[s.str.contains('Suggestion',na=False)],         True),
+        ('CDNR Mismatch',         full_df[_in(Flag.MISMATCH)],                             False),
+        ('CDNR AI Matched',       full_df[_in(Flag.AI)],                                   False),
+        ('Not In GSTR-2B',        full_df[_in(Flag.NOT_IN_2B)],                            False),
+        ('Not In Books',          full_df[_in(Flag.NOT_IN_BOOKS)],                         False),
+        ('CDNR Suggestions',      full_df[_in(Flag.SUGGESTION)],                           True),
     ]
 
     for sheet_name,df_sub,is_sug in sheets_cfg:
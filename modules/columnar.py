@@ -0,0 +1,209 @@
+# modules/columnar.py  — v1.2
+# DataFrame ⇄ Parquet bytes (zstd) used by the upload cache and result storage.
+#   - pyarrow is optional: callers check arrow_available() and fall back
+#   - Non-string column names (positional B2BA columns) survive the round trip
+#   - Mixed-type object columns (ints + text invoice numbers) are stored as
+#     type-tagged text so every cell comes back as the same Python type
+#   - df.attrs (sheet_name, header_idx …) ride along in the file metadata
+#   - Categorical columns (result statuses) are written as their plain values,
+#     so stored chunks don't depend on the category list
+#   - Row positions can be read directly: only the row groups holding them are
+#     decoded (positions come from an index kept elsewhere, e.g. recon_rows)
+#   - A frame can be cut into fixed-row chunks sharing one schema (byte-identical
+#     for identical rows, so callers can store them content-addressed)
+
+import datetime
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+_META_KEY = b'gst_frame'
+
+
+def arrow_available():
+    return pa is not None
+
+
+def _json_safe(v):
+    if isinstance(v, (str, int, float, bool)) or v is None:
+        return v
+    return str(v)
+
+# ── Mixed object columns: "<tag>:<value>" text ───────────────────────────────
+def _tag(v):
+    if v is None or (isinstance(v, float) and v != v) or v is pd.NaT:
+        return None
+    if isinstance(v, (bool, np.bool_)):
+        return f"b:{int(v)}"
+    if isinstance(v, (int, np.integer)):
+        return f"i:{v}"
+    if isinstance(v, (float, np.floating)):
+        return f"f:{float(v)!r}"
+    if isinstance(v, datetime.datetime):
+        return f"d:{v.isoformat()}"
+    if isinstance(v, datetime.date):
+        return f"D:{v.isoformat()}"
+    if isinstance(v, datetime.time):
+        return f"t:{v.isoformat()}"
+    return f"s:{v}"
+
+def _untag(v):
+    if not isinstance(v, str):
+        return None
+    tag, val = v[0], v[2:]
+    if tag == 's': return val
+    if tag == 'i': return int(val)
+    if tag == 'f': return float(val)
+    if tag == 'b': return val == '1'
+    if tag == 'd': return datetime.datetime.fromisoformat(val)
+    if tag == 'D': return datetime.date.fromisoformat(val)
+    if tag == 't': return datetime.time.fromisoformat(val)
+    return val
+
+def _needs_tagging(series):
+    if series.dtype != object:
+        return False
+    try:
+        inferred = pa.array(series, from_pandas=True).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return True
+    return not (pa.types.is_string(inferred) or pa.types.is_large_string(inferred)
+                or pa.types.is_null(inferred))
+
+
+def _to_table(df):
+    names = list(df.columns)
+    positional = not all(isinstance(n, str) for n in names) or len(set(names)) != len(names)
+    out = df.copy(deep=False)
+    out.columns = [f"c{i}" for i in range(len(names))] if positional else names
+    tagged = []
+    for col in out.columns:
+        if isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype(object)      # stored as plain values (status codes are re-derived on load)
+        if _needs_tagging(out[col]):
+            out[col] = pd.Series([_tag(v) for v in out[col]], index=out.index, dtype=object)
+            tagged.append(col)
+    table = pa.Table.from_pandas(out, preserve_index=False)
+
+    meta = {
+        'columns':    [_json_safe(n) for n in names],
+        'positional': positional,
+        'tagged':     tagged,
+        'attrs':      {k: _json_safe(v) for k, v in df.attrs.items()
+                       if not isinstance(v, (dict, list, pd.DataFrame))},
+    }
+    schema_meta = dict(table.schema.metadata or {})
+    schema_meta[_META_KEY] = json.dumps(meta).encode('utf-8')
+    return table.replace_schema_metadata(schema_meta)
+
+
+def frame_to_parquet(df, row_group_size=None):
+    """Serialises a DataFrame to zstd-compressed Parquet bytes."""
+    buf = io.BytesIO()
+    pq.write_table(_to_table(df), buf, compression='zstd', row_group_size=row_group_size)
+    return buf.getvalue()
+
+
+def frame_to_parquet_chunks(df, rows_per_chunk):
+    """
+    [(parquet_bytes, row_count), …] — consecutive row slices of df, each a
+    standalone Parquet file with the full frame's schema. An empty frame
+    still yields one (empty) chunk so its columns survive.
+    """
+    table = _to_table(df)
+    chunks = []
+    for start in range(0, max(table.num_rows, 1), rows_per_chunk):
+        part = table.slice(start, rows_per_chunk)
+        buf = io.BytesIO()
+        pq.write_table(part, buf, compression='zstd')
+        chunks.append((buf.getvalue(), part.num_rows))
+    return chunks
+
+
+def _frame_meta(schema):
+    raw = (schema.metadata or {}).get(_META_KEY)
+    return json.loads(raw) if raw else {'columns': None, 'positional': False, 'attrs': {}}
+
+def _take_rows(src, rows, columns):
+    """Reads only the row groups containing `rows` (0-based positions), in order."""
+    pf     = pq.ParquetFile(src)
+    sizes  = np.array([pf.metadata.row_group(i).num_rows for i in range(pf.num_row_groups)],
+                      dtype=np.int64)
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+    rows   = np.asarray(rows, dtype=np.int64)
+    rows   = rows[(rows >= 0) & (rows < bounds[-1])]
+    group  = np.searchsorted(bounds, rows, side='right') - 1
+    wanted = np.unique(group)
+    table  = pf.read_row_groups(wanted.tolist(), columns=columns)
+    starts = np.concatenate([[0], np.cumsum(sizes[wanted])[:-1]])
+    local  = rows - bounds[group] + starts[np.searchsorted(wanted, group)]
+    return table.take(pa.array(local, type=pa.int64()))
+
+
+def parquet_to_frame(source, columns=None, filters=None, rows=None):
+    """
+    Reads Parquet bytes (or a path) back into a DataFrame.
+    `columns` / `filters` use the original column names and are pushed down
+    to pyarrow so unneeded column chunks and row groups are never decoded.
+    `rows` restricts the read to those row positions (row groups without any
+    of them are skipped); filters then apply to what is left.
+    """
+    return parquet_chunks_to_frame([(source, rows)], columns=columns, filters=filters)
+
+
+def _read_table(source, columns, filters, rows):
+    src = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    meta = _frame_meta(pq.read_schema(src))
+    if hasattr(src, 'seek'):
+        src.seek(0)
+
+    names = meta.get('columns')
+    to_stored = ({n: f"c{i}" for i, n in enumerate(names)}
+                 if meta.get('positional') and names else {})
+    if columns is not None:
+        columns = [to_stored.get(c, c) for c in columns]
+    if filters is not None:
+        filters = [(to_stored.get(c, c), op, val) for c, op, val in filters]
+
+    if rows is not None:
+        table = _take_rows(src, rows, columns)
+        if filters:
+            table = table.filter(pq.filters_to_expression(filters))
+    else:
+        table = pq.read_table(src, columns=columns, filters=filters)
+    return table, meta, to_stored
+
+
+def parquet_chunks_to_frame(parts, columns=None, filters=None):
+    """
+    Reassembles chunks written by frame_to_parquet_chunks (or single blobs).
+    parts = [(bytes_or_path, rows_or_None), …] in order; arguments as for
+    parquet_to_frame, with `rows` local to each chunk.
+    """
+    read = [_read_table(src, columns, filters, rows) for src, rows in parts]
+    _, meta, to_stored = read[0]
+    table = read[0][0] if len(read) == 1 else pa.concat_tables([t for t, _, _ in read])
+    df = table.to_pandas()
+    for col in meta.get('tagged') or []:
+        if col in df.columns:
+            df[col] = pd.Series([_untag(v) for v in df[col].tolist()], index=df.index, dtype=object)
+    if to_stored:
+        back = {v: k for k, v in to_stored.items()}
+        df.columns = [back.get(c, c) for c in df.columns]
+    df.attrs.update(meta.get('attrs') or {})
+    return df
+
+
+def parquet_columns(source):
+    """Original column names stored in a Parquet blob, without reading data."""
+    src = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    schema = pq.read_schema(src)
+    return _frame_meta(schema).get('columns') or list(schema.names)
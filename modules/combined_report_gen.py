@@ -7,26 +7,17 @@ import numpy as np
 import pandas as pd
 import xlsxwriter
 
+from .recon_cube import build_cube
+from .status_codes import Flag, ISSUE
+from .xlsx_formats import format_cache
+from .xlsx_stream import use_streaming, open_workbook, close_workbook, write_frame, spacer_row
+
 
 def _safe_date(series):
     temp = pd.to_datetime(series, dayfirst=True, errors='coerce')
     return temp.fillna(series)
 
 
-def _money(df_s, col):
-    return float(df_s[col].fillna(0).sum()) if col in df_s.columns else 0.0
-
-
-def _row8(df_s, use_books=True):
-    sx = '_BOOKS' if use_books else '_GST'
-    tv = _money(df_s, 'Taxable Value' + sx)
-    ig = _money(df_s, 'IGST' + sx)
-    cg = _money(df_s, 'CGST' + sx)
-    sg = _money(df_s, 'SGST' + sx)
-    tg = ig + cg + sg
-    return [len(df_s), tv, ig, cg, sg, 0.0, tg, tv + tg]
-
-
 def _vv(val):
     """Safe value — converts NaT/nan/timestamps to safe types for xlsxwriter."""
     if val is None:
@@ -54,9 +45,13 @@ def _nn(val):
         return 0.0
 
 
-def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, period):
+def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, period,
+                            path=None, streaming=None, b2b_cube=None, cdnr_cube=None):
     """
     Generates a single Excel workbook combining B2B + CDNR reconciliation results.
+    Returns xlsx bytes, or writes to `path` and returns it — constant-memory
+    streaming for large runs (see xlsx_stream; streaming=True/False forces it).
+    Totals and KPIs come from the results' ReconCubes (built here if not given).
 
     Sheets:
       1. Executive Summary  — unified B2B + CDNR financial grid
@@ -66,12 +61,10 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
       5. B2B All Data       — full B2B dataset
       6. CDNR All Data      — full CDNR dataset
     """
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter', datetime_format='dd/mm/yyyy')
-    wb = writer.book
+    streaming = use_streaming(len(b2b_df) + len(cdnr_df), path, streaming)
+    wb, writer, target = open_workbook(path, streaming)
 
-    def _f(**kw):
-        return wb.add_format(kw)
+    _f = format_cache(wb)
 
     # ── Shared formats ────────────────────────────────────────────────────────
     FMETA   = _f(bold=True)
@@ -106,11 +99,10 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
         return FDF_PL if v > 0.01 else FDF_NG if v < -0.01 else FDF_ZR
 
     # ── Source totals ─────────────────────────────────────────────────────────
-    b2b_bk = _row8(b2b_df[b2b_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in b2b_df.columns else b2b_df.iloc[0:0])
-    b2b_gt = _row8(b2b_df[b2b_df['Taxable Value_GST'].notna()] if 'Taxable Value_GST' in b2b_df.columns else b2b_df.iloc[0:0], False)
-
-    cdnr_bk = _row8(cdnr_df[cdnr_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in cdnr_df.columns else cdnr_df.iloc[0:0])
-    cdnr_gt = _row8(cdnr_df[cdnr_df['Taxable Value_GST'].notna()] if 'Taxable Value_GST' in cdnr_df.columns else cdnr_df.iloc[0:0], False)
+    b2b_cube  = b2b_cube  or build_cube(b2b_df, 'Recon_Status')
+    cdnr_cube = cdnr_cube or build_cube(cdnr_df)
+    b2b_bk,  b2b_gt  = b2b_cube.row8('books'),  b2b_cube.row8('gst')
+    cdnr_bk, cdnr_gt = cdnr_cube.row8('books'), cdnr_cube.row8('gst')
 
     total_bk = [b2b_bk[i] + cdnr_bk[i] for i in range(8)]
     total_gt = [b2b_gt[i] + cdnr_gt[i] for i in range(8)]
@@ -118,6 +110,35 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
     diff_cdn = [cdnr_gt[i] - cdnr_bk[i] for i in range(8)]
     diff_tot = [total_gt[i] - total_bk[i] for i in range(8)]
 
+    # KPI scorecard on the right
+    _FKPI_T = _f(bold=True, bg_color='#E8EAF6', font_color='#1A237E', border=1,
+                 align='center', valign='vcenter', font_size=9)
+    _FKPI_V = _f(bold=True, bg_color='#F3F4F6', font_color='#111827', border=1,
+                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
+    _FKPI_G = _f(bold=True, bg_color='#ECFDF5', font_color='#065F46', border=1,
+                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
+    _FKPI_R = _f(bold=True, bg_color='#FFF1F2', font_color='#9F1239', border=1,
+                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
+
+    kpis = [
+        ('B2B Matched',          b2b_cube.count(Flag.MATCHED)),
+        ('B2B Not in GSTR-2B',   b2b_cube.count(Flag.NOT_IN_2B)),
+        ('B2B Mismatched',       b2b_cube.count(Flag.MISMATCH)),
+        ('CDNR Matched',         cdnr_cube.count(Flag.EXACT | Flag.TAX_ERROR)),
+        ('CDNR Not in GSTR-2B',  cdnr_cube.count(Flag.NOT_IN_2B)),
+        ('CDNR Mismatched',      cdnr_cube.count(Flag.MISMATCH)),
+    ]
+
+    def _kpi_row(r):
+        # Quick-stats panel (K:M) is written alongside rows 5-11 — rows go out in order
+        if r == 5:
+            ws_ex.merge_range(5, 10, 5, 12, 'QUICK STATS', _FKPI_T)
+        elif 6 <= r < 6 + len(kpis):
+            lbl, val = kpis[r - 6]
+            ws_ex.write(r, 10, lbl, _FKPI_T)
+            fmt = _FKPI_G if 'Matched' in lbl else _FKPI_R
+            ws_ex.write(r, 11, val, fmt)
+
     # ═════════════════════════════════════════════════════════════════════════
     # SHEET 1 — EXECUTIVE SUMMARY
     # ═════════════════════════════════════════════════════════════════════════
@@ -132,30 +153,37 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
     ws_ex.write(2, 0, 'F.Y.:',       FMETA); ws_ex.write(2, 1, fy)
     ws_ex.write(3, 0, 'Period:',     FMETA); ws_ex.write(3, 1, period)
 
-    ws_ex.set_row(4, 6)
+    spacer_row(wb, ws_ex, 4, 6)
     ws_ex.merge_range(5, 0, 5, 8, '  COMBINED RECONCILIATION  (B2B + CDNR)  —  Executive Summary', FBANNER)
     ws_ex.set_row(5, 28)
+    _kpi_row(5)
 
     COL_H = ['', '', 'TAXABLE (₹)', 'IGST (₹)', 'CGST (₹)', 'SGST (₹)', 'CESS (₹)', 'TOTAL TAX (₹)', 'TOTAL (₹)']
     ws_ex.set_row(6, 26)
     for ci, h in enumerate(COL_H):
         ws_ex.write(6, ci, h, FHDR)
+    _kpi_row(6)
 
     # BOOKS section
     ws_ex.set_row(7, 22)
     ws_ex.merge_range(7, 0, 7, 8, '  BOOKS  (Purchase Register)', FSEC_B)
+    _kpi_row(7)
     for row_i, l1, l2, vals in [(8, 'Books', 'B2B', b2b_bk), (9, '', 'CDNR', cdnr_bk)]:
         ws_ex.set_row(row_i, 20)
         ws_ex.write(row_i, 0, l1, FBK_L); ws_ex.write(row_i, 1, l2, FBK_L)
         for ci, v in enumerate(vals[1:], 2):
             ws_ex.write(row_i, ci, v, FBK_V)
+        _kpi_row(row_i)
     ws_ex.set_row(10, 22)
     ws_ex.write(10, 0, 'TOTAL BOOKS', FBK_TL); ws_ex.write(10, 1, '', FBK_TL)
     for ci, v in enumerate(total_bk[1:], 2):
         ws_ex.write(10, ci, v, FBK_TV)
+    _kpi_row(10)
 
     # GSTR-2B section
-    ws_ex.set_row(11, 6); ws_ex.set_row(12, 22)
+    spacer_row(wb, ws_ex, 11, 6)
+    _kpi_row(11)
+    ws_ex.set_row(12, 22)
     ws_ex.merge_range(12, 0, 12, 8, '  GSTR-2B  (Portal Data)', FSEC_G)
     for row_i, l1, l2, vals, is_na in [
             (13, 'GSTR-2B', 'B2B',  b2b_gt,  False),
@@ -173,7 +201,7 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
         ws_ex.write(17, ci, v, FGT_TV)
 
     # DIFFERENCE section
-    ws_ex.set_row(18, 6); ws_ex.set_row(19, 22)
+    spacer_row(wb, ws_ex, 18, 6); ws_ex.set_row(19, 22)
     ws_ex.merge_range(19, 0, 19, 8, '  DIFFERENCE  (GSTR-2B  −  Books)', FSEC_D)
     for row_i, l1, l2, vals in [
             (20, 'Diff', 'B2B',  diff_b2b),
@@ -183,43 +211,12 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
         ws_ex.write(row_i, 0, l1, FDF_L); ws_ex.write(row_i, 1, l2, FDF_L)
         for ci, v in enumerate(vals[1:], 2):
             ws_ex.write(row_i, ci, v, dfmt(v))
-    ws_ex.set_row(23, 6); ws_ex.set_row(24, 28)
+    spacer_row(wb, ws_ex, 23, 6); ws_ex.set_row(24, 28)
     ws_ex.merge_range(24, 0, 24, 8,
         '🔴 Red = GSTR-2B < Books (ITC at risk)   '
         '🟢 Green = GSTR-2B > Books (supplier reported more)   '
         '⬜ Yellow = No difference', FNOTE)
 
-    # KPI scorecard on the right
-    _FKPI_T = _f(bold=True, bg_color='#E8EAF6', font_color='#1A237E', border=1,
-                 align='center', valign='vcenter', font_size=9)
-    _FKPI_V = _f(bold=True, bg_color='#F3F4F6', font_color='#111827', border=1,
-                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
-    _FKPI_G = _f(bold=True, bg_color='#ECFDF5', font_color='#065F46', border=1,
-                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
-    _FKPI_R = _f(bold=True, bg_color='#FFF1F2', font_color='#9F1239', border=1,
-                 align='right', valign='vcenter', font_size=11, num_format='#,##0')
-
-    def _cnt(df, pat, col='Recon_Status'):
-        try:    return int(df[df[col].str.contains(pat, na=False)][col].count())
-        except: return 0
-
-    b2b_st = b2b_df.get('Recon_Status', pd.Series(dtype=str)) if 'Recon_Status' in b2b_df.columns else pd.Series(dtype=str)
-    cdnr_st_col = 'Recon_Status_CDNR' if 'Recon_Status_CDNR' in cdnr_df.columns else 'Recon_Status'
-
-    kpis = [
-        ('B2B Matched',          _cnt(b2b_df, r'Matched')),
-        ('B2B Not in GSTR-2B',   _cnt(b2b_df, 'Not in GSTR-2B')),
-        ('B2B Mismatched',       _cnt(b2b_df, 'Mismatch')),
-        ('CDNR Matched',         _cnt(cdnr_df, r'CDNR Matched', cdnr_st_col)),
-        ('CDNR Not in GSTR-2B',  _cnt(cdnr_df, 'Not in GSTR-2B', cdnr_st_col)),
-        ('CDNR Mismatched',      _cnt(cdnr_df, 'Mismatch', cdnr_st_col)),
-    ]
-    ws_ex.merge_range(5, 10, 5, 12, 'QUICK STATS', _FKPI_T)
-    for ki, (lbl, val) in enumerate(kpis):
-        r = 6 + ki
-        ws_ex.write(r, 10, lbl, _FKPI_T)
-        fmt = _FKPI_G if 'Matched' in lbl else _FKPI_R
-        ws_ex.write(r, 11, val, fmt)
     ws_ex.set_column(10, 10, 22); ws_ex.set_column(11, 11, 10)
 
     # ═════════════════════════════════════════════════════════════════════════
@@ -229,7 +226,8 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
                             company_gstin, company_name, fy, period,
                             id_col='Recon_Status', note_col='Invoice',
                             bk_inv='Invoice Number_BOOKS', bk_date='Invoice Date_BOOKS',
-                            gt_inv='Invoice Number_GST',  gt_date='Invoice Date_GST')
+                            gt_inv='Invoice Number_GST',  gt_date='Invoice Date_GST',
+                            cube=b2b_cube)
 
     # ═════════════════════════════════════════════════════════════════════════
     # SHEET 3 — CDNR Individual Records
@@ -238,13 +236,15 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
                             company_gstin, company_name, fy, period,
                             id_col='Recon_Status_CDNR', note_col='Note',
                             bk_inv='Note Number_BOOKS', bk_date='Note Date_BOOKS',
-                            gt_inv='Note Number_GST',  gt_date='Note Date_GST')
+                            gt_inv='Note Number_GST',  gt_date='Note Date_GST',
+                            cube=cdnr_cube)
 
     # ═════════════════════════════════════════════════════════════════════════
     # SHEET 4 — Combined Issues (all non-Matched rows from both modules)
     # ═════════════════════════════════════════════════════════════════════════
     _write_combined_issues(wb, writer, b2b_df, cdnr_df,
-                           company_gstin, company_name, fy, period)
+                           company_gstin, company_name, fy, period,
+                           b2b_cube, cdnr_cube)
 
     # ═════════════════════════════════════════════════════════════════════════
     # SHEET 5 — B2B All Data (raw)
@@ -253,7 +253,7 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
     for dc in ['Invoice Date_BOOKS', 'Invoice Date_GST']:
         if dc in b2b_export.columns:
             b2b_export[dc] = _safe_date(b2b_export[dc])
-    b2b_export.to_excel(writer, sheet_name='B2B All Data', index=False)
+    write_frame(wb, writer, b2b_export, 'B2B All Data')
 
     # ═════════════════════════════════════════════════════════════════════════
     # SHEET 6 — CDNR All Data (raw)
@@ -262,10 +262,9 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
     for dc in ['Note Date_BOOKS', 'Note Date_GST']:
         if dc in cdnr_export.columns:
             cdnr_export[dc] = _safe_date(cdnr_export[dc])
-    cdnr_export.to_excel(writer, sheet_name='CDNR All Data', index=False)
+    write_frame(wb, writer, cdnr_export, 'CDNR All Data')
 
-    writer.close()
-    return output.getvalue()
+    return close_workbook(wb, writer, target)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -275,10 +274,10 @@ def generate_combined_excel(b2b_df, cdnr_df, company_gstin, company_name, fy, pe
 def _write_individual_sheet(wb, writer, df, sheet_name,
                              gstin, name, fy, period,
                              id_col, note_col,
-                             bk_inv, bk_date, gt_inv, gt_date):
-    """Write a side-by-side Books vs Portal individual record sheet."""
+                             bk_inv, bk_date, gt_inv, gt_date, cube):
+    """Write a side-by-side Books vs Portal individual record sheet (totals from cube)."""
     ws = wb.add_worksheet(sheet_name)
-    def _f(**kw): return wb.add_format(kw)
+    _f = format_cache(wb)
 
     FBANNER = _f(bold=True, bg_color='#1A237E', font_color='white', border=1,
                  align='center', valign='vcenter', font_size=12)
@@ -318,10 +317,10 @@ def _write_individual_sheet(wb, writer, df, sheet_name,
     ws.write(2, 0, 'F.Y.:',       FMETA); ws.write(2, 1, fy)
     ws.write(3, 0, 'Period:',     FMETA); ws.write(3, 1, period)
 
-    ws.set_row(4, 6)
+    spacer_row(wb, ws, 4, 6)
     ws.merge_range(5, 0, 5, 17, f'  {sheet_name}  —  Individual Record View', FBANNER)
     ws.set_row(5, 26)
-    ws.set_row(7, 6)
+    spacer_row(wb, ws, 7, 6)
     ws.set_row(8, 18)
     ws.write(8, 0, '#', FHDR)
     ws.merge_range(8, 1, 8, 2, 'PARTY', FGRP_ST)
@@ -409,14 +408,14 @@ def _write_individual_sheet(wb, writer, df, sheet_name,
     total_rows = len(df_sorted)
     tot_r = data_start + total_rows
     ws.merge_range(tot_r, 0, tot_r, 4, 'TOTALS', FTOT_L)
-    def _cs(c): return float(df[c].fillna(0).sum()) if c in df.columns else 0.0
-    for ci, col in enumerate(['Taxable Value_BOOKS', 'IGST_BOOKS', 'CGST_BOOKS', 'SGST_BOOKS'], 5):
-        ws.write(tot_r, ci, _cs(col), FTOT)
+    bk_tot, gt_tot = cube.totals('books'), cube.totals('gst')
+    for ci, v in enumerate(bk_tot[1:5], 5):
+        ws.write(tot_r, ci, v, FTOT)
     ws.write(tot_r, 9, '', FTOT_L); ws.write(tot_r, 10, '', FTOT_L)
-    for ci, col in enumerate(['Taxable Value_GST', 'IGST_GST', 'CGST_GST', 'SGST_GST'], 11):
-        ws.write(tot_r, ci, _cs(col), FTOT)
-    ws.write(tot_r, 15, _cs('Taxable Value_BOOKS') - _cs('Taxable Value_GST'), FTOT)
-    gst_diff = (_cs('IGST_BOOKS')+_cs('CGST_BOOKS')+_cs('SGST_BOOKS')) - (_cs('IGST_GST')+_cs('CGST_GST')+_cs('SGST_GST'))
+    for ci, v in enumerate(gt_tot[1:5], 11):
+        ws.write(tot_r, ci, v, FTOT)
+    ws.write(tot_r, 15, bk_tot[1] - gt_tot[1], FTOT)
+    gst_diff = bk_tot[6] - gt_tot[6]
     ws.write(tot_r, 16, gst_diff, FTOT)
     ws.write(tot_r, 17, f'{total_rows} records', FTOT_L)
     ws.write(tot_r, 18, '', FTOT_L)
@@ -429,10 +428,11 @@ def _write_individual_sheet(wb, writer, df, sheet_name,
     ws.set_column(15, 16, 14); ws.set_column(17, 17, 26); ws.set_column(18, 18, 12)
 
 
-def _write_combined_issues(wb, writer, b2b_df, cdnr_df, gstin, name, fy, period):
+def _write_combined_issues(wb, writer, b2b_df, cdnr_df, gstin, name, fy, period,
+                           b2b_cube, cdnr_cube):
     """Combined issues sheet — only non-matched records from both modules."""
     ws = wb.add_worksheet('Combined Issues')
-    def _f(**kw): return wb.add_format(kw)
+    _f = format_cache(wb)
 
     FBANNER = _f(bold=True, bg_color='#7B1FA2', font_color='white', border=1,
                  align='center', valign='vcenter', font_size=12)
@@ -465,7 +465,7 @@ def _write_combined_issues(wb, writer, b2b_df, cdnr_df, gstin, name, fy, period)
     ws.write(2, 0, 'F.Y.:',       FMETA); ws.write(2, 1, fy)
     ws.write(3, 0, 'Period:',     FMETA); ws.write(3, 1, period)
 
-    ws.set_row(4, 6)
+    spacer_row(wb, ws, 4, 6)
     ws.merge_range(5, 0, 5, 17, '  COMBINED ISSUES  —  All Unresolved Items (B2B + CDNR)', FBANNER)
     ws.set_row(5, 26)
 
@@ -479,10 +479,9 @@ def _write_combined_issues(wb, writer, b2b_df, cdnr_df, gstin, name, fy, period)
     ws.freeze_panes(8, 3)
 
     # Filter only issues — show ALL issue types from both B2B and CDNR
-    ISSUE_MASK = 'Not in|Mismatch|Suggestion|Manual|Tax Error'
     rows_out = []
     if 'Recon_Status' in b2b_df.columns:
-        b2b_issues = b2b_df[b2b_df['Recon_Status'].str.contains(ISSUE_MASK, na=False)].copy()
+        b2b_issues = b2b_df[b2b_df['Recon_Status'].isin(b2b_cube.statuses(ISSUE))].copy()
         b2b_issues['_module'] = 'B2B'
         b2b_issues['_id_col'] = b2b_issues['Recon_Status']
         b2b_issues['_inv_b']  = b2b_issues.get('Invoice Number_BOOKS', '')
@@ -493,7 +492,7 @@ def _write_combined_issues(wb, writer, b2b_df, cdnr_df, gstin, name, fy, period)
 
     cdnr_st_col = 'Recon_Status_CDNR' if 'Recon_Status_CDNR' in cdnr_df.columns else 'Recon_Status'
     if cdnr_st_col in cdnr_df.columns:
-        cdnr_issues = cdnr_df[cdnr_df[cdnr_st_col].str.contains(ISSUE_MASK, na=False)].copy()
+        cdnr_issues = cdnr_df[cdnr_df[cdnr_st_col].isin(cdnr_cube.statuses(ISSUE))].copy()
         cdnr_issues['_module'] = 'CDNR'
         cdnr_issues['_id_col'] = cdnr_issues[cdnr_st_col]
         cdnr_issues['_inv_b']  = cdnr_issues.get('Note Number_BOOKS', '')
@@ -8,6 +8,7 @@ import streamlit as st
 import re
 from .data_utils import clean_currency
 from .data_cleaner import process_dataset
+from .status_codes import Flag, encode_statuses, has_flag
 
 # --- HELPERS ---
 def smart_invoice_clean(val):
@@ -325,7 +326,7 @@ def run_reconciliation(df_books, df_gst, tolerance, manual_pairs, smart_mode_ena
     final_df = pd.concat(results, ignore_index=True)
 
     # POST-PROCESSING
-    mask_match      = final_df['Recon_Status'].str.contains('Matched', na=False)
+    mask_match      = has_flag(final_df['Recon_Status'], Flag.MATCHED)
     mask_taxable_ok = abs(final_df['Taxable Value_BOOKS'].fillna(0) - final_df['Taxable Value_GST'].fillna(0)) < 1.0
     mask_tax_diff   = (
         (abs(final_df['IGST_BOOKS'].fillna(0) - final_df['IGST_GST'].fillna(0)) > 1.0) |
@@ -346,6 +347,7 @@ def run_reconciliation(df_books, df_gst, tolerance, manual_pairs, smart_mode_ena
 
     drop_cols = ['K1','K2','K3','K4','K5a','K5b','K5c','Diff','dedup_id','Num_Inv_BOOKS','Num_Inv_GST']
     final_df.drop(columns=[c for c in drop_cols if c in final_df.columns], inplace=True)
+    encode_statuses(final_df)
 
     progress_bar.progress(100, text="Done!")
     return final_df, df_books, df_gst
@@ -1,7 +1,14 @@
 # modules/data_utils.py
 import pandas as pd
 import re
+import hashlib
+import itertools
 import streamlit as st
+from .sheet_reader import (list_sheets, read_sheet, read_csv_sheet, is_csv_upload,
+                           iter_sheet_rows, read_rows_with_header)
+from .gstr2b_json import is_json_upload, read_gstr2b_json, read_gstr2b_meta
+from .upload_cache import disk_cached
+from .db_handler import get_layout_profiles
 
 def standardize_invoice_numbers(df, col_name):
     """
@@ -43,8 +50,10 @@ def find_sheet_by_keyword(xls, keywords, exclude_keywords=None):
     """
     Finds a sheet matching keywords but STRICTLY SKIPS those matching exclude_keywords.
     This prevents 'B2B-CDNR' from being matched when looking for 'B2B'.
+    `xls` may be a pd.ExcelFile or a plain list of sheet names.
     """
     if exclude_keywords is None: exclude_keywords = []
+    sheet_names = getattr(xls, 'sheet_names', xls)
     
     # Normalize keywords for case-insensitive matching
     keywords = [k.lower() for k in keywords]
@@ -52,7 +61,7 @@ def find_sheet_by_keyword(xls, keywords, exclude_keywords=None):
     
     found_sheet = None
     
-    for sheet in xls.sheet_names:
+    for sheet in sheet_names:
         sheet_lower = sheet.lower()
         
         # 1. Check Exclusion: If sheet name contains ANY excluded keyword, SKIP IT.
@@ -67,9 +76,14 @@ def find_sheet_by_keyword(xls, keywords, exclude_keywords=None):
             found_sheet = sheet # Keep looking for a better match, but save this one
             
     # Return the best match found, or the first sheet as a fallback (risky but standard)
-    return found_sheet if found_sheet else xls.sheet_names[0]
+    return found_sheet if found_sheet else sheet_names[0]
 
 def extract_meta_from_readme(file):
+    if is_json_upload(file):
+        meta = read_gstr2b_meta(file)
+        return meta.get('fy'), meta.get('period'), meta.get('gstin'), None
+    if is_csv_upload(file):
+        return None, None, None, None   # CSV exports carry no 'Read me' sheet
     try:
         xls = pd.ExcelFile(file)
         if 'Read me' in xls.sheet_names:
@@ -101,59 +115,97 @@ def extract_meta_from_readme(file):
     return None, None, None, None
 
 @st.cache_data
+@disk_cached('preview')
 def load_data_preview(file):
+    """
+    Locates the B2B / register sheet and streams it in a single pass
+    (see sheet_reader): header detection, NIC two-row header merge and
+    column-wise frame build all happen while the rows are read.
+    CSV uploads take the chunked CSV path with the same header rules;
+    GSTR-2B JSON downloads are flattened by gstr2b_json.
+    Layouts confirmed in an earlier run (layout_profiles) skip sheet and
+    header detection; df.attrs['layout_fp'] identifies the layout.
+    """
     try:
-        xls = pd.ExcelFile(file)
-        
+        if is_json_upload(file):
+            df = read_gstr2b_json(file, ('b2b',))['b2b']
+            return finish_preview(df, None, 0, ['<json>'])
+
+        if is_csv_upload(file):
+            # Tally / Busy CSV export — chunked path, same header heuristics
+            df, header_idx = read_csv_sheet(file)
+            return finish_preview(df, None, header_idx, ['<csv>'])
+
+        sheet_names = list_sheets(file)
+
+        known = _known_layout(file, sheet_names)
+        if known:
+            sheet_name, header_idx = known
+            df, header_idx = read_sheet(file, sheet_name, header_idx=header_idx)
+            file.seek(0)
+            return finish_preview(df, sheet_name, header_idx, sheet_names)
+
         # --- KEY FIX: EXCLUDE 'CDNR' TO PREVENT FALSE POSITIVE ---
         # This tells the loader: Find 'B2B' but DO NOT touch anything with 'CDNR'
         sheet_name = find_sheet_by_keyword(
-            xls, 
+            sheet_names, 
             ['b2b', 'sales', 'purchase'], 
             exclude_keywords=['cdnr', 'credit', 'debit', 'cdnra'] 
         )
         # ---------------------------------------------------------
-        
-        df_scan = pd.read_excel(file, sheet_name=sheet_name, header=None, nrows=25)
-        header_idx = 0
-        found = False
-        for idx, row in df_scan.iterrows():
-            row_str = " ".join([str(x).lower() for x in row.values])
-            if 'invoice number' in row_str or 'invoice no' in row_str:
-                header_idx = idx
-                found = True
-                break
-        if not found:
-             for idx, row in df_scan.iterrows():
-                row_str = " ".join([str(x).lower() for x in row.values])
-                if 'gstin' in row_str and 'date' in row_str:
-                    header_idx = idx
-                    break
+
+        df, header_idx = read_sheet(file, sheet_name)
         file.seek(0)
-        df = pd.read_excel(file, sheet_name=sheet_name, header=header_idx)
-        if header_idx > 0:
-            row_above = df_scan.iloc[header_idx - 1]
-            new_columns = []
-            for i, col in enumerate(df.columns):
-                if "Unnamed" in str(col) or pd.isna(col) or str(col).strip() == "":
-                    val_above = row_above[i]
-                    if pd.notna(val_above) and str(val_above).strip() != "":
-                        new_columns.append(str(val_above).strip())
-                    else:
-                        new_columns.append(col)
-                else:
-                    new_columns.append(col)
-            df.columns = new_columns
-        rename_map = {}
-        for c in df.columns:
-            if "GSTIN" in str(c) and "supplier" in str(c).lower(): rename_map[c] = "GSTIN"
-            if "Trade" in str(c) and "Legal" in str(c): rename_map[c] = "Name of Party"
-        df.rename(columns=rename_map, inplace=True)
-        return df
+        return finish_preview(df, sheet_name, header_idx, sheet_names)
     except Exception as e:
         st.error(f"Error loading file: {e}")
         return None
 
+def finish_preview(df, sheet_name, header_idx, sheet_names=None):
+    df.attrs['sheet_sig'] = sheet_signature(sheet_names or [])
+    df.attrs['layout_fp'] = layout_fingerprint(sheet_names or [], sheet_name, header_idx, df.columns)
+    rename_map = {}
+    for c in df.columns:
+        if "GSTIN" in str(c) and "supplier" in str(c).lower(): rename_map[c] = "GSTIN"
+        if "Trade" in str(c) and "Legal" in str(c): rename_map[c] = "Name of Party"
+    df.rename(columns=rename_map, inplace=True)
+    df.attrs['sheet_name'] = sheet_name
+    df.attrs['header_idx'] = header_idx
+    return df
+
+# ────────────────────────────────────────────────────────────
+# LAYOUT FINGERPRINTS  (sheet names + header row → remembered mapping)
+# ────────────────────────────────────────────────────────────
+
+def sheet_signature(sheet_names):
+    return hashlib.sha1("\x1f".join(s.strip().lower() for s in sheet_names).encode()).hexdigest()
+
+def layout_fingerprint(sheet_names, sheet_name, header_idx, columns):
+    """Same ERP export → same sheet list, sheet, header row and header text."""
+    parts = [sheet_signature(sheet_names), str(sheet_name), str(header_idx)]
+    parts += [str(c).strip().lower() for c in columns]
+    return hashlib.sha1("\x1e".join(parts).encode()).hexdigest()
+
+def _known_layout(file, sheet_names):
+    """
+    (sheet, header_idx) of a previously confirmed layout whose header row
+    still matches this upload — verified on the header rows only.
+    """
+    try:
+        profiles = get_layout_profiles(sheet_signature(sheet_names))
+    except Exception:
+        return None
+    for prof in profiles:
+        sheet_name, header_idx = prof['sheet_name'], prof['header_idx']
+        if sheet_name not in sheet_names:
+            continue
+        head = itertools.islice(iter_sheet_rows(file, sheet_name), header_idx + 1)
+        df_head, _ = read_rows_with_header(head, header_idx=header_idx)
+        file.seek(0)
+        if layout_fingerprint(sheet_names, sheet_name, header_idx, df_head.columns) == prof['fingerprint']:
+            return sheet_name, header_idx
+    return None
+
 def find_best_match(col_name, candidates, fixed_map=None):
     if fixed_map and col_name in fixed_map:
         target = fixed_map[col_name]
@@ -164,4 +216,4 @@ def find_best_match(col_name, candidates, fixed_map=None):
         if str(c).strip().lower() == col_lower: return c
     for c in candidates:
         if col_lower in str(c).strip().lower(): return c
-    return None
\ No newline at end of file
+    return None
\ No newline at end of file
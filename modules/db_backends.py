@@ -0,0 +1,311 @@
+# modules/db_backends.py  — v1.0
+# Storage backends behind db_handler's connection layer
+#   - SQLiteBackend (default): the local recon_history.db, tuned as before
+#     (WAL, synchronous=NORMAL, mmap, large page cache, busy timeout); one
+#     process-wide connection, checked out under a lock
+#   - PostgresBackend: a shared server database for multi-desk offices, picked
+#     when GST_DB_URL is a postgres:// / postgresql:// URL. Needs psycopg 3
+#     (optional — `pip install "psycopg[binary]" psycopg-pool`); connections
+#     are checked out of a pool (GST_DB_POOL_SIZE, default 10) per read /
+#     transaction and returned on exit, result rows are bulk
+#     loaded with COPY, and rollups / dashboards aggregate on the server
+#   - db_handler keeps writing SQLite-flavoured SQL: the Postgres connection
+#     wrapper maps ? placeholders to %s and SQLite column types to Postgres
+#     ones in CREATE / ALTER TABLE, so both backends share one schema
+
+import os
+import re
+import sqlite3
+import threading
+import warnings
+from contextlib import contextmanager
+
+try:
+    import psycopg
+    from psycopg.types.numeric import FloatLoader
+except ImportError:
+    psycopg = None
+
+try:
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    ConnectionPool = None
+
+
+def postgres_available():
+    return psycopg is not None
+
+
+def open_backend(target):
+    """Backend for a SQLite file path or a postgres:// URL."""
+    if re.match(r'postgres(ql)?://', str(target or '')):
+        return PostgresBackend(target)
+    return SQLiteBackend(target)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SQLITE
+# ══════════════════════════════════════════════════════════════════════════════
+
+class SQLiteBackend:
+    name = 'sqlite'
+    OperationalError = sqlite3.OperationalError
+    instr = 'instr'         # case-sensitive substring position
+    ilike = 'LIKE'          # case-insensitive (ASCII) LIKE
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA mmap_size=268435456",      # 256 MB
+        "PRAGMA cache_size=-65536",        # 64 MB
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA busy_timeout=30000",
+    )
+
+    def __init__(self, path):
+        self.target = path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def describe(self):
+        return self.target
+
+    @contextmanager
+    def connection(self):
+        """The shared connection, held exclusively for the block (opened and tuned on first use)."""
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.target, timeout=30, cached_statements=256,
+                                       check_same_thread=False)
+                for pragma in self.PRAGMAS:
+                    conn.execute(pragma)
+                self._conn = conn
+            try:
+                yield self._conn
+            finally:
+                if self._conn.in_transaction:       # never hand back an open transaction
+                    self._conn.rollback()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def begin(self, conn):
+        pass                        # sqlite3 opens the transaction on the first write
+
+    def table_columns(self, conn, table):
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def insert_returning_id(self, conn, sql, params):
+        return conn.execute(sql, params).lastrowid
+
+    def bulk_insert(self, conn, table, columns, rows):
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            rows)
+
+    def size_bytes(self, conn=None):
+        """Main file + WAL on disk."""
+        return sum(os.path.getsize(p) for p in (self.target, self.target + "-wal")
+                   if os.path.exists(p))
+
+    def free_pages(self, conn):
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# POSTGRESQL
+# ══════════════════════════════════════════════════════════════════════════════
+
+# SQLite column types → Postgres (money in paise and summed counts need 64 bits)
+_PG_TYPES = [
+    (re.compile(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', re.I), 'BIGSERIAL PRIMARY KEY'),
+    (re.compile(r'\bINTEGER\b', re.I),  'BIGINT'),
+    (re.compile(r'\bREAL\b', re.I),     'DOUBLE PRECISION'),
+    (re.compile(r'\bBLOB\b', re.I),     'BYTEA'),
+    (re.compile(r'\bDATETIME\b', re.I), 'TEXT'),     # ISO strings, as stored by SQLite
+]
+_DDL_RE    = re.compile(r'\s*(CREATE\s+TABLE|ALTER\s+TABLE)\b', re.I)
+_QUOTED_RE = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+
+def to_pg_sql(sql):
+    """SQLite-flavoured SQL → psycopg: ? → %s outside quotes, % → %%, column types in DDL."""
+    if _DDL_RE.match(sql):
+        for pattern, repl in _PG_TYPES:
+            sql = pattern.sub(repl, sql)
+    parts = _QUOTED_RE.split(sql)
+    return ''.join(p.replace('%', '%%') if i % 2 else p.replace('%', '%%').replace('?', '%s')
+                   for i, p in enumerate(parts))
+
+
+class _PgCursor:
+    """sqlite3-style cursor over a psycopg cursor."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        self._cur.execute(to_pg_sql(sql), tuple(params) if params is not None else ())
+        return self
+
+    def executemany(self, sql, seq):
+        self._cur.executemany(to_pg_sql(sql), [tuple(p) for p in seq])
+        return self
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cur.fetchmany(size) if size else self._cur.fetchmany()
+
+    def __iter__(self):
+        return iter(self._cur.fetchall() if self._cur.description else [])
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+class _PgConnection:
+    """
+    sqlite3-style connection over a pooled psycopg connection. Autocommit
+    outside db_handler.transaction() so idle sessions hold no locks; begin()
+    switches to an explicit transaction until commit() / rollback().
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def cursor(self):
+        return _PgCursor(self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def begin(self):
+        if self.raw.autocommit:
+            self.raw.autocommit = False
+
+    def commit(self):
+        if not self.raw.autocommit:
+            self.raw.commit()
+            self.raw.autocommit = True
+
+    def rollback(self):
+        if not self.raw.autocommit:
+            self.raw.rollback()
+            self.raw.autocommit = True
+
+    def close(self):
+        self.raw.close()
+
+
+class PostgresBackend:
+    name = 'postgres'
+    instr = 'strpos'
+    ilike = 'ILIKE'
+
+    def __init__(self, url):
+        if psycopg is None:
+            raise RuntimeError("GST_DB_URL points at PostgreSQL but psycopg is not installed "
+                               "(pip install \"psycopg[binary]\" psycopg-pool)")
+        self.target = url
+        self.OperationalError = psycopg.OperationalError
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # pandas warns on every read_sql through a plain DB-API connection
+        warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy',
+                                category=UserWarning)
+
+    def describe(self):
+        return re.sub(r'//[^@/]*@', '//', self.target)      # no credentials on screen
+
+    @staticmethod
+    def _configure(raw):
+        # SUM / AVG over BIGINT come back as NUMERIC — load as float like SQLite does
+        raw.adapters.register_loader("numeric", FloatLoader)
+        raw.autocommit = True
+
+    @contextmanager
+    def connection(self):
+        """A pooled connection for the block, rolled back if left mid-transaction and returned on exit."""
+        if ConnectionPool is None:
+            raw = psycopg.connect(self.target)
+            self._configure(raw)
+            try:
+                yield _PgConnection(raw)
+            finally:
+                raw.close()
+            return
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        self.target, min_size=1,
+                        max_size=int(os.environ.get("GST_DB_POOL_SIZE", 10)),
+                        configure=self._configure, open=True)
+        with self._pool.connection() as raw:
+            conn = _PgConnection(raw)
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def begin(self, conn):
+        conn.begin()
+
+    def table_columns(self, conn, table):
+        return [r[0] for r in conn.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ?", (table,)).fetchall()]
+
+    def insert_returning_id(self, conn, sql, params):
+        return conn.execute(sql + " RETURNING id", params).fetchone()[0]
+
+    def bulk_insert(self, conn, table, columns, rows):
+        with conn.raw.cursor() as cur:
+            with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def size_bytes(self, conn):
+        return conn.execute("SELECT pg_database_size(current_database())").fetchone()[0]
+
+    def free_pages(self, conn):
+        return 0                    # autovacuum manages free space server-side
+
+    def create_trigram_index(self, conn, table, columns):
+        """pg_trgm GIN indexes so substring search (ILIKE) is indexed. False if unavailable."""
+        conn.execute("SAVEPOINT trgm")
+        try:
+            conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for col in columns:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{col}_trgm "
+                             f"ON {table} USING gin ({col} gin_trgm_ops)")
+        except psycopg.Error:
+            conn.execute("ROLLBACK TO SAVEPOINT trgm")
+            return False
+        conn.execute("RELEASE SAVEPOINT trgm")
+        return True
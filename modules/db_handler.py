@@ -1,19 +1,279 @@
-# modules/db_handler.py  — v4.0
+# modules/db_handler.py  — v4.2
 # Architecture improvements:
 #   - Stores CDNR results alongside B2B in the same history record
 #   - Adds audit_log table for traceability
 #   - Auto-migrates existing DB (adds columns without breaking old data)
+#   - Result frames are stored as content-addressed zstd Parquet chunks
+#     (result_chunks + per-run history_chunks); re-saves write only changed
+#     chunks. Legacy JSON / single-blob rows are converted when first opened
+#   - Connections are checked out per read / transaction() and handed back on
+#     exit (SQLite: one process-wide connection behind a lock; Postgres: the
+#     pool); writes go through transaction() so a burst of inserts commits
+#     once instead of fsync-ing per row
+#   - recon_rows: one typed row per reconciled invoice (money in integer paise),
+#     indexed for cross-period questions without opening any result blob.
+#     Runs saved before it existed are indexed once by init_db (db_meta flag)
+#   - client_summary: latest run per client, kept current by save / CDNR save /
+#     delete in the same transaction, so the multi-client dashboard is one SELECT
+#   - vendor_rollups: per-run issue counts / ITC value by supplier GSTIN, so
+#     MoM / QoQ / annual comparisons never open a result blob
+#   - load_reconciliation_filtered: status / GSTIN / column pushdown into the
+#     Parquet chunks (row positions from recon_rows pick the chunks to read)
+#   - Audit-log / follow-up writes are queued to a background writer that
+#     commits them in batches (executemany); readers wait for it first. Failed
+#     events are logged and handed back by flush_writes()
+#   - invoice_search: FTS5 (trigram) index over invoice numbers / GSTINs /
+#     party names of every saved run, kept in step with recon_rows
+#   - Storage backend is pluggable (db_backends): the local SQLite file by
+#     default, or a shared PostgreSQL server when GST_DB_URL is set. SQL here
+#     stays portable (ON CONFLICT upserts, no INSERT OR REPLACE / lastrowid)
 
 import sqlite3
+import threading
+import queue
+import atexit
+import itertools
+import logging
+import os
+from contextlib import contextmanager
 import pandas as pd
 import json
+import re
 import datetime
+import hashlib
 import io
 import numpy as np
 
+from .columnar import (arrow_available, frame_to_parquet_chunks, parquet_chunks_to_frame,
+                       parquet_columns)
+from .db_backends import open_backend
+from .recon_cube import build_cube
+from .status_codes import Flag, ISSUE_MARKERS, encode_statuses
+
 DB_NAME = "recon_history.db"
 
 
+# ── Connection layer ────────────────────────────────────────────────────────
+# Streamlit reruns the script (and st.fragment polls) on fresh worker threads,
+# so nothing is pinned to a thread: every read / transaction() checks a
+# connection out of the backend and hands it back on exit — SQLite shares one
+# process-wide connection behind a lock, Postgres draws from its pool. Nested
+# blocks on the same thread reuse the checkout they are inside. Reopened
+# automatically if DB_NAME / GST_DB_URL is repointed.
+_local        = threading.local()      # the checkout held by this thread, while inside a block
+_backend      = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    """The storage backend: GST_DB_URL (postgresql://…) if set, else the SQLite file DB_NAME."""
+    global _backend
+    target = os.environ.get("GST_DB_URL") or DB_NAME
+    with _backend_lock:
+        old = _backend
+        if old is None or old.target != target:
+            _backend = open_backend(target)
+        store = _backend
+    if old is not None and old is not store:
+        old.close()
+    return store
+
+
+@contextmanager
+def connection():
+    """A connection for the duration of the block, returned to the backend on exit."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    store = backend()
+    with store.connection() as conn:
+        _local.conn, _local.backend, _local.depth = conn, store, 0
+        try:
+            yield conn
+        finally:
+            _local.conn, _local.backend, _local.depth = None, None, 0
+
+
+def _read_sql(sql, params=None):
+    with connection() as conn:
+        return pd.read_sql(sql, conn, params=params)
+
+
+@contextmanager
+def transaction():
+    """
+    Groups writes into one commit. Nested blocks join the outermost one, so
+    callers can wrap a loop of save/upsert calls and pay for a single commit.
+    Rolls back on any exception.
+    """
+    with connection() as conn:
+        outer = _local.depth == 0
+        if outer:
+            _local.backend.begin(conn)
+        _local.depth += 1
+        try:
+            yield conn
+            if outer:
+                conn.commit()
+        except Exception:
+            if outer:
+                conn.rollback()
+            raise
+        finally:
+            _local.depth -= 1
+
+
+def checkpoint():
+    """Folds the WAL back into the main file (before copying / backing up)."""
+    if backend().name == 'sqlite':
+        with connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def _require_sqlite(action):
+    if backend().name != 'sqlite':
+        raise RuntimeError(f"{action} works on the local SQLite database only — "
+                           f"back up the shared server with its own tools (pg_dump)")
+
+
+def export_database_bytes():
+    """Consistent snapshot of the whole DB as .db file bytes."""
+    _require_sqlite("Export")
+    wait_for_writes()
+    checkpoint()
+    with connection() as conn:
+        return _rollback_header(conn.serialize())
+
+
+def _rollback_header(data):
+    # Header bytes 18/19 mark a WAL database; an in-memory image (and a plain
+    # file copy without its -wal) must be flagged rollback-journal instead.
+    data = bytearray(data)
+    if len(data) >= 20 and data[18:20] == b'\x02\x02':
+        data[18:20] = b'\x01\x01'
+    return bytes(data)
+
+
+def restore_database_bytes(data):
+    """Replaces the live DB with a backup produced by export_database_bytes."""
+    _require_sqlite("Restore")
+    wait_for_writes()
+    src = sqlite3.connect(":memory:")
+    try:
+        src.deserialize(_rollback_header(data))
+        src.execute("PRAGMA schema_version").fetchone()   # rejects non-DB bytes
+        with connection() as conn:
+            src.backup(conn)
+    finally:
+        src.close()
+    init_db()
+
+
+# ── Background writer ───────────────────────────────────────────────────────
+# Audit-log and follow-up events are fire-and-forget from the UI's point of
+# view (bulk notice / WhatsApp flows emit one per vendor). They are queued and
+# a single writer thread commits whatever has accumulated in one transaction,
+# one executemany per run of same-kind events (order is preserved).
+# Sync mode (tests, scripts): GST_DB_SYNC_WRITES=1 or set_sync_writes(True).
+# An event that fails is logged and kept until flush_writes() reports it.
+_WRITE_SQL = {
+    'audit': "INSERT INTO audit_log (recon_id, timestamp, action_type, details) VALUES (?,?,?,?)",
+    'followup': '''
+        INSERT INTO vendor_followups
+            (recon_id, vendor_name, gstin, notice_sent_date, status, notes, issue_count, itc_at_risk, last_updated)
+        SELECT ?,?,?,?,?,?,?,?,?
+        WHERE NOT EXISTS (SELECT 1 FROM vendor_followups WHERE recon_id=? AND vendor_name=?)
+    ''',
+    'notice_sent': "UPDATE vendor_followups SET notice_sent_date=?, status='Pending', last_updated=? "
+                   "WHERE recon_id=? AND vendor_name=?",
+}
+_WRITE_BATCH = 1000
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer      = None
+_sync_writes = os.environ.get("GST_DB_SYNC_WRITES") == "1"
+_write_errors = []                  # (kind, exception) not yet reported
+_errors_lock  = threading.Lock()
+_log = logging.getLogger(__name__)
+
+
+def set_sync_writes(enabled=True):
+    """Write queued events inline (no background thread) — for tests and scripts."""
+    global _sync_writes
+    wait_for_writes()
+    _sync_writes = enabled
+
+
+def _apply_writes(batch):
+    try:
+        with transaction() as conn:
+            for kind, group in itertools.groupby(batch, key=lambda e: e[0]):
+                conn.executemany(_WRITE_SQL[kind], [params for _, params in group])
+    except Exception:
+        # One bad event must not take the rest of the batch with it
+        for kind, params in batch:
+            try:
+                with transaction() as conn:
+                    conn.execute(_WRITE_SQL[kind], params)
+            except Exception as e:
+                _log.error("Queued %s write failed: %s", kind, e)
+                with _errors_lock:
+                    _write_errors.append((kind, e))
+
+
+def _writer_loop():
+    while True:
+        batch = [_write_queue.get()]
+        try:
+            while len(batch) < _WRITE_BATCH:
+                batch.append(_write_queue.get_nowait())
+        except queue.Empty:
+            pass
+        try:
+            _apply_writes(batch)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+
+def _submit(kind, params):
+    global _writer
+    if _sync_writes:
+        _apply_writes([(kind, params)])
+        return
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+                _writer.start()
+    _write_queue.put((kind, params))
+
+
+def wait_for_writes():
+    """
+    Blocks until every queued event is committed. No-op while this thread
+    holds a connection — the writer would wait for it to be handed back.
+    """
+    if _writer is not None and getattr(_local, 'conn', None) is None:
+        _write_queue.join()
+
+
+def flush_writes():
+    """
+    wait_for_writes(), then returns the events that failed since the last
+    call as [(kind, exception)] — each failure is reported once.
+    """
+    wait_for_writes()
+    with _errors_lock:
+        failed = _write_errors[:]
+        _write_errors.clear()
+    return failed
+
+
+atexit.register(wait_for_writes)
+
+
 # ── JSON encoder that handles numpy int64 / float64 / bool ──────────────────
 class _SafeEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -33,241 +293,797 @@ def _dumps(obj) -> str:
 
 
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS history (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            gstin           TEXT,
-            company_name    TEXT,
-            fy              TEXT,
-            period          TEXT,
-            timestamp       DATETIME,
-            data_json       TEXT,
-            cdnr_json       TEXT,
-            cdnr_summary_json TEXT,
-            b2b_summary_json  TEXT
-        )
-    ''')
-
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS audit_log (
-            id          INTEGER PRIMARY KEY AUTOINCREMENT,
-            recon_id    INTEGER,
-            timestamp   DATETIME,
-            action_type TEXT,
-            details     TEXT
-        )
-    ''')
+    with transaction() as conn:
+        c = conn.cursor()
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS history (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                gstin           TEXT,
+                company_name    TEXT,
+                fy              TEXT,
+                period          TEXT,
+                timestamp       DATETIME,
+                data_json       TEXT,
+                cdnr_json       TEXT,
+                cdnr_summary_json TEXT,
+                b2b_summary_json  TEXT,
+                data_parquet    BLOB,
+                cdnr_parquet    BLOB
+            )
+        ''')
 
-    # Migrate older DBs that don't have new columns
-    existing_cols = [row[1] for row in c.execute("PRAGMA table_info(history)").fetchall()]
-    for col, coltype in [
-        ("cdnr_json",          "TEXT"),
-        ("cdnr_summary_json",  "TEXT"),
-        ("b2b_summary_json",   "TEXT"),
-    ]:
-        if col not in existing_cols:
-            c.execute(f"ALTER TABLE history ADD COLUMN {col} {coltype}")
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                recon_id    INTEGER,
+                timestamp   DATETIME,
+                action_type TEXT,
+                details     TEXT
+            )
+        ''')
 
-    conn.commit()
-    conn.close()
-    init_followup_table()
+        # Migrate older DBs that don't have new columns
+        existing_cols = backend().table_columns(conn, 'history')
+        for col, coltype in [
+            ("cdnr_json",          "TEXT"),
+            ("cdnr_summary_json",  "TEXT"),
+            ("b2b_summary_json",   "TEXT"),
+            ("data_parquet",       "BLOB"),
+            ("cdnr_parquet",       "BLOB"),
+        ]:
+            if col not in existing_cols:
+                c.execute(f"ALTER TABLE history ADD COLUMN {col} {coltype}")
 
+        init_followup_table()
 
-def _build_b2b_summary(df):
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS layout_profiles (
+                fingerprint     TEXT PRIMARY KEY,
+                sheet_sig       TEXT,
+                sheet_name      TEXT,
+                header_idx      INTEGER,
+                role            TEXT,
+                software        TEXT,
+                column_map_json TEXT,
+                use_count       INTEGER DEFAULT 0,
+                last_used       DATETIME
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_layout_sheet_sig ON layout_profiles(sheet_sig)")
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS result_chunks (
+                hash    TEXT PRIMARY KEY,
+                size    INTEGER,
+                data    BLOB
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS history_chunks (
+                recon_id    INTEGER NOT NULL,
+                part        TEXT NOT NULL,
+                seq         INTEGER NOT NULL,
+                hash        TEXT NOT NULL,
+                row_count   INTEGER,
+                PRIMARY KEY (recon_id, part, seq)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_history_chunks_hash ON history_chunks(hash)")
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS recon_rows (
+                recon_id        INTEGER NOT NULL,
+                row_no          INTEGER NOT NULL,
+                client_gstin    TEXT,
+                fy              TEXT,
+                period          TEXT,
+                gstin           TEXT,
+                party           TEXT,
+                status          TEXT,
+                inv_key         TEXT,
+                inv_no_books    TEXT,
+                inv_no_gst      TEXT,
+                inv_date        TEXT,
+                taxable_books   INTEGER,
+                taxable_gst     INTEGER,
+                igst_books      INTEGER,
+                igst_gst        INTEGER,
+                cgst_books      INTEGER,
+                cgst_gst        INTEGER,
+                sgst_books      INTEGER,
+                sgst_gst        INTEGER,
+                PRIMARY KEY (recon_id, row_no)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_recon_rows_gstin_status ON recon_rows(gstin, status)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_recon_rows_client ON recon_rows(client_gstin, fy, period)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_recon_rows_inv ON recon_rows(gstin, inv_key)")
+        _init_search_index(c)
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS vendor_rollups (
+                recon_id        INTEGER NOT NULL,
+                gstin           TEXT NOT NULL,
+                status          TEXT NOT NULL,
+                party           TEXT,
+                is_issue        INTEGER,
+                invoice_count   INTEGER,
+                itc_value       INTEGER,
+                PRIMARY KEY (recon_id, gstin, status)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_vendor_rollups_gstin ON vendor_rollups(gstin, recon_id)")
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS client_summary (
+                company_name    TEXT NOT NULL,
+                gstin           TEXT NOT NULL,
+                last_recon_id   INTEGER,
+                fy              TEXT,
+                period          TEXT,
+                last_timestamp  DATETIME,
+                runs            INTEGER,
+                unmatched_count INTEGER,
+                itc_at_risk     INTEGER,
+                cdnr_impact     INTEGER,
+                PRIMARY KEY (company_name, gstin)
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_client_summary_last ON client_summary(last_recon_id)")
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_history_client ON history({_CLIENT_KEY_INDEX})")
+        if (c.execute("SELECT 1 FROM history LIMIT 1").fetchone()
+                and not c.execute("SELECT 1 FROM client_summary LIMIT 1").fetchone()):
+            rebuild_client_summary()
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_key         TEXT NOT NULL,
+                kind            TEXT,
+                fname           TEXT,
+                path            TEXT,
+                status          TEXT NOT NULL,
+                error           TEXT,
+                submitted_at    DATETIME,
+                started_at      DATETIME,
+                finished_at     DATETIME,
+                seconds         REAL
+            )
+        ''')
+        c.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_key ON report_jobs(job_key)")
+
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS db_meta (
+                key     TEXT PRIMARY KEY,
+                value   TEXT
+            )
+        ''')
+
+    _migrate_once('recon_rows_backfilled', backfill_recon_rows)
+
+
+def _migrate_once(flag, migration):
+    """Runs a one-off data migration the first time init_db sees this database."""
+    with connection() as conn:
+        if conn.execute("SELECT 1 FROM db_meta WHERE key=?", (flag,)).fetchone():
+            return
+    migration()
+    with transaction() as conn:
+        conn.execute("INSERT INTO db_meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO NOTHING",
+                     (flag, datetime.datetime.now().isoformat()))
+
+
+def _build_b2b_summary(df, cube=None):
     try:
+        cube = cube or build_cube(df, 'Recon_Status')
         return {
-            "total_books_taxable": float(df['Taxable Value_BOOKS'].fillna(0).sum()),
-            "total_gst_taxable":   float(df['Taxable Value_GST'].fillna(0).sum()),
-            "status_counts":       df['Recon_Status'].value_counts().to_dict(),
-            "total_rows":          len(df),
+            "total_books_taxable": cube.total('taxable_books'),
+            "total_gst_taxable":   cube.total('taxable_gst'),
+            "status_counts":       cube.status_counts(),
+            "total_rows":          cube.count(),
+            "itc_at_risk":         cube.total('final', Flag.NOT_IN_2B),
         }
     except Exception:
         return {}
 
 
-def save_reconciliation(meta, df):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    data_json    = df.to_json(orient='split', date_format='iso')
-    b2b_summary  = _dumps(_build_b2b_summary(df))
-    c.execute('''
-        INSERT INTO history
-            (gstin, company_name, fy, period, timestamp, data_json, b2b_summary_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (meta['gstin'], meta['name'], meta['fy'], meta['period'],
-          datetime.datetime.now().isoformat(), data_json, b2b_summary))
-    record_id = c.lastrowid
-    conn.commit()
-    conn.close()
+# ── Result frames: content-addressed Parquet chunks ─────────────────────────
+# A result is cut into _CHUNK_ROWS-row Parquet chunks stored once per SHA-256
+# (result_chunks); history_chunks lists each run's chunks in order. Re-saving
+# after a few party-name fixes or an import only writes the chunks whose rows
+# changed. Older rows keep their single blob ({part}_parquet) or JSON text
+# until first opened; without pyarrow results are stored as JSON text.
+_CHUNK_ROWS = 8192
+
+
+def _drop_frame(conn, record_id, part):
+    """Removes a run's chunk list for `part`; returns the hashes it referenced."""
+    hashes = [r[0] for r in conn.execute(
+        "SELECT hash FROM history_chunks WHERE recon_id=? AND part=?", (record_id, part))]
+    conn.execute("DELETE FROM history_chunks WHERE recon_id=? AND part=?", (record_id, part))
+    return hashes
+
+
+def _gc_chunks(conn, hashes):
+    """Deletes those chunks no run references any more."""
+    hashes = list(set(hashes))
+    for i in range(0, len(hashes), 500):
+        batch = hashes[i:i + 500]
+        conn.execute(f'''
+            DELETE FROM result_chunks
+            WHERE hash IN ({', '.join('?' * len(batch))})
+              AND NOT EXISTS (SELECT 1 FROM history_chunks h WHERE h.hash = result_chunks.hash)
+        ''', batch)
+
+
+def _store_frame(conn, record_id, part, df):
+    """Writes df as the run's 'data' / 'cdnr' result, replacing any previous one."""
+    old = _drop_frame(conn, record_id, part)
+    chunks = None
+    if arrow_available():
+        try:
+            chunks = frame_to_parquet_chunks(df, _CHUNK_ROWS)
+        except Exception:
+            chunks = None
+    if chunks:
+        hashes = [hashlib.sha256(data).hexdigest() for data, _ in chunks]
+        conn.executemany("INSERT INTO result_chunks (hash, size, data) VALUES (?,?,?) "
+                         "ON CONFLICT (hash) DO NOTHING",
+                         [(h, len(data), data) for h, (data, _) in zip(hashes, chunks)])
+        conn.executemany(
+            "INSERT INTO history_chunks (recon_id, part, seq, hash, row_count) VALUES (?,?,?,?,?)",
+            [(record_id, part, seq, h, n) for seq, (h, (_, n)) in enumerate(zip(hashes, chunks))])
+        conn.execute(f"UPDATE history SET {part}_json=NULL, {part}_parquet=NULL WHERE id=?", (record_id,))
+    else:
+        conn.execute(f"UPDATE history SET {part}_json=?, {part}_parquet=NULL WHERE id=?",
+                     (df.to_json(orient='split', date_format='iso'), record_id))
+    _gc_chunks(conn, old)
+
+
+def _result_parts(conn, record_id, part, blob, rows=None):
+    """
+    [(parquet_bytes, local_rows_or_None), …] for a stored result — only the
+    chunks holding `rows` when given — or None when it is JSON text only.
+    """
+    if not arrow_available():
+        return None
+    manifest = conn.execute(
+        "SELECT hash, row_count FROM history_chunks WHERE recon_id=? AND part=? ORDER BY seq",
+        (record_id, part)).fetchall()
+    if not manifest:
+        return [(bytes(blob), rows)] if blob is not None else None
+
+    hashes = [h for h, _ in manifest]
+    if rows is None:
+        picks = [(i, None) for i in range(len(manifest))]
+    else:
+        bounds = np.concatenate([[0], np.cumsum([n for _, n in manifest])])
+        rows   = np.asarray(rows, dtype=np.int64)
+        rows   = rows[(rows >= 0) & (rows < bounds[-1])]
+        chunk  = np.searchsorted(bounds, rows, side='right') - 1
+        picks  = [(i, rows[chunk == i] - bounds[i]) for i in np.unique(chunk)] or [(0, rows)]
+    wanted = sorted({hashes[i] for i, _ in picks})
+    data = dict(conn.execute(
+        f"SELECT hash, data FROM result_chunks WHERE hash IN ({', '.join('?' * len(wanted))})",
+        wanted).fetchall())
+    return [(bytes(data[hashes[i]]), r) for i, r in picks]
+
+
+def _load_frame(conn, record_id, part, text, blob):
+    parts = _result_parts(conn, record_id, part, blob)
+    if parts:
+        df = parquet_chunks_to_frame(parts)
+    elif text:
+        df = pd.read_json(io.StringIO(text), orient='split')
+    else:
+        return None
+    if (blob is not None or text) and arrow_available():
+        # Legacy single blob / JSON text → chunks (best effort)
+        try:
+            with transaction():
+                _store_frame(conn, record_id, part, df)
+        except Exception:
+            pass
+    return df
+
+
+def save_reconciliation(meta, df, cube=None):
+    with transaction() as conn:
+        b2b_summary  = _dumps(_build_b2b_summary(df, cube))
+        record_id = backend().insert_returning_id(conn, '''
+            INSERT INTO history
+                (gstin, company_name, fy, period, timestamp, b2b_summary_json)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (meta['gstin'], meta['name'], meta['fy'], meta['period'],
+              datetime.datetime.now().isoformat(), b2b_summary))
+        _store_frame(conn, record_id, 'data', df)
+        _write_recon_rows(conn, record_id, meta['gstin'], meta['fy'], meta['period'], df)
+        _refresh_client_summary(conn, meta['name'], meta['gstin'])
     return record_id
 
 
 def get_history_list():
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql(
-        "SELECT id, company_name, gstin, period, fy, timestamp FROM history ORDER BY id DESC",
-        conn)
-    conn.close()
-    return df
+    return _read_sql(
+        "SELECT id, company_name, gstin, period, fy, timestamp FROM history ORDER BY id DESC")
 
 
 def load_reconciliation(record_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "SELECT gstin, company_name, fy, period, data_json, cdnr_json, cdnr_summary_json FROM history WHERE id=?",
-        (record_id,))
-    row = c.fetchone()
-    conn.close()
-    if not row:
-        return None, None, None, None
-    meta = {'gstin': row[0], 'company_name': row[1], 'fy': row[2], 'period': row[3]}
-    df_b2b = pd.read_json(io.StringIO(row[4]), orient='split') if row[4] else pd.DataFrame()
-    df_cdnr, cdnr_summary = None, None
-    if row[5]:
+    with connection() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT gstin, company_name, fy, period, data_json, cdnr_json, cdnr_summary_json, "
+            "data_parquet, cdnr_parquet FROM history WHERE id=?",
+            (record_id,))
+        row = c.fetchone()
+        if not row:
+            return None, None, None, None
+        meta = {'gstin': row[0], 'company_name': row[1], 'fy': row[2], 'period': row[3]}
+        df_b2b = _load_frame(conn, record_id, 'data', row[4], row[7])
+        if df_b2b is None:
+            df_b2b = pd.DataFrame()
+        encode_statuses(df_b2b)
+        df_cdnr, cdnr_summary = None, None
         try:
-            df_cdnr = pd.read_json(io.StringIO(row[5]), orient='split')
+            df_cdnr = encode_statuses(_load_frame(conn, record_id, 'cdnr', row[5], row[8]))
         except Exception:
             df_cdnr = None
-    if row[6]:
-        try:
-            cdnr_summary = json.loads(row[6])
-        except Exception:
-            cdnr_summary = None
-    return meta, df_b2b, df_cdnr, cdnr_summary
+        if row[6]:
+            try:
+                cdnr_summary = json.loads(row[6])
+            except Exception:
+                cdnr_summary = None
+        return meta, df_b2b, df_cdnr, cdnr_summary
+
+
+def _as_list(val):
+    return None if val is None else ([val] if isinstance(val, str) else list(val))
+
+
+def _matching_rows(conn, record_id, statuses, gstins):
+    """Row positions of a run matching the filters, via recon_rows; None if the run isn't indexed."""
+    if not conn.execute("SELECT 1 FROM recon_rows WHERE recon_id=? LIMIT 1", (record_id,)).fetchone():
+        return None
+    where, params = ["recon_id = ?"], [record_id]
+    _in_clause('status', statuses, where, params)
+    _in_clause('gstin', None if gstins is None else [str(g).strip().upper() for g in gstins],
+               where, params)
+    return [r[0] for r in conn.execute(
+        f"SELECT row_no FROM recon_rows WHERE {' AND '.join(where)} ORDER BY row_no", params)]
+
+
+def load_reconciliation_filtered(record_id, statuses=None, gstins=None, columns=None, cdnr=False):
+    """
+    Part of a saved run without materialising the whole result: rows whose
+    status is in `statuses` and supplier GSTIN in `gstins`, restricted to
+    `columns` (unknown names ignored; None = no filter / all columns).
+    B2B rows are located through recon_rows so only the chunks / row groups
+    holding them are fetched and decompressed; CDNR and unindexed runs fall
+    back to Parquet statistics. Returns (meta, df), or (None, None) if the run doesn't exist.
+    """
+    statuses, gstins = _as_list(statuses), _as_list(gstins)
+    part, status_col = ('cdnr', 'Recon_Status_CDNR') if cdnr else ('data', 'Recon_Status')
+    with connection() as conn:
+        row = conn.execute(
+            f"SELECT gstin, company_name, fy, period, {part}_json, {part}_parquet FROM history WHERE id=?",
+            (record_id,)).fetchone()
+        if not row:
+            return None, None
+        meta = {'gstin': row[0], 'company_name': row[1], 'fy': row[2], 'period': row[3]}
+        text, blob = row[4], row[5]
+
+        rows = None
+        if not cdnr and (statuses is not None or gstins is not None) and arrow_available():
+            rows = _matching_rows(conn, record_id, statuses, gstins)
+        parts = _result_parts(conn, record_id, part, blob, rows)
+
+        if parts is None:
+            # JSON text only (legacy row / no pyarrow) — filter after a full load
+            if not text:
+                return meta, pd.DataFrame()
+            df = pd.read_json(io.StringIO(text), orient='split')
+            if statuses is not None and status_col in df.columns:
+                df = df[df[status_col].isin(statuses)]
+            if gstins is not None and 'GSTIN' in df.columns:
+                df = df[df['GSTIN'].astype(str).str.strip().str.upper()
+                        .isin([str(g).strip().upper() for g in gstins])]
+            if columns is not None:
+                df = df[[c for c in columns if c in df.columns]]
+            return meta, encode_statuses(df.reset_index(drop=True))
+
+        stored = parquet_columns(parts[0][0])
+        cols   = None if columns is None else [c for c in columns if c in stored]
+        filters = []
+        if rows is None:
+            if statuses is not None and status_col in stored:
+                filters.append((status_col, 'in', statuses))
+            if gstins is not None and 'GSTIN' in stored:
+                filters.append(('GSTIN', 'in', gstins))
+        return meta, encode_statuses(parquet_chunks_to_frame(parts, columns=cols, filters=filters or None))
 
 
 def delete_reconciliation(record_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM history   WHERE id=?", (record_id,))
-    c.execute("DELETE FROM audit_log WHERE recon_id=?", (record_id,))
-    conn.commit()
-    conn.close()
+    wait_for_writes()
+    with transaction() as conn:
+        c = conn.cursor()
+        client = c.execute("SELECT company_name, gstin FROM history WHERE id=?", (record_id,)).fetchone()
+        freed  = _drop_frame(conn, record_id, 'data') + _drop_frame(conn, record_id, 'cdnr')
+        _gc_chunks(conn, freed)
+        c.execute("DELETE FROM history    WHERE id=?", (record_id,))
+        c.execute("DELETE FROM audit_log  WHERE recon_id=?", (record_id,))
+        _unindex_search(conn, record_id)
+        c.execute("DELETE FROM recon_rows WHERE recon_id=?", (record_id,))
+        c.execute("DELETE FROM vendor_rollups WHERE recon_id=?", (record_id,))
+        if client:
+            _refresh_client_summary(conn, *client)
 
 
 def save_cdnr_to_history(record_id, df_cdnr, cdnr_summary):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "UPDATE history SET cdnr_json=?, cdnr_summary_json=? WHERE id=?",
-        (df_cdnr.to_json(orient='split', date_format='iso'),
-         _dumps(cdnr_summary),
-         record_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE history SET cdnr_summary_json=? WHERE id=?", (_dumps(cdnr_summary), record_id))
+        _store_frame(conn, record_id, 'cdnr', df_cdnr)
+        client = c.execute("SELECT company_name, gstin FROM history WHERE id=?", (record_id,)).fetchone()
+        if client:
+            _refresh_client_summary(conn, *client)
 
 
 def log_action(recon_id, action_type, details):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO audit_log (recon_id, timestamp, action_type, details) VALUES (?,?,?,?)",
-        (recon_id, datetime.datetime.now().isoformat(), action_type, _dumps(details)))
-    conn.commit()
-    conn.close()
+    _submit('audit', (recon_id, datetime.datetime.now().isoformat(), action_type, _dumps(details)))
 
 
 def get_audit_log(recon_id):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql(
+    wait_for_writes()
+    df = _read_sql(
         "SELECT timestamp, action_type, details FROM audit_log WHERE recon_id=? ORDER BY id DESC",
-        conn, params=(recon_id,))
-    conn.close()
+        params=(recon_id,))
+    return df
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# LAYOUT PROFILES  (remembered sheet / header row / column mapping per ERP export)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _layout_row(row):
+    return {
+        'fingerprint': row[0], 'sheet_sig': row[1], 'sheet_name': row[2],
+        'header_idx':  row[3], 'role': row[4], 'software': row[5],
+        'column_map':  json.loads(row[6] or '{}'),
+    }
+
+_LAYOUT_COLS = "fingerprint, sheet_sig, sheet_name, header_idx, role, software, column_map_json"
+
+
+def get_layout_profiles(sheet_sig):
+    """Confirmed layouts for a workbook with this sheet list, most used first."""
+    with connection() as conn:
+        rows = conn.execute(
+            f"SELECT {_LAYOUT_COLS} FROM layout_profiles WHERE sheet_sig=? ORDER BY use_count DESC",
+            (sheet_sig,)).fetchall()
+        return [_layout_row(r) for r in rows]
+
+
+def get_layout_profile(fingerprint):
+    if not fingerprint:
+        return None
+    with connection() as conn:
+        try:
+            row = conn.execute(
+                f"SELECT {_LAYOUT_COLS} FROM layout_profiles WHERE fingerprint=?",
+                (fingerprint,)).fetchone()
+        except backend().OperationalError:
+            row = None
+        return _layout_row(row) if row else None
+
+
+def save_layout_profile(df_attrs, role, software, column_map):
+    """Remembers the confirmed mapping for the layout described by a preview frame's attrs."""
+    fingerprint = df_attrs.get('layout_fp')
+    if not fingerprint:
+        return
+    with transaction() as conn:
+        conn.execute('''
+            INSERT INTO layout_profiles
+                (fingerprint, sheet_sig, sheet_name, header_idx, role, software,
+                 column_map_json, use_count, last_used)
+            VALUES (?,?,?,?,?,?,?,1,?)
+            ON CONFLICT(fingerprint) DO UPDATE SET
+                column_map_json = excluded.column_map_json,
+                software        = excluded.software,
+                use_count       = layout_profiles.use_count + 1,
+                last_used       = excluded.last_used
+        ''', (fingerprint, df_attrs.get('sheet_sig'), df_attrs.get('sheet_name'),
+              df_attrs.get('header_idx'), role, software, _dumps(column_map),
+              datetime.datetime.now().isoformat()))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# INVOICE-LEVEL HISTORY (recon_rows)
+# ══════════════════════════════════════════════════════════════════════════════
+
+_MONEY_COLS = [
+    ('taxable_books', 'Taxable Value_BOOKS'), ('taxable_gst', 'Taxable Value_GST'),
+    ('igst_books',    'IGST_BOOKS'),          ('igst_gst',    'IGST_GST'),
+    ('cgst_books',    'CGST_BOOKS'),          ('cgst_gst',    'CGST_GST'),
+    ('sgst_books',    'SGST_BOOKS'),          ('sgst_gst',    'SGST_GST'),
+]
+_ROW_COLS = ['recon_id', 'row_no', 'client_gstin', 'fy', 'period', 'gstin', 'party', 'status',
+             'inv_key', 'inv_no_books', 'inv_no_gst', 'inv_date'] + [c for c, _ in _MONEY_COLS]
+
+
+def _first_of(df, *cols):
+    """Coalesces the listed columns left to right (missing ones are skipped)."""
+    out = pd.Series(None, index=df.index, dtype=object)
+    for col in cols:
+        if col in df.columns:
+            out = out.where(out.notna(), df[col].astype(object))
+    return out
+
+
+def _nullable(values, present):
+    return values.astype(object).where(present, None).tolist()
+
+
+def _text(series, upper=False):
+    vals = series.astype(str).str.strip()
+    return _nullable(vals.str.upper() if upper else vals, series.notna())
+
+
+def _paise(series):
+    vals = pd.to_numeric(series, errors='coerce').mul(100).round()
+    return _nullable(vals.fillna(0).astype('int64'), vals.notna())
+
+
+def _write_recon_rows(conn, record_id, client_gstin, fy, period, df):
+    """Replaces the recon_rows of one run with the rows of df (one bulk insert)."""
+    _unindex_search(conn, record_id)
+    conn.execute("DELETE FROM recon_rows WHERE recon_id=?", (record_id,))
+    conn.execute("DELETE FROM vendor_rollups WHERE recon_id=?", (record_id,))
+    if df is None or df.empty:
+        return
+    n = len(df)
+    inv_date = pd.to_datetime(_first_of(df, 'Invoice Date_BOOKS', 'Invoice Date_GST'),
+                              errors='coerce', dayfirst=True)
+    columns = [
+        [record_id] * n, range(n), [client_gstin] * n, [fy] * n, [period] * n,
+        _text(_first_of(df, 'GSTIN', 'GSTIN_BOOKS', 'GSTIN_GST'), upper=True),
+        _text(_first_of(df, 'Name of Party')),
+        _text(_first_of(df, 'Recon_Status')),
+        _text(_first_of(df, 'Clean_Inv_BOOKS', 'Clean_Inv_GST',
+                        'Invoice Number_BOOKS', 'Invoice Number_GST'), upper=True),
+        _text(_first_of(df, 'Invoice Number_BOOKS')),
+        _text(_first_of(df, 'Invoice Number_GST')),
+        _nullable(inv_date.dt.strftime('%Y-%m-%d'), inv_date.notna()),
+    ] + [_paise(_first_of(df, src)) for _, src in _MONEY_COLS]
+    backend().bulk_insert(conn, 'recon_rows', _ROW_COLS, zip(*columns))
+    _index_search(conn, record_id)
+    _write_vendor_rollups(conn, record_id)
+
+
+def backfill_recon_rows():
+    """Indexes history runs saved before recon_rows existed. Returns runs added."""
+    with connection() as conn:
+        pending = conn.execute(
+            "SELECT id, gstin, fy, period FROM history "
+            "WHERE id NOT IN (SELECT DISTINCT recon_id FROM recon_rows) ORDER BY id").fetchall()
+    added = 0
+    for record_id, client_gstin, fy, period in pending:
+        try:
+            _, df, _, _ = load_reconciliation(record_id)
+        except Exception:
+            continue                # unreadable result — leave the run unindexed
+        if df is None:
+            continue
+        with transaction() as conn:
+            _write_recon_rows(conn, record_id, client_gstin, fy, period, df)
+        added += 1
+    return added
+
+
+def _in_clause(col, val, where, params):
+    if val is None:
+        return
+    vals = [val] if isinstance(val, str) else list(val)
+    where.append(f"{col} IN ({', '.join('?' * len(vals))})")
+    params.extend(vals)
+
+
+def query_invoices(gstin=None, statuses=None, client_gstin=None, fy=None, period=None,
+                   inv_key=None, limit=None):
+    """
+    Invoice rows across every saved run, filtered on the indexed columns, e.g.
+    every unmatched invoice of one supplier across FY 2024-25 and 2025-26:
+        query_invoices(gstin=..., statuses='Invoices Not in GSTR-2B',
+                       client_gstin=..., fy=['2024-25', '2025-26'])
+    Each filter takes a value or a list. Money comes back in rupees.
+    """
+    where, params = [], []
+    for col, val in [('r.gstin', gstin), ('r.status', statuses), ('r.client_gstin', client_gstin),
+                     ('r.fy', fy), ('r.period', period), ('r.inv_key', inv_key)]:
+        _in_clause(col, val, where, params)
+    sql = ("SELECT r.*, h.company_name FROM recon_rows r JOIN history h ON h.id = r.recon_id"
+           + (" WHERE " + " AND ".join(where) if where else "")
+           + " ORDER BY r.recon_id DESC, r.row_no")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    df = _read_sql(sql, params=params)
+    for col, _ in _MONEY_COLS:
+        df[col] = df[col] / 100.0
+    return df
+
+
+def get_repeat_offenders(client_gstin=None, statuses=('Invoices Not in GSTR-2B',), min_runs=2):
+    """Suppliers with invoices in `statuses` in at least min_runs separate runs, worst first."""
+    where, params = [], []
+    _in_clause('status', statuses, where, params)
+    _in_clause('client_gstin', client_gstin, where, params)
+    df = _read_sql(f'''
+        SELECT gstin,
+               MAX(party)               AS party,
+               COUNT(DISTINCT recon_id) AS runs,
+               COUNT(*)                 AS invoices,
+               SUM(COALESCE(taxable_books, taxable_gst, 0)) AS taxable
+        FROM recon_rows
+        WHERE {" AND ".join(where) or "1=1"}
+        GROUP BY gstin
+        HAVING COUNT(DISTINCT recon_id) >= ?
+        ORDER BY runs DESC, taxable DESC
+    ''', params=params + [min_runs])
+    df['taxable'] = df['taxable'] / 100.0
     return df
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+# GLOBAL INVOICE SEARCH  (FTS5 over recon_rows)
+# ══════════════════════════════════════════════════════════════════════════════
+# External-content FTS5 table over recon_rows' invoice numbers, GSTIN and party
+# name. Trigram tokenizer → substring matches ("4521" finds "GT/4521/24-25");
+# SQLite builds without it get unicode61 with prefix matching; builds without
+# FTS5 fall back to LIKE on recon_rows. On Postgres, pg_trgm GIN indexes on
+# recon_rows serve the same substring search through ILIKE.
+_SEARCH_COLS = "inv_no_books, inv_no_gst, gstin, party"
+_FTS_MODES   = ('trigram', 'unicode61')
+_search_mode = None
+
+
+def _init_search_index(conn):
+    global _search_mode
+    if backend().name != 'sqlite':
+        ok = backend().create_trigram_index(conn, 'recon_rows', _SEARCH_COLS.split(', '))
+        _search_mode = 'pg_trgm' if ok else None
+        return
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name='invoice_search'").fetchone()
+    if row:
+        _search_mode = 'trigram' if 'trigram' in row[0] else 'unicode61'
+        return
+    for mode in ('trigram', 'unicode61'):
+        try:
+            conn.execute(f'''
+                CREATE VIRTUAL TABLE invoice_search USING fts5(
+                    {_SEARCH_COLS}, content='recon_rows', content_rowid='rowid', tokenize='{mode}')
+            ''')
+        except sqlite3.OperationalError:
+            continue
+        conn.execute("INSERT INTO invoice_search(invoice_search) VALUES ('rebuild')")
+        _search_mode = mode
+        return
+    _search_mode = None
+
+
+def rebuild_search_index():
+    """Re-reads recon_rows into the index (after a full VACUUM renumbers rowids)."""
+    if _search_mode in _FTS_MODES:
+        with transaction() as conn:
+            conn.execute("INSERT INTO invoice_search(invoice_search) VALUES ('rebuild')")
+
+
+def _index_search(conn, record_id):
+    if _search_mode in _FTS_MODES:
+        conn.execute(f"INSERT INTO invoice_search(rowid, {_SEARCH_COLS}) "
+                     f"SELECT rowid, {_SEARCH_COLS} FROM recon_rows WHERE recon_id=?", (record_id,))
+
+
+def _unindex_search(conn, record_id):
+    """Must run while the run's recon_rows still exist (external content needs the old values)."""
+    if _search_mode in _FTS_MODES:
+        conn.execute(f"INSERT INTO invoice_search(invoice_search, rowid, {_SEARCH_COLS}) "
+                     f"SELECT 'delete', rowid, {_SEARCH_COLS} FROM recon_rows WHERE recon_id=?",
+                     (record_id,))
+
+
+def search_history(text, limit=200):
+    """
+    Invoices across every saved run whose invoice number, supplier GSTIN or
+    party name contains `text`. Newest runs first; money in rupees.
+    """
+    text = str(text or '').strip()
+    if not text:
+        return pd.DataFrame()
+    select = '''
+        SELECT h.company_name AS client, r.fy, r.period, r.recon_id, r.party, r.gstin,
+               r.inv_no_books, r.inv_no_gst, r.inv_date, r.status,
+               COALESCE(r.taxable_books, r.taxable_gst) / 100.0 AS taxable
+        FROM recon_rows r JOIN history h ON h.id = r.recon_id
+    '''
+    if _search_mode == 'trigram' and len(text) >= 3:
+        where, param = "r.rowid IN (SELECT rowid FROM invoice_search WHERE invoice_search MATCH ?)", \
+                       '"' + text.replace('"', '""') + '"'
+    elif _search_mode == 'unicode61' and re.search(r'\w', text):
+        where, param = "r.rowid IN (SELECT rowid FROM invoice_search WHERE invoice_search MATCH ?)", \
+                       " ".join('"' + w.replace('"', '""') + '"*' for w in text.split())
+    else:
+        like = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where = "(" + " OR ".join(f"r.{col} {backend().ilike} ? ESCAPE '\\'"
+                                  for col in _SEARCH_COLS.split(', ')) + ")"
+        return _read_sql(f"{select} WHERE {where} ORDER BY r.recon_id DESC, r.row_no LIMIT {int(limit)}",
+                         params=(like,) * 4)
+    return _read_sql(f"{select} WHERE {where} ORDER BY r.recon_id DESC, r.row_no LIMIT {int(limit)}",
+                     params=(param,))
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # VENDOR FOLLOW-UP TRACKER
 # ══════════════════════════════════════════════════════════════════════════════
 
 def init_followup_table():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS vendor_followups (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            recon_id        INTEGER,
-            vendor_name     TEXT,
-            gstin           TEXT,
-            notice_sent_date TEXT,
-            status          TEXT DEFAULT 'Pending',
-            notes           TEXT DEFAULT '',
-            issue_count     INTEGER DEFAULT 0,
-            itc_at_risk     REAL DEFAULT 0.0,
-            last_updated    DATETIME
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS vendor_followups (
+                id              INTEGER PRIMARY KEY AUTOINCREMENT,
+                recon_id        INTEGER,
+                vendor_name     TEXT,
+                gstin           TEXT,
+                notice_sent_date TEXT,
+                status          TEXT DEFAULT 'Pending',
+                notes           TEXT DEFAULT '',
+                issue_count     INTEGER DEFAULT 0,
+                itc_at_risk     REAL DEFAULT 0.0,
+                last_updated    DATETIME
+            )
+        ''')
 
 
 def upsert_followup(recon_id, vendor_name, gstin, issue_count=0, itc_at_risk=0.0):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "SELECT id FROM vendor_followups WHERE recon_id=? AND vendor_name=?",
-        (recon_id, vendor_name)
-    )
-    if not c.fetchone():
-        c.execute('''
-            INSERT INTO vendor_followups
-                (recon_id, vendor_name, gstin, notice_sent_date, status, notes, issue_count, itc_at_risk, last_updated)
-            VALUES (?,?,?,?,?,?,?,?,?)
-        ''', (recon_id, vendor_name, gstin, None, 'Pending', '',
-              issue_count, itc_at_risk, datetime.datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    _submit('followup', (recon_id, vendor_name, gstin, None, 'Pending', '', issue_count,
+                         itc_at_risk, datetime.datetime.now().isoformat(), recon_id, vendor_name))
 
 
 def save_followup_notice_sent(recon_id, vendor_name):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
     today = datetime.date.today().isoformat()
-    c.execute(
-        "UPDATE vendor_followups SET notice_sent_date=?, status='Pending', last_updated=? WHERE recon_id=? AND vendor_name=?",
-        (today, datetime.datetime.now().isoformat(), recon_id, vendor_name)
-    )
-    conn.commit()
-    conn.close()
+    _submit('notice_sent', (today, datetime.datetime.now().isoformat(), recon_id, vendor_name))
 
 
 def update_followup_status(recon_id, vendor_name, status, notes=''):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
-        "UPDATE vendor_followups SET status=?, notes=?, last_updated=? WHERE recon_id=? AND vendor_name=?",
-        (status, notes, datetime.datetime.now().isoformat(), recon_id, vendor_name)
-    )
-    conn.commit()
-    conn.close()
+    wait_for_writes()
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute(
+            "UPDATE vendor_followups SET status=?, notes=?, last_updated=? WHERE recon_id=? AND vendor_name=?",
+            (status, notes, datetime.datetime.now().isoformat(), recon_id, vendor_name)
+        )
 
 
 def get_followups(recon_id):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql(
+    wait_for_writes()
+    df = _read_sql(
         "SELECT * FROM vendor_followups WHERE recon_id=? ORDER BY itc_at_risk DESC",
-        conn, params=(recon_id,)
+        params=(recon_id,)
     )
-    conn.close()
     return df
 
 
 def get_overdue_followups(days=7):
-    conn = sqlite3.connect(DB_NAME)
+    wait_for_writes()
     cutoff = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
-    df = pd.read_sql('''
+    df = _read_sql('''
         SELECT f.vendor_name, f.notice_sent_date, f.status, f.itc_at_risk,
                h.company_name, h.period, f.recon_id
         FROM vendor_followups f
         JOIN history h ON h.id = f.recon_id
         WHERE f.notice_sent_date <= ? AND f.status IN ('Pending','Escalated')
         ORDER BY f.notice_sent_date ASC
-    ''', conn, params=(cutoff,))
-    conn.close()
+    ''', params=(cutoff,))
     return df
 
 
@@ -275,71 +1091,238 @@ def get_overdue_followups(days=7):
 # MULTI-CLIENT ITC DASHBOARD
 # ══════════════════════════════════════════════════════════════════════════════
 
+# A client is (company name, GSTIN) with surrounding blanks ignored — the same
+# key the dashboard has always grouped on. Indexed as an expression on history.
+_CLIENT_KEY_SQL   = "TRIM(COALESCE(company_name, '')), TRIM(COALESCE(gstin, ''))"
+_CLIENT_KEY_INDEX = "(TRIM(COALESCE(company_name, ''))), (TRIM(COALESCE(gstin, '')))"
+_CLIENT_KEY_WHERE = "TRIM(COALESCE(company_name, '')) = ? AND TRIM(COALESCE(gstin, '')) = ?"
+
+
+def _refresh_client_summary(conn, company_name, gstin):
+    """Recomputes one client's client_summary row from its latest history run."""
+    key = (str(company_name or '').strip(), str(gstin or '').strip())
+    runs, last_id = conn.execute(
+        f"SELECT COUNT(*), MAX(id) FROM history WHERE {_CLIENT_KEY_WHERE}", key).fetchone()
+    if not runs:
+        conn.execute("DELETE FROM client_summary WHERE company_name=? AND gstin=?", key)
+        return
+    fy, period, ts, b2b_json, cdnr_json = conn.execute(
+        "SELECT fy, period, timestamp, b2b_summary_json, cdnr_summary_json FROM history WHERE id=?",
+        (last_id,)).fetchone()
+
+    unmatched, itc_at_risk, cdnr_impact = 0, None, 0.0
+    try:
+        summary = json.loads(b2b_json or '{}')
+        sc = summary.get('status_counts', {})
+        unmatched = sum(sc.get(k, 0) for k in sc if 'Not in' in k)
+        itc_at_risk = summary.get('itc_at_risk')
+    except Exception:
+        pass
+    if itc_at_risk is None:      # runs saved before the summary carried it
+        itc_at_risk = (conn.execute(
+            "SELECT SUM(COALESCE(taxable_books, taxable_gst, 0)) FROM recon_rows "
+            "WHERE recon_id=? AND status='Invoices Not in GSTR-2B'", (last_id,)).fetchone()[0] or 0) / 100.0
+    try:
+        cdnr_impact = float(json.loads(cdnr_json or '{}').get('net_itc_impact') or 0)
+    except Exception:
+        pass
+
+    conn.execute('''
+        INSERT INTO client_summary
+            (company_name, gstin, last_recon_id, fy, period, last_timestamp, runs,
+             unmatched_count, itc_at_risk, cdnr_impact)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+        ON CONFLICT (company_name, gstin) DO UPDATE SET
+            last_recon_id   = excluded.last_recon_id,
+            fy              = excluded.fy,
+            period          = excluded.period,
+            last_timestamp  = excluded.last_timestamp,
+            runs            = excluded.runs,
+            unmatched_count = excluded.unmatched_count,
+            itc_at_risk     = excluded.itc_at_risk,
+            cdnr_impact     = excluded.cdnr_impact
+    ''', key + (last_id, fy, period, ts, runs, int(unmatched),
+                int(round(itc_at_risk * 100)), int(round(cdnr_impact * 100))))
+
+
+def rebuild_client_summary():
+    """Recomputes client_summary for every client (first start after upgrade / restore)."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM client_summary")
+        for company_name, gstin in conn.execute(
+                f"SELECT DISTINCT {_CLIENT_KEY_SQL} FROM history").fetchall():
+            _refresh_client_summary(conn, company_name, gstin)
+
+
 def get_all_clients_itc_summary():
-    conn = sqlite3.connect(DB_NAME)
     try:
-        df_hist = pd.read_sql(
-            "SELECT id, company_name, gstin, period, fy, timestamp, b2b_summary_json FROM history ORDER BY id DESC",
-            conn
-        )
+        df = _read_sql('''
+            SELECT company_name, gstin, fy, period, last_timestamp, unmatched_count,
+                   itc_at_risk / 100.0 AS itc_at_risk, cdnr_impact / 100.0 AS cdnr_impact,
+                   runs, last_recon_id
+            FROM client_summary
+            ORDER BY last_recon_id DESC
+        ''')
     except Exception:
-        conn.close()
         return pd.DataFrame()
-    conn.close()
 
-    if df_hist.empty:
+    if df.empty:
         return pd.DataFrame()
 
-    rows = []
-    seen = set()
-    for _, row in df_hist.iterrows():
-        key = (str(row['company_name']).strip(), str(row['gstin']).strip())
-        if key in seen:
-            continue
-        seen.add(key)
-        unmatched = 0
-        try:
-            summary = json.loads(row['b2b_summary_json'] or '{}')
-            sc = summary.get('status_counts', {})
-            unmatched = sum(sc.get(k, 0) for k in sc if 'Not in' in k)
-        except Exception:
-            pass
-        rows.append({
-            'Client':        row['company_name'],
-            'GSTIN':         row['gstin'],
-            'Last Period':   f"{row.get('fy','—')} | {row['period']}",
-            'Last Recon':    str(row['timestamp'])[:10],
-            'Unmatched Inv': unmatched,
-            'recon_id':      row['id'],
-        })
-    return pd.DataFrame(rows)
+    return pd.DataFrame({
+        'Client':        df['company_name'],
+        'GSTIN':         df['gstin'],
+        'Last Period':   df['fy'].fillna('—').astype(str) + ' | ' + df['period'].astype(str),
+        'Last Recon':    df['last_timestamp'].astype(str).str[:10],
+        'Unmatched Inv': df['unmatched_count'],
+        'ITC at Risk':   df['itc_at_risk'],
+        'CDNR Impact':   df['cdnr_impact'],
+        'Runs':          df['runs'],
+        'recon_id':      df['last_recon_id'],
+    })
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 # MONTH-OVER-MONTH COMPARISON
 # ══════════════════════════════════════════════════════════════════════════════
 
+def _issue_sql():
+    """1 / 0 flag expression: status carries status_codes.ISSUE (one of ISSUE_MARKERS)."""
+    fn = backend().instr
+    return ("CASE WHEN " + " OR ".join(f"{fn}(status, '{m}') > 0" for m in ISSUE_MARKERS)
+            + " THEN 1 ELSE 0 END")
+
+
+def _write_vendor_rollups(conn, record_id):
+    """Per-supplier, per-status totals of one run, aggregated from its recon_rows."""
+    conn.execute("DELETE FROM vendor_rollups WHERE recon_id=?", (record_id,))
+    conn.execute(f'''
+        INSERT INTO vendor_rollups
+            (recon_id, gstin, status, party, is_issue, invoice_count, itc_value)
+        SELECT recon_id, gstin, status, MAX(party), {_issue_sql()}, COUNT(*),
+               SUM(COALESCE(taxable_books, taxable_gst, 0))
+        FROM (SELECT recon_id, COALESCE(gstin, '') AS gstin, COALESCE(status, '') AS status,
+                     party, taxable_books, taxable_gst
+              FROM recon_rows WHERE recon_id=?) AS r
+        GROUP BY recon_id, gstin, status
+    ''', (record_id,))
+
+
+def _ensure_rollups(record_ids):
+    """Builds recon_rows / rollups for runs saved before they existed."""
+    ids = [int(i) for i in record_ids]
+    if not ids:
+        return
+    with connection() as conn:
+        have = {r[0] for r in conn.execute(
+            f"SELECT DISTINCT recon_id FROM vendor_rollups WHERE recon_id IN ({', '.join('?' * len(ids))})",
+            ids)}
+    for record_id in ids:
+        if record_id in have:
+            continue
+        meta, df, _, _ = load_reconciliation(record_id)
+        if meta is None:
+            continue
+        with transaction() as conn:
+            _write_recon_rows(conn, record_id, meta['gstin'], meta['fy'], meta['period'], df)
+
+
+def _vendor_issues(record_ids):
+    """Open-issue totals per (run, supplier GSTIN); ITC value in rupees."""
+    ids = [int(i) for i in record_ids]
+    return _read_sql(f'''
+        SELECT recon_id, gstin AS GSTIN, MAX(party) AS party,
+               SUM(invoice_count) AS issue_count, SUM(itc_value) / 100.0 AS itc_value
+        FROM vendor_rollups
+        WHERE is_issue = 1 AND recon_id IN ({', '.join('?' * len(ids))})
+        GROUP BY recon_id, gstin
+    ''', params=ids)
+
+
 def compare_two_recons(id1, id2):
-    def _vendor_summary(df):
-        mask = df['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error', na=False)
-        sub  = df[mask].copy()
-        return sub.groupby('Name of Party').agg(
-            issue_count=('Recon_Status', 'count'),
-            itc_value  =('Final_Taxable', 'sum')
-        ).reset_index()
-
-    _, df1, _, _ = load_reconciliation(id1)
-    _, df2, _, _ = load_reconciliation(id2)
-
-    if df1 is None or df2 is None:
+    _ensure_rollups([id1, id2])
+    with connection() as conn:
+        found = {r[0] for r in conn.execute("SELECT id FROM history WHERE id IN (?, ?)", (id1, id2))}
+    if {int(id1), int(id2)} - found:
         return pd.DataFrame()
 
-    s1 = _vendor_summary(df1).rename(columns={'issue_count': 'issues_old', 'itc_value': 'itc_old'})
-    s2 = _vendor_summary(df2).rename(columns={'issue_count': 'issues_new', 'itc_value': 'itc_new'})
+    issues = _vendor_issues([id1, id2])
+    cols = ['GSTIN', 'party', 'issue_count', 'itc_value']
+    s1 = issues.loc[issues['recon_id'] == int(id1), cols].rename(
+        columns={'party': 'party_old', 'issue_count': 'issues_old', 'itc_value': 'itc_old'})
+    s2 = issues.loc[issues['recon_id'] == int(id2), cols].rename(
+        columns={'party': 'party_new', 'issue_count': 'issues_new', 'itc_value': 'itc_new'})
 
-    merged = pd.merge(s1, s2, on='Name of Party', how='outer').fillna(0)
+    merged = pd.merge(s1, s2, on='GSTIN', how='outer')
+    merged.insert(0, 'Name of Party', merged.pop('party_new').fillna(merged.pop('party_old')))
+    num = ['issues_old', 'itc_old', 'issues_new', 'itc_new']
+    merged[num] = merged[num].fillna(0)
     merged['delta'] = merged['issues_new'] - merged['issues_old']
-    merged['trend'] = merged['delta'].apply(
-        lambda d: '✅ Improved' if d < 0 else ('🆕 New Issue' if d > 0 else '➡️ No Change')
-    )
-    return merged.sort_values('issues_new', ascending=False)
\ No newline at end of file
+    merged['trend'] = np.select([merged['delta'] < 0, merged['delta'] > 0],
+                                ['✅ Improved', '🆕 New Issue'], '➡️ No Change')
+    return merged.sort_values('issues_new', ascending=False)
+
+
+# ── Multi-period trend ──────────────────────────────────────────────────────
+_MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+def _fy_start(fy):
+    m = re.search(r'(\d{4})', str(fy or ''))
+    return int(m.group(1)) if m else 0
+
+
+def _fiscal_month(period):
+    """0 = April … 11 = March for the first month named in a period label, else None."""
+    text = str(period or '').lower()
+    m = re.match(r'\s*(\d{2})\d{4}\s*$', text)            # GSTN return period "MMYYYY"
+    if m and 1 <= int(m.group(1)) <= 12:
+        return (int(m.group(1)) - 4) % 12
+    for word in re.findall(r'[a-z]+', text):
+        if word[:3] in _MONTHS:
+            return (_MONTHS.index(word[:3]) - 3) % 12
+    return None
+
+
+def period_sort_key(fy, period):
+    """Chronological sort key for a run's (fy, period) labels; unknown months sort last in their FY."""
+    month = _fiscal_month(period)
+    return _fy_start(fy) * 100 + (99 if month is None else month)
+
+
+def get_vendor_trend(company_name, gstin, by='month'):
+    """
+    Open issues per supplier across every saved run of one client, bucketed by
+    'month', 'quarter' (fiscal) or 'year' (FY). Re-saves of the same period
+    count once (latest run wins). Long format, in period order:
+    Period, GSTIN, Name of Party, issue_count, itc_value.
+    """
+    key = (str(company_name or '').strip(), str(gstin or '').strip())
+    runs = _read_sql(f"SELECT id, fy, period FROM history WHERE {_CLIENT_KEY_WHERE} ORDER BY id",
+                     params=key)
+    if runs.empty:
+        return pd.DataFrame(columns=['Period', 'GSTIN', 'Name of Party', 'issue_count', 'itc_value'])
+    runs = runs.drop_duplicates(['fy', 'period'], keep='last')
+
+    fy_start = runs['fy'].map(_fy_start)
+    month    = runs['period'].map(_fiscal_month)
+    if by == 'year':
+        runs['Period'], runs['_order'] = runs['fy'].astype(str), fy_start * 100
+    elif by == 'quarter':
+        q = month // 3 + 1
+        runs['Period'] = np.where(month.notna(), runs['fy'].astype(str) + ' Q' + q.astype('Int64').astype(str),
+                                  runs['fy'].astype(str) + ' | ' + runs['period'].astype(str))
+        runs['_order'] = fy_start * 100 + q.fillna(99)
+    else:
+        runs['Period'] = runs['fy'].astype(str) + ' | ' + runs['period'].astype(str)
+        runs['_order'] = [period_sort_key(f, p) for f, p in zip(runs['fy'], runs['period'])]
+
+    _ensure_rollups(runs['id'])
+    issues = _vendor_issues(runs['id']).merge(
+        runs[['id', 'Period', '_order']], left_on='recon_id', right_on='id')
+    trend = (issues.groupby(['_order', 'Period', 'GSTIN'], as_index=False)
+                   .agg(**{'Name of Party': ('party', 'last'),
+                           'issue_count': ('issue_count', 'sum'),
+                           'itc_value': ('itc_value', 'sum')}))
+    return trend.sort_values(['_order', 'issue_count'], ascending=[True, False]) \
+                .drop(columns='_order').reset_index(drop=True)
@@ -0,0 +1,356 @@
+# modules/db_maintenance.py  — v1.0
+# Retention, archival and compaction for recon_history.db
+#   - Per-client retention: keep the latest N periods hot (default
+#     DEFAULT_KEEP_PERIODS), older runs move to one archive file per FY under
+#     GST_Clients_Data/_archive — results as zstd Parquet, plus their audit log
+#     and follow-ups. Archived runs stay listed (archived_runs) and can be
+#     opened read-only or brought back into history on demand
+#   - Compaction: incremental VACUUM (the DB is switched to auto_vacuum=
+#     INCREMENTAL once) and ANALYZE, followed by a WAL checkpoint
+#   - Safe with the app open: every run is copied to its archive and committed
+#     before it is removed from the hot DB, one short transaction per run
+#   - run_maintenance() returns a report: sizes before / after, time per step
+#   - On a shared PostgreSQL backend runs are not archived: the archive files
+#     are local to one desk, so other desks could list a run but never restore
+#     it. Retention is reported but not applied; compaction is left to the
+#     server's autovacuum (ANALYZE only)
+
+import datetime
+import io
+import json
+import os
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+from .db_handler import (backend, connection, transaction, wait_for_writes, checkpoint,
+                         load_reconciliation, delete_reconciliation, save_reconciliation,
+                         save_cdnr_to_history, log_action, period_sort_key, rebuild_search_index)
+from .columnar import arrow_available, frame_to_parquet, parquet_to_frame
+from .file_manager import BASE_DIR
+
+ARCHIVE_DIR          = os.path.join(BASE_DIR, "_archive")
+DEFAULT_KEEP_PERIODS = 24
+
+
+def _ensure_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS retention_policies (
+            company_name    TEXT NOT NULL,
+            gstin           TEXT NOT NULL,
+            keep_periods    INTEGER NOT NULL,
+            PRIMARY KEY (company_name, gstin)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_runs (
+            archive_file    TEXT NOT NULL,
+            recon_id        INTEGER NOT NULL,
+            company_name    TEXT,
+            gstin           TEXT,
+            fy              TEXT,
+            period          TEXT,
+            timestamp       DATETIME,
+            archived_at     DATETIME,
+            PRIMARY KEY (archive_file, recon_id)
+        )
+    ''')
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# RETENTION POLICIES
+# ══════════════════════════════════════════════════════════════════════════════
+
+def set_retention_policy(company_name, gstin, keep_periods):
+    """keep_periods=None removes the client's override (back to the default)."""
+    key = (str(company_name or '').strip(), str(gstin or '').strip())
+    with transaction() as conn:
+        _ensure_tables(conn)
+        if keep_periods is None:
+            conn.execute("DELETE FROM retention_policies WHERE company_name=? AND gstin=?", key)
+        else:
+            conn.execute("INSERT INTO retention_policies VALUES (?,?,?) "
+                         "ON CONFLICT (company_name, gstin) DO UPDATE SET keep_periods = excluded.keep_periods",
+                         key + (int(keep_periods),))
+
+
+def get_retention_policies():
+    with transaction() as conn:
+        _ensure_tables(conn)
+        return pd.read_sql("SELECT company_name, gstin, keep_periods FROM retention_policies "
+                           "ORDER BY company_name", conn)
+
+
+def runs_due_for_archive(default_keep=DEFAULT_KEEP_PERIODS):
+    """
+    History runs outside their client's retention window. Periods are ordered
+    chronologically (FY, then fiscal month); every run of an older period is
+    due, including re-saves of it.
+    """
+    with transaction() as conn:
+        _ensure_tables(conn)
+        runs = pd.read_sql("SELECT id, company_name, gstin, fy, period, timestamp FROM history", conn)
+        policies = {(r[0], r[1]): r[2] for r in conn.execute(
+            "SELECT company_name, gstin, keep_periods FROM retention_policies")}
+    if runs.empty:
+        return runs
+    runs['_client_name']  = runs['company_name'].fillna('').astype(str).str.strip()
+    runs['_client_gstin'] = runs['gstin'].fillna('').astype(str).str.strip()
+
+    due = []
+    for (name, gstin), grp in runs.groupby(['_client_name', '_client_gstin']):
+        keep = policies.get((name, gstin), default_keep)
+        periods = (grp[['fy', 'period']].drop_duplicates()
+                   .assign(_key=lambda p: [period_sort_key(f, q) for f, q in zip(p['fy'], p['period'])])
+                   .sort_values('_key', ascending=False))
+        old = periods.iloc[keep:]
+        if old.empty:
+            continue
+        due.append(grp.merge(old[['fy', 'period']], on=['fy', 'period']))
+    if not due:
+        return runs.iloc[0:0].drop(columns=['_client_name', '_client_gstin'])
+    return pd.concat(due, ignore_index=True).drop(columns=['_client_name', '_client_gstin'])
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# PER-FY ARCHIVES
+# ══════════════════════════════════════════════════════════════════════════════
+
+def archiving_supported():
+    """Per-FY archive files only make sense next to a local SQLite history."""
+    return backend().name == 'sqlite'
+
+
+def archive_path(fy):
+    slug = re.sub(r'[^0-9A-Za-z]+', '-', str(fy or '')).strip('-') or 'unknown'
+    return os.path.join(ARCHIVE_DIR, f"recon_archive_FY_{slug}.db")
+
+
+def _open_archive(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arc = sqlite3.connect(path, timeout=30)
+    arc.execute('''
+        CREATE TABLE IF NOT EXISTS history (
+            id                INTEGER PRIMARY KEY,
+            gstin             TEXT,
+            company_name      TEXT,
+            fy                TEXT,
+            period            TEXT,
+            timestamp         DATETIME,
+            b2b_summary_json  TEXT,
+            cdnr_summary_json TEXT,
+            data_parquet      BLOB,
+            cdnr_parquet      BLOB,
+            data_json         TEXT,
+            cdnr_json         TEXT,
+            archived_at       DATETIME
+        )
+    ''')
+    arc.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            recon_id INTEGER, timestamp DATETIME, action_type TEXT, details TEXT
+        )
+    ''')
+    arc.execute('''
+        CREATE TABLE IF NOT EXISTS vendor_followups (
+            recon_id INTEGER, vendor_name TEXT, gstin TEXT, notice_sent_date TEXT, status TEXT,
+            notes TEXT, issue_count INTEGER, itc_at_risk REAL, last_updated DATETIME
+        )
+    ''')
+    return arc
+
+
+def _frame_columns(df):
+    """(parquet_blob, json_text) for an archived result frame."""
+    if df is None:
+        return None, None
+    if arrow_available():
+        return sqlite3.Binary(frame_to_parquet(df)), None
+    return None, df.to_json(orient='split', date_format='iso')
+
+
+def _frame_from(blob, text):
+    if blob is not None and arrow_available():
+        return parquet_to_frame(bytes(blob))
+    if text:
+        return pd.read_json(io.StringIO(text), orient='split')
+    return None
+
+
+def archive_run(record_id):
+    """Copies one run into its FY archive, then removes it from the hot DB. Returns the archive path."""
+    if not archiving_supported():
+        raise RuntimeError("runs on a shared PostgreSQL database are not archived to local files")
+    wait_for_writes()
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT gstin, company_name, fy, period, timestamp, b2b_summary_json, cdnr_summary_json "
+            "FROM history WHERE id=?", (record_id,)).fetchone()
+        if not row:
+            return None
+        audit = conn.execute("SELECT recon_id, timestamp, action_type, details FROM audit_log "
+                             "WHERE recon_id=?", (record_id,)).fetchall()
+        followups = conn.execute(
+            "SELECT recon_id, vendor_name, gstin, notice_sent_date, status, notes, issue_count, "
+            "itc_at_risk, last_updated FROM vendor_followups WHERE recon_id=?", (record_id,)).fetchall()
+    gstin, company_name, fy, period, ts, b2b_summary, cdnr_summary = row
+    _, df_b2b, df_cdnr, _ = load_reconciliation(record_id)
+    data_blob, data_json = _frame_columns(df_b2b)
+    cdnr_blob, cdnr_json = _frame_columns(df_cdnr)
+    now = datetime.datetime.now().isoformat()
+
+    path = archive_path(fy)
+    arc = _open_archive(path)
+    try:
+        with arc:
+            arc.execute("DELETE FROM audit_log        WHERE recon_id=?", (record_id,))
+            arc.execute("DELETE FROM vendor_followups WHERE recon_id=?", (record_id,))
+            arc.execute("INSERT OR REPLACE INTO history VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                        (record_id, gstin, company_name, fy, period, ts, b2b_summary, cdnr_summary,
+                         data_blob, cdnr_blob, data_json, cdnr_json, now))
+            arc.executemany("INSERT INTO audit_log VALUES (?,?,?,?)", audit)
+            arc.executemany("INSERT INTO vendor_followups VALUES (?,?,?,?,?,?,?,?,?)", followups)
+    finally:
+        arc.close()
+
+    with transaction() as conn:
+        _ensure_tables(conn)
+        conn.execute('''
+            INSERT INTO archived_runs VALUES (?,?,?,?,?,?,?,?)
+            ON CONFLICT (archive_file, recon_id) DO UPDATE SET
+                company_name = excluded.company_name, gstin = excluded.gstin,
+                fy = excluded.fy, period = excluded.period,
+                timestamp = excluded.timestamp, archived_at = excluded.archived_at
+        ''', (os.path.basename(path), record_id, company_name, gstin, fy, period, ts, now))
+        conn.execute("DELETE FROM vendor_followups WHERE recon_id=?", (record_id,))
+        delete_reconciliation(record_id)
+    return path
+
+
+def get_archived_runs():
+    with transaction() as conn:
+        _ensure_tables(conn)
+        return pd.read_sql("SELECT * FROM archived_runs ORDER BY fy DESC, company_name, recon_id DESC",
+                           conn)
+
+
+def load_archived_reconciliation(archive_file, record_id):
+    """Read-only open of an archived run — same shape as load_reconciliation()."""
+    path = os.path.join(ARCHIVE_DIR, os.path.basename(archive_file))
+    if not os.path.isfile(path):
+        return None, None, None, None
+    arc = sqlite3.connect(path)
+    try:
+        row = arc.execute(
+            "SELECT gstin, company_name, fy, period, data_parquet, data_json, cdnr_parquet, "
+            "cdnr_json, cdnr_summary_json FROM history WHERE id=?", (record_id,)).fetchone()
+    finally:
+        arc.close()
+    if not row:
+        return None, None, None, None
+    meta = {'gstin': row[0], 'company_name': row[1], 'fy': row[2], 'period': row[3]}
+    df_b2b = _frame_from(row[4], row[5])
+    df_cdnr = _frame_from(row[6], row[7])
+    cdnr_summary = json.loads(row[8]) if row[8] else None
+    return meta, (df_b2b if df_b2b is not None else pd.DataFrame()), df_cdnr, cdnr_summary
+
+
+def restore_archived_run(archive_file, record_id):
+    """Brings an archived run back into history (as a new run). Returns its new id."""
+    meta, df_b2b, df_cdnr, cdnr_summary = load_archived_reconciliation(archive_file, record_id)
+    if meta is None:
+        return None
+    new_id = save_reconciliation({'gstin': meta['gstin'], 'name': meta['company_name'],
+                                  'fy': meta['fy'], 'period': meta['period']}, df_b2b)
+    if df_cdnr is not None:
+        save_cdnr_to_history(new_id, df_cdnr, cdnr_summary or {})
+    log_action(new_id, "RESTORED_FROM_ARCHIVE", {'archive': os.path.basename(archive_file),
+                                                 'archived_id': int(record_id)})
+    with transaction() as conn:
+        conn.execute("DELETE FROM archived_runs WHERE archive_file=? AND recon_id=?",
+                     (os.path.basename(archive_file), record_id))
+    return new_id
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# COMPACTION
+# ══════════════════════════════════════════════════════════════════════════════
+
+def db_size_bytes():
+    """Main file + WAL on disk (server-reported size on Postgres)."""
+    with connection() as conn:
+        return backend().size_bytes(conn)
+
+
+def _free_pages():
+    with connection() as conn:
+        return backend().free_pages(conn)
+
+
+def compact(max_pages=0):
+    """
+    Returns free pages to the OS. The first call switches the DB to
+    auto_vacuum=INCREMENTAL, which needs one full VACUUM; afterwards only the
+    free list is truncated (max_pages=0 → all of it). Then ANALYZE.
+    """
+    wait_for_writes()
+    with connection() as conn:
+        conn.commit()
+        if backend().name != 'sqlite':
+            conn.execute("ANALYZE")
+            return
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            rebuild_search_index()      # a full VACUUM may renumber recon_rows' rowids
+        else:
+            conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+        conn.execute("ANALYZE")
+        conn.commit()
+        checkpoint()
+
+
+def run_maintenance(default_keep=DEFAULT_KEEP_PERIODS, archive=True, vacuum=True):
+    """
+    Archive runs outside retention, then compact. Returns a report dict:
+    archived, archive_files, errors, size_before, size_after, free_pages_before,
+    free_pages_after, steps [(name, seconds)], seconds.
+    """
+    t0 = time.time()
+    report = {
+        'archived': 0, 'archive_files': [], 'errors': [],
+        'size_before': db_size_bytes(),
+        'free_pages_before': _free_pages(),
+        'steps': [],
+    }
+
+    if archive and not archiving_supported():
+        report['errors'].append("archive: skipped — runs on a shared PostgreSQL database stay "
+                                "on the server (local archive files could not be restored "
+                                "from other desks)")
+    elif archive:
+        t = time.time()
+        files = set()
+        for record_id in runs_due_for_archive(default_keep)['id']:
+            try:
+                files.add(os.path.basename(archive_run(int(record_id))))
+                report['archived'] += 1
+            except Exception as e:
+                report['errors'].append(f"run {record_id}: {e}")
+        report['archive_files'] = sorted(files)
+        report['steps'].append(('archive', round(time.time() - t, 2)))
+
+    if vacuum:
+        t = time.time()
+        try:
+            compact()
+        except backend().OperationalError as e:   # e.g. another session mid-write — retry next time
+            report['errors'].append(f"vacuum: {e}")
+        report['steps'].append(('vacuum + analyze', round(time.time() - t, 2)))
+
+    report['size_after']       = db_size_bytes()
+    report['free_pages_after'] = _free_pages()
+    report['seconds']          = round(time.time() - t0, 2)
+    return report
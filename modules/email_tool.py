@@ -2,7 +2,7 @@
 
 import pandas as pd
 
-ISSUE_MASK = 'Not in|Mismatch|Suggestion|Manual|Tax Error'
+from .status_codes import Flag, ISSUE, has_flag
 
 STATUS_MSG = {
     "Invoices Not in GSTR-2B": {
@@ -84,7 +84,7 @@ def _get_msg(status, key):
     return STATUS_MSG["DEFAULT"][key]
 
 def get_vendors_with_issues(df):
-    issue_mask = df['Recon_Status'].str.contains(ISSUE_MASK, na=False)
+    issue_mask = has_flag(df['Recon_Status'], ISSUE)
     vendors = df[issue_mask]['Name of Party'].unique().tolist()
     return sorted([v for v in vendors if v and str(v) != 'nan'])
 
@@ -147,7 +147,7 @@ def _get_row_data(row):
 def generate_email_draft(df, vendor_name, company_name):
     vendor_df = df[
         (df['Name of Party'] == vendor_name) &
-        df['Recon_Status'].str.contains(ISSUE_MASK, na=False)
+        has_flag(df['Recon_Status'], ISSUE)
     ].copy()
 
     if vendor_df.empty:
@@ -197,7 +197,7 @@ def generate_email_draft(df, vendor_name, company_name):
 def generate_whatsapp_message(df, vendor_name, company_name):
     vendor_df = df[
         (df['Name of Party'] == vendor_name) &
-        df['Recon_Status'].str.contains(ISSUE_MASK, na=False)
+        has_flag(df['Recon_Status'], ISSUE)
     ].copy()
 
     if vendor_df.empty:
@@ -297,7 +297,7 @@ def generate_notice_content(df, vendor_name, company_name):
     """Plain-text formal notice for letterhead use"""
     vendor_df = df[
         (df['Name of Party'] == vendor_name) &
-        df['Recon_Status'].str.contains(ISSUE_MASK, na=False)
+        has_flag(df['Recon_Status'], ISSUE)
     ].copy()
 
     if vendor_df.empty:
@@ -334,8 +334,8 @@ def generate_notice_content(df, vendor_name, company_name):
 # ══════════════════════════════════════════════════════════════════════════════
 
 _CAT_STATUS = {
-    'not_in_2b':    'Invoices Not in GSTR-2B',
-    'not_in_books': 'Invoices Not in Purchase Books',
+    'not_in_2b':    Flag.NOT_IN_2B,         # 'Invoices Not in GSTR-2B'
+    'not_in_books': Flag.NOT_IN_BOOKS,      # 'Invoices Not in Purchase Books'
 }
 
 _CAT_TEMPLATES = {
@@ -411,7 +411,7 @@ def generate_targeted_notice(df, vendor_name, company_name, category='not_in_2b'
 
     vendor_df = df[
         (df['Name of Party'] == vendor_name) &
-        df['Recon_Status'].str.contains(status_filter.replace('(','\\(').replace(')','\\)'), na=False, regex=True)
+        has_flag(df['Recon_Status'], status_filter)
     ].copy()
 
     if vendor_df.empty:
@@ -463,12 +463,10 @@ def generate_targeted_notice(df, vendor_name, company_name, category='not_in_2b'
 
 def get_vendors_by_category(df, category='not_in_2b'):
     """Return sorted list of vendors who have issues in the given category only."""
-    status_filter = _CAT_STATUS.get(category, '')
+    status_filter = _CAT_STATUS.get(category, 0)
     if not status_filter:
         return []
-    mask = df['Recon_Status'].str.contains(
-        status_filter.replace('(','\\(').replace(')','\\)'), na=False, regex=True
-    )
+    mask = has_flag(df['Recon_Status'], status_filter)
     vendors = df[mask]['Name of Party'].dropna().unique().tolist()
     return sorted([v for v in vendors if v and str(v) != 'nan'])
 
@@ -535,7 +533,7 @@ def generate_whatsapp_message_multilang(df, vendor_name, company_name, lang='hi'
 
     vendor_df = df[
         (df['Name of Party'] == vendor_name) &
-        df['Recon_Status'].str.contains(ISSUE_MASK, na=False)
+        has_flag(df['Recon_Status'], ISSUE)
     ].copy()
 
     if vendor_df.empty:
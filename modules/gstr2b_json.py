@@ -0,0 +1,266 @@
+# modules/gstr2b_json.py  — v1.0
+# GSTR-2B JSON (portal download) → the same frames the Excel readers return.
+#   - b2b    → load_data_preview layout (FIXED_GST_MAPPING column names)
+#   - b2ba   → smart_read_b2ba layout   (OLD_INV_NO / NEW_* columns)
+#   - cdnr   → read_raw_cdnr_2b layout
+#   - cdnra  → read_raw_cdnra layout    (revised notes + original refs)
+# Suppliers are streamed one at a time with ijson when it is installed, and
+# their nested inv / nt / items arrays are flattened straight into columns.
+# Without ijson the file is parsed with json.load (fine for monthly files).
+
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import ijson                      # optional streaming parser
+except ImportError:
+    ijson = None
+
+SECTIONS = ('b2b', 'b2ba', 'cdnr', 'cdnra')
+
+_INV_TYPE = {'R': 'Regular', 'SEWP': 'SEZ supplies with payment',
+             'SEWOP': 'SEZ supplies without payment', 'DE': 'Deemed Exp',
+             'CBW': 'Intra-State supplies attracting IGST'}
+_YES_NO   = {'Y': 'Yes', 'N': 'No', 'T': 'Temporary'}
+_NOTE_TYPE = {'C': 'credit note', 'D': 'debit note'}
+_MONTHS   = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+             'August', 'September', 'October', 'November', 'December']
+
+B2B_COLUMNS = [
+    'GSTIN', 'Name of Party', 'Invoice number', 'Invoice type', 'Invoice Date',
+    'Invoice Value(₹)', 'Place of supply', 'Supply Attract Reverse Charge',
+    'Taxable Value (₹)', 'Integrated Tax(₹)', 'Central Tax(₹)', 'State/UT Tax(₹)',
+    'Cess(₹)', 'GSTR-1/IFF/GSTR-5 Period', 'GSTR-1/IFF/GSTR-5 Filing Date',
+    'ITC Availability', 'Reason', 'Applicable % of Tax Rate',
+]
+B2BA_COLUMNS = [
+    'OLD_INV_NO', 'OLD_DATE', 'GSTIN', 'Name of Party', 'NEW_INV_NO', 'NEW_DATE',
+    'NEW_TAXABLE', 'NEW_IGST', 'NEW_CGST', 'NEW_SGST',
+]
+CDNR_COLUMNS = [
+    'GSTIN', 'Trade Name', 'Note Number', 'Note Type', 'Note Date',
+    'Taxable Value', 'IGST', 'CGST', 'SGST', 'Cess',
+]
+
+
+# ────────────────────────────────────────────────────────────
+# DETECTION
+# ────────────────────────────────────────────────────────────
+
+def is_json_upload(file_obj):
+    """True when the upload is a JSON document (by name, else by first byte)."""
+    name = str(getattr(file_obj, 'name', '')).lower()
+    if name.endswith('.json'):
+        return True
+    if name.endswith(('.xlsx', '.xlsm', '.xls', '.csv')):
+        return False
+    file_obj.seek(0)
+    head = file_obj.read(64)
+    file_obj.seek(0)
+    if isinstance(head, bytes):
+        head = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+        return head[:1] in (b'{', b'[')
+    return head.lstrip()[:1] in ('{', '[')
+
+
+# ────────────────────────────────────────────────────────────
+# STREAMING
+# ────────────────────────────────────────────────────────────
+
+def _docdata_prefix(file_obj):
+    """'data.docdata' for the portal envelope, 'docdata' for a bare payload."""
+    file_obj.seek(0)
+    for prefix, event, value in ijson.parse(file_obj):
+        if prefix == '' and event == 'map_key' and value in ('data', 'docdata'):
+            return 'data.docdata' if value == 'data' else 'docdata'
+    return 'data.docdata'
+
+def _iter_suppliers(file_obj, section):
+    """Yields one supplier dict (ctin, trdnm, inv/nt …) at a time."""
+    file_obj.seek(0)
+    if ijson is None:
+        root = json.load(file_obj)
+        data = root.get('data', root)
+        yield from (data.get('docdata', {}).get(section) or [])
+        return
+    prefix = _docdata_prefix(file_obj)
+    file_obj.seek(0)
+    yield from ijson.items(file_obj, f'{prefix}.{section}.item', use_float=True)
+
+def read_gstr2b_meta(file_obj):
+    """Returns {'gstin', 'rtnprd', 'fy', 'period'} from the JSON header fields."""
+    meta = {}
+    file_obj.seek(0)
+    if ijson is None:
+        root = json.load(file_obj)
+        data = root.get('data', root)
+        meta = {k: data.get(k) for k in ('gstin', 'rtnprd')}
+    else:
+        for prefix, event, value in ijson.parse(file_obj):
+            key = prefix.rsplit('.', 1)[-1]
+            if prefix in ('gstin', 'rtnprd', 'data.gstin', 'data.rtnprd') and event == 'string':
+                meta[key] = value
+                if len(meta) == 2:
+                    break
+    file_obj.seek(0)
+
+    rtnprd = str(meta.get('rtnprd') or '')
+    if len(rtnprd) == 6 and rtnprd.isdigit():
+        month, year = int(rtnprd[:2]), int(rtnprd[2:])
+        start = year if month >= 4 else year - 1
+        meta['fy']     = f"{start}-{str(start + 1)[-2:]}"
+        meta['period'] = _MONTHS[month - 1] if 1 <= month <= 12 else None
+    return meta
+
+
+# ────────────────────────────────────────────────────────────
+# FLATTENING
+# ────────────────────────────────────────────────────────────
+
+def _totals(doc):
+    """Document-level tax totals; summed from items[] when the portal omits them."""
+    if 'txval' in doc:
+        return tuple(float(doc.get(k) or 0) for k in ('txval', 'igst', 'cgst', 'sgst', 'cess'))
+    tot = [0.0] * 5
+    for it in doc.get('items') or []:
+        for i, k in enumerate(('txval', 'igst', 'cgst', 'sgst', 'cess')):
+            tot[i] += float(it.get(k) or 0)
+    return tuple(tot)
+
+def _rate(doc):
+    rates = sorted({it.get('rt') for it in doc.get('items') or [] if it.get('rt') is not None})
+    return ", ".join(f"{r:g}" for r in rates) if rates else None
+
+def _dates(values):
+    return pd.to_datetime(pd.Series(values, dtype=object), format='%d-%m-%Y', errors='coerce')
+
+def _money(values):
+    return pd.Series(values, dtype='float64').round(2)
+
+
+def _flatten_b2b(file_obj):
+    cols = {c: [] for c in B2B_COLUMNS}
+    for sup in _iter_suppliers(file_obj, 'b2b'):
+        ctin, trdnm = sup.get('ctin'), sup.get('trdnm')
+        prd, fil    = sup.get('supprd'), sup.get('supfildt')
+        for inv in sup.get('inv') or []:
+            tx = _totals(inv)
+            cols['GSTIN'].append(ctin)
+            cols['Name of Party'].append(trdnm)
+            cols['Invoice number'].append(inv.get('inum'))
+            cols['Invoice type'].append(_INV_TYPE.get(inv.get('typ'), inv.get('typ')))
+            cols['Invoice Date'].append(inv.get('dt'))
+            cols['Invoice Value(₹)'].append(inv.get('val'))
+            cols['Place of supply'].append(inv.get('pos'))
+            cols['Supply Attract Reverse Charge'].append(_YES_NO.get(inv.get('rev'), inv.get('rev')))
+            cols['Taxable Value (₹)'].append(tx[0])
+            cols['Integrated Tax(₹)'].append(tx[1])
+            cols['Central Tax(₹)'].append(tx[2])
+            cols['State/UT Tax(₹)'].append(tx[3])
+            cols['Cess(₹)'].append(tx[4])
+            cols['GSTR-1/IFF/GSTR-5 Period'].append(prd)
+            cols['GSTR-1/IFF/GSTR-5 Filing Date'].append(fil)
+            cols['ITC Availability'].append(_YES_NO.get(inv.get('itcavl'), inv.get('itcavl')))
+            cols['Reason'].append(inv.get('rsn'))
+            cols['Applicable % of Tax Rate'].append(_rate(inv))
+
+    df = pd.DataFrame({c: pd.Series(v, dtype=object) for c, v in cols.items()}, columns=B2B_COLUMNS)
+    df['Invoice Date'] = _dates(cols['Invoice Date'])
+    for c in ('Invoice Value(₹)', 'Taxable Value (₹)', 'Integrated Tax(₹)',
+              'Central Tax(₹)', 'State/UT Tax(₹)', 'Cess(₹)'):
+        df[c] = _money(cols[c])
+    df = df.infer_objects()
+    df.attrs['sheet_name'] = 'B2B'
+    df.attrs['header_idx'] = 0
+    return df
+
+
+def _flatten_b2ba(file_obj):
+    cols = {c: [] for c in B2BA_COLUMNS}
+    for sup in _iter_suppliers(file_obj, 'b2ba'):
+        ctin, trdnm = sup.get('ctin'), sup.get('trdnm')
+        for inv in sup.get('inv') or []:
+            tx = _totals(inv)
+            cols['OLD_INV_NO'].append(inv.get('oinum'))
+            cols['OLD_DATE'].append(inv.get('oidt'))
+            cols['GSTIN'].append(ctin)
+            cols['Name of Party'].append(trdnm or 'Amendment')
+            cols['NEW_INV_NO'].append(inv.get('inum'))
+            cols['NEW_DATE'].append(inv.get('dt'))
+            cols['NEW_TAXABLE'].append(tx[0])
+            cols['NEW_IGST'].append(tx[1])
+            cols['NEW_CGST'].append(tx[2])
+            cols['NEW_SGST'].append(tx[3])
+
+    df = pd.DataFrame({c: pd.Series(v, dtype=object) for c, v in cols.items()}, columns=B2BA_COLUMNS)
+    df['OLD_DATE'] = _dates(cols['OLD_DATE'])
+    df['NEW_DATE'] = _dates(cols['NEW_DATE'])
+    for c in ('NEW_TAXABLE', 'NEW_IGST', 'NEW_CGST', 'NEW_SGST'):
+        df[c] = _money(cols[c]).fillna(0.0)
+    df = df.dropna(subset=['GSTIN', 'OLD_INV_NO']).reset_index(drop=True)
+    return df.infer_objects()
+
+
+def _flatten_notes(file_obj, section):
+    """CDNR / CDNRA notes. Returns (notes_df, original_refs) — refs only for cdnra."""
+    cols = {c: [] for c in CDNR_COLUMNS}
+    orig_gstin, orig_note = [], []
+    for sup in _iter_suppliers(file_obj, section):
+        ctin  = str(sup.get('ctin') or '').strip().upper()
+        trdnm = str(sup.get('trdnm') or '').strip()
+        for nt in sup.get('nt') or []:
+            tx = _totals(nt)
+            cols['GSTIN'].append(ctin)
+            cols['Trade Name'].append(trdnm)
+            cols['Note Number'].append(str(nt.get('ntnum') or '').strip())
+            cols['Note Type'].append(_NOTE_TYPE.get(str(nt.get('typ') or '').upper(), ''))
+            cols['Note Date'].append(nt.get('dt'))
+            for c, v in zip(('Taxable Value', 'IGST', 'CGST', 'SGST', 'Cess'), tx):
+                cols[c].append(v)
+            if section == 'cdnra':
+                orig_gstin.append(ctin)
+                orig_note.append(str(nt.get('ontnum') or '').strip())
+
+    df = pd.DataFrame({c: pd.Series(v, dtype=object) for c, v in cols.items()}, columns=CDNR_COLUMNS)
+    df['Note Date'] = _dates(cols['Note Date']).dt.normalize()
+    for c in ('Taxable Value', 'IGST', 'CGST', 'SGST', 'Cess'):
+        # Same sign handling as cdnr_processor._f — notes are matched on abs()
+        df[c] = np.abs(_money(cols[c]).fillna(0.0))
+    df = df.infer_objects()
+    orig = pd.DataFrame({'GSTIN': orig_gstin, 'Orig_Note': orig_note})
+    df = df[df['GSTIN'].str.len() == 15].reset_index(drop=True)
+    return df, orig
+
+
+# ────────────────────────────────────────────────────────────
+# PUBLIC READERS
+# ────────────────────────────────────────────────────────────
+
+def read_gstr2b_json(file_obj, sections=SECTIONS):
+    """
+    Reads the requested sections into canonical frames.
+    Returns a dict: b2b, b2ba, cdnr → DataFrame; cdnra → (revised_df, orig_refs).
+    """
+    out = {}
+    for section in sections:
+        if section == 'b2b':
+            out['b2b'] = _flatten_b2b(file_obj)
+        elif section == 'b2ba':
+            out['b2ba'] = _flatten_b2ba(file_obj)
+        elif section == 'cdnr':
+            out['cdnr'] = _flatten_notes(file_obj, 'cdnr')[0]
+        elif section == 'cdnra':
+            out['cdnra'] = _flatten_notes(file_obj, 'cdnra')
+    file_obj.seek(0)
+    return out
+
+def json_has_section(file_obj, section):
+    """Cheap check: stops at the first supplier of `section`."""
+    try:
+        found = next(iter(_iter_suppliers(file_obj, section)), None) is not None
+    except Exception:
+        found = False
+    file_obj.seek(0)
+    return found
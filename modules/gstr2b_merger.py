@@ -0,0 +1,430 @@
+# modules/gstr2b_merger.py  — v1.1
+# Streaming multi-month GSTR-2B merger (NIC Excel format)
+#   - Inputs are read with openpyxl read_only + iter_rows(values_only=True);
+#     one sheet of one file is held at a time
+#   - Duplicates (GSTIN + Invoice/Note No + Date) are dropped with a vectorised
+#     pandas key instead of a per-row Python set lookup
+#   - Output goes through xlsxwriter constant_memory: rows are flushed to disk
+#     as they are written
+#   - Header rows are captured once from the first file as a style spec
+#     (values + formats from xlsx_formats' cache + merges + widths) and
+#     replayed, instead of copying fonts / fills / borders cell by cell
+#   - merge_gstr2b_frames hands deduplicated B2B / B2BA / CDNR frames straight
+#     to reconciliation; the merged xlsx is optional and built on a worker
+#     thread (start_merge_xlsx)
+
+import datetime
+import io
+import itertools
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import openpyxl
+import pandas as pd
+import xlsxwriter
+from openpyxl.utils.cell import range_boundaries
+
+from .cdnr_processor import cdnr_2b_from_raw
+from .data_utils import extract_meta_from_readme, finish_preview
+from .pre_processor import b2ba_from_raw
+from .sheet_reader import positional_frame, read_rows_with_header
+from .xlsx_formats import format_cache
+
+# NIC GSTR-2B: row number where actual data starts (everything before = header template)
+DATA_START = {
+    'B2B': 7, 'B2BA': 8, 'B2B-CDNR': 7, 'B2B-CDNRA': 8,
+    'IMPG': 7, 'IMPGSEZ': 7, 'ISD': 7, 'ISDA': 8,
+    'ECOMM': 7, 'ECOMMA': 8,
+    'B2B(REJECTED)': 7, 'B2BA(REJECTED)': 8,
+    'B2B-CDNR(REJECTED)': 7, 'B2B-CDNRA(REJECTED)': 8,
+    'ECO(REJECTED)': 7, 'ECOA(REJECTED)': 8, 'ISD(REJECTED)': 7,
+}
+
+# Dedup key columns: col0=GSTIN, col2=Invoice/Note No, col4=Date
+KEY_COLS = (0, 2, 4)
+# Sheets whose GSTIN / number / date sit elsewhere
+SHEET_KEY_COLS = {
+    'B2BA':     (2, 4, 6),      # GSTIN, revised invoice no, revised date
+    'B2B-CDNR': (0, 2, 5),      # GSTIN, note no, note date
+}
+_KEY_SEP = '\x1f'
+
+_NS = {
+    'm': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+
+
+def _norm(sheet_name):
+    return sheet_name.strip().upper()
+
+def _get_sheet(sheet_names, norm_name):
+    """Find a sheet by normalised (upper) name."""
+    for s in sheet_names:
+        if _norm(s) == norm_name:
+            return s
+    return None
+
+def _upload_bytes(f):
+    if hasattr(f, 'getvalue'):
+        return f.getvalue()
+    f.seek(0)
+    data = f.read()
+    f.seek(0)
+    return data
+
+
+# ── Dedup ─────────────────────────────────────────────────────────────────────
+def encode_keys(rows, key_cols=KEY_COLS):
+    """
+    One string key per row: str(value).strip() of each key column (upper-cased
+    for GSTIN / number), joined with a unit separator. Missing values encode
+    as 'None', matching the old str(row[i]) key; rows that end before the
+    last key column (B2BA sheets, sheets without a <dimension>) are padded.
+    """
+    width = max(key_cols) + 1
+    frame = pd.DataFrame.from_records([tuple(r[:width]) + (None,) * (width - len(r))
+                                       for r in rows], columns=range(width)) \
+        if rows else pd.DataFrame(columns=range(width))
+    parts = []
+    for i, c in enumerate(key_cols):
+        s = frame[c].astype(object).astype(str).fillna('None').str.strip()
+        parts.append(s if i == len(key_cols) - 1 else s.str.upper())
+    key = parts[0]
+    for p in parts[1:]:
+        key = key + _KEY_SEP + p
+    return key
+
+def new_row_mask(keys, seen):
+    """Rows whose key is neither repeated within the batch nor in `seen`; updates `seen`."""
+    mask = ~keys.duplicated() & ~keys.isin(seen)
+    seen.update(keys[mask])
+    return mask.to_numpy()
+
+
+# ── Header template capture ───────────────────────────────────────────────────
+_BORDER_STYLES = {
+    'thin': 1, 'medium': 2, 'dashed': 3, 'dotted': 4, 'thick': 5, 'double': 6,
+    'hair': 7, 'mediumDashed': 8, 'dashDot': 9, 'mediumDashDot': 10,
+    'dashDotDot': 11, 'mediumDashDotDot': 12, 'slantDashDot': 13,
+}
+_H_ALIGN = {'left': 'left', 'center': 'center', 'right': 'right', 'fill': 'fill',
+            'justify': 'justify', 'centerContinuous': 'center_across',
+            'distributed': 'distributed'}
+_V_ALIGN = {'top': 'top', 'center': 'vcenter', 'bottom': 'bottom',
+            'justify': 'vjustify', 'distributed': 'vdistributed'}
+
+def _rgb(color):
+    rgb = getattr(color, 'rgb', None)
+    if isinstance(rgb, str) and re.fullmatch(r'[0-9A-Fa-f]{6,8}', rgb):
+        return '#' + rgb[-6:]
+    return None
+
+def _style_spec(cell):
+    """openpyxl cell style → xlsxwriter format properties (hashable tuple)."""
+    if not getattr(cell, 'has_style', False):
+        return ()
+    p = {}
+    font = cell.font
+    if font is not None:
+        if font.name:  p['font_name'] = font.name
+        if font.sz:    p['font_size'] = float(font.sz)
+        if font.b:     p['bold'] = True
+        if font.i:     p['italic'] = True
+        if font.u:     p['underline'] = 1
+        if _rgb(font.color): p['font_color'] = _rgb(font.color)
+    fill = cell.fill
+    if fill is not None and getattr(fill, 'fill_type', None) == 'solid' and _rgb(fill.fgColor):
+        p['pattern'] = 1
+        p['bg_color'] = _rgb(fill.fgColor)
+    border = cell.border
+    if border is not None:
+        for side in ('left', 'right', 'top', 'bottom'):
+            b = getattr(border, side, None)
+            if b is not None and b.style in _BORDER_STYLES:
+                p[side] = _BORDER_STYLES[b.style]
+                if _rgb(b.color): p[f'{side}_color'] = _rgb(b.color)
+    al = cell.alignment
+    if al is not None:
+        if al.horizontal in _H_ALIGN: p['align'] = _H_ALIGN[al.horizontal]
+        if al.vertical in _V_ALIGN:   p['valign'] = _V_ALIGN[al.vertical]
+        if al.wrap_text:              p['text_wrap'] = True
+        if al.shrink_to_fit:          p['shrink'] = True
+        if al.indent:                 p['indent'] = int(al.indent)
+        rot = int(al.text_rotation or 0)
+        if rot:
+            p['rotation'] = 270 if rot == 255 else (rot if rot <= 90 else 90 - rot)
+    if cell.number_format and cell.number_format != 'General':
+        p['num_format'] = cell.number_format
+    return tuple(sorted(p.items()))
+
+
+def _sheet_paths(zf):
+    """Sheet name → worksheet XML path inside the xlsx zip."""
+    wb_xml = ET.fromstring(zf.read('xl/workbook.xml'))
+    rels   = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+    targets = {r.get('Id'): r.get('Target') for r in rels.findall('rel:Relationship', _NS)}
+    paths = {}
+    for s in wb_xml.iterfind('m:sheets/m:sheet', _NS):
+        target = targets.get(s.get(f"{{{_NS['r']}}}id"), '')
+        paths[s.get('name')] = (target.lstrip('/') if target.startswith('/')
+                                else posixpath.normpath(posixpath.join('xl', target)))
+    return paths
+
+def _sheet_layout(zf, path, up_to_row):
+    """
+    Column widths, header row heights and merged ranges (within the header)
+    from the sheet XML — read_only worksheets don't expose these. Parsed with
+    iterparse and cleared as it goes, so big sheets stay cheap.
+    """
+    widths, heights, merges = {}, {}, []
+    tag = lambda t: f"{{{_NS['m']}}}{t}"
+    with zf.open(path) as fh:
+        for _, el in ET.iterparse(fh, events=('end',)):
+            if el.tag == tag('col'):
+                w = el.get('width')
+                if w:
+                    for c in range(int(el.get('min')) - 1, min(int(el.get('max')), 256)):
+                        widths[c] = float(w)
+            elif el.tag == tag('row'):
+                r, ht = int(el.get('r', 0)), el.get('ht')
+                if ht and r <= up_to_row:
+                    heights[r - 1] = float(ht)
+                el.clear()
+            elif el.tag == tag('mergeCell'):
+                ref = el.get('ref', '')
+                if ':' in ref:
+                    c1, r1, c2, r2 = range_boundaries(ref)
+                    if r1 <= up_to_row:
+                        merges.append((r1 - 1, c1 - 1, r2 - 1, c2 - 1))
+    return widths, heights, merges
+
+
+def capture_template(wb, zf, sheet_paths, sheet_name, data_start):
+    """
+    Header template for one sheet: every cell above `data_start` as
+    (value, style spec), plus merges / widths / heights.
+    data_start=None captures the whole sheet (Read Me, ITC Available …).
+    """
+    ws = wb[sheet_name]
+    last = (data_start - 1) if data_start else None
+    rows = []
+    for row in ws.iter_rows(min_row=1, max_row=last):
+        rows.append([(c.value, _style_spec(c)) for c in row])
+    up_to = last if last else len(rows)
+    widths, heights, merges = {}, {}, []
+    path = sheet_paths.get(sheet_name)
+    if path:
+        widths, heights, merges = _sheet_layout(zf, path, up_to)
+    return {'rows': rows, 'widths': widths, 'heights': heights, 'merges': merges}
+
+
+# ── Output ────────────────────────────────────────────────────────────────────
+def _format(formats, spec):
+    return formats(dict(spec)) if spec else None
+
+
+def _write_value(ws, r, c, v, fmt, formats):
+    if v is None:
+        if fmt is not None:
+            ws.write_blank(r, c, None, fmt)
+    elif isinstance(v, str):
+        ws.write_string(r, c, v, fmt)
+    elif isinstance(v, bool):
+        ws.write_boolean(r, c, v, fmt)
+    elif isinstance(v, (int, float)):
+        ws.write_number(r, c, v, fmt)
+    elif isinstance(v, (datetime.datetime, datetime.date)):
+        ws.write_datetime(r, c, v, fmt or formats(num_format='dd-mm-yyyy'))
+    else:
+        ws.write_string(r, c, str(v), fmt)
+
+
+def _replay_template(ws, template, formats):
+    for c, w in template['widths'].items():
+        ws.set_column_pixels(c, c, round(w * 7))     # XML widths already include padding
+    heights = template['heights']
+    merges_from = {}
+    for rng in template['merges']:
+        merges_from.setdefault(rng[0], []).append(rng)
+    for r, cells in enumerate(template['rows']):
+        if r in heights:
+            ws.set_row(r, heights[r])
+        for c, (value, spec) in enumerate(cells):
+            _write_value(ws, r, c, value, _format(formats, spec), formats)
+        # Register merges while their first row is still the open one
+        # (constant_memory can't go back to a flushed row). No format, so
+        # merge_range() doesn't pad the region with blanks — that would flush
+        # this row — and the cells keep the formats written above; only the
+        # top-left cell, which merge_range() rewrites, is written again.
+        for r1, c1, r2, c2 in merges_from.get(r, ()):
+            value, spec = cells[c1] if c1 < len(cells) else (None, None)
+            ws.merge_range(r1, c1, r2, c2, value)
+            _write_value(ws, r1, c1, value, _format(formats, spec), formats)
+
+
+def _open_books(uploaded_files, warn):
+    """[(file, read-only workbook)] for every upload openpyxl can open."""
+    opened = []
+    for f in uploaded_files:
+        try:
+            f.seek(0)
+            opened.append((f, openpyxl.load_workbook(f, read_only=True, data_only=True)))
+        except Exception as e:
+            if warn:
+                warn(f"⚠️ Could not open `{getattr(f, 'name', 'file')}`: {e}")
+    return opened
+
+
+def _deduped_batches(books, norm, data_start):
+    """
+    Yields the new (not yet seen) data rows of one sheet, one file at a time,
+    deduplicated across files by the sheet's GSTIN / number / date key.
+    """
+    key_cols = SHEET_KEY_COLS.get(norm, KEY_COLS)
+    seen = set()
+    for wb in books:
+        src = _get_sheet(wb.sheetnames, norm)
+        if src is None:
+            continue
+        rows = [row for row in wb[src].iter_rows(min_row=data_start, values_only=True)
+                if any(v is not None for v in row)]
+        if not rows:
+            continue
+        keep = new_row_mask(encode_keys(rows, key_cols), seen)
+        yield [row for row, k in zip(rows, keep) if k]
+
+
+def merge_gstr2b_files(uploaded_files, warn=None):
+    """
+    Merges multiple NIC-format GSTR-2B Excel files.
+    - Rows 1–(data_start-1) of the first file are the header template
+    - Data rows from all files are stacked, deduplicated by GSTIN + Invoice No + Date
+    `warn(msg)` is called for files that cannot be opened.
+    Returns (bytes, error_message).
+    """
+    opened = _open_books(uploaded_files, warn)
+    if not opened:
+        return None, "No readable GSTR-2B files."
+
+    books = [wb for _, wb in opened]
+    template_wb = books[0]
+    template_zip = zipfile.ZipFile(io.BytesIO(_upload_bytes(opened[0][0])))
+    buf = io.BytesIO()
+    out = xlsxwriter.Workbook(buf, {'constant_memory': True})
+    formats = format_cache(out)
+    try:
+        sheet_paths = _sheet_paths(template_zip)
+        # Same sheet order as the first file
+        for sheet_name in template_wb.sheetnames:
+            norm = _norm(sheet_name)
+            data_start = DATA_START.get(norm)
+            ws = out.add_worksheet(sheet_name[:31])
+            _replay_template(ws, capture_template(template_wb, template_zip, sheet_paths,
+                                                  sheet_name, data_start),
+                             formats)
+            if data_start is None:
+                continue
+
+            r = data_start - 1
+            for batch in _deduped_batches(books, norm, data_start):
+                for row in batch:
+                    for c, v in enumerate(row):
+                        _write_value(ws, r, c, v, None, formats)
+                    r += 1
+        out.close()
+    finally:
+        template_zip.close()
+        for wb in books:
+            wb.close()
+    return buf.getvalue(), None
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# DIRECT HAND-OFF — canonical frames instead of a merged xlsx round-trip
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _merged_meta(files):
+    """FY / GSTIN / name from the first file; period spans first → last month."""
+    metas = [extract_meta_from_readme(f) for f in files]
+    metas = [m for m in metas if any(m)]
+    if not metas:
+        return None, None, None, None
+    fy, period, gstin, name = metas[0]
+    last_period = metas[-1][1]
+    if period and last_period and last_period != period:
+        period = f"{period} - {last_period}"
+    return fy, period, gstin, name
+
+
+def merge_gstr2b_frames(uploaded_files, warn=None):
+    """
+    Reads the uploads once (per sheet) and returns the frames the setup stage
+    would otherwise get by re-parsing the merged workbook:
+        'b2b'   → load_data_preview layout
+        'b2ba'  → smart_read_b2ba layout   (None if no amendments)
+        'cdnr'  → read_raw_cdnr_2b layout  (None if no notes)
+        'meta'  → (fy, period, gstin, name)
+        'files' → number of files merged
+    Rows are deduplicated across months by encoded GSTIN / number / date keys.
+    Returns (frames, error_message).
+    """
+    opened = _open_books(uploaded_files, warn)
+    if not opened:
+        return None, "No readable GSTR-2B files."
+
+    books = [wb for _, wb in opened]
+    frames = {'b2b': None, 'b2ba': None, 'cdnr': None}
+    try:
+        # B2B — first file's header rows + deduped data through the same
+        # single-pass header detection the upload loader uses
+        head_wb = next((wb for wb in books if _get_sheet(wb.sheetnames, 'B2B')), None)
+        if head_wb is None:
+            return None, "No B2B sheet found in the GSTR-2B files."
+        src  = _get_sheet(head_wb.sheetnames, 'B2B')
+        head = head_wb[src].iter_rows(max_row=DATA_START['B2B'] - 1, values_only=True)
+        rows = itertools.chain(head, itertools.chain.from_iterable(
+            _deduped_batches(books, 'B2B', DATA_START['B2B'])))
+        df, header_idx = read_rows_with_header(rows)
+        frames['b2b'] = finish_preview(df, src, header_idx, head_wb.sheetnames)
+
+        for norm, name, to_frame in (('B2BA', 'b2ba', b2ba_from_raw),
+                                     ('B2B-CDNR', 'cdnr', cdnr_2b_from_raw)):
+            data = [row for batch in _deduped_batches(books, norm, DATA_START[norm])
+                    for row in batch]
+            if not data:
+                continue
+            try:
+                df = to_frame(positional_frame(data))
+            except Exception as e:
+                if warn:
+                    warn(f"⚠️ Could not build merged {norm}: {e}")
+                continue
+            frames[name] = df if df is not None and not df.empty else None
+    finally:
+        for wb in books:
+            wb.close()
+
+    frames['meta'] = _merged_meta([f for f, _ in opened])
+    frames['files'] = len(opened)
+    return frames, None
+
+
+# Workbook output runs off the UI thread; one writer at a time is plenty.
+_XLSX_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gstr2b-merge")
+
+def start_merge_xlsx(uploaded_files):
+    """
+    Snapshots the upload bytes and builds the merged workbook on a worker
+    thread. Returns a Future resolving to merge_gstr2b_files' (bytes, error).
+    """
+    copies = []
+    for f in uploaded_files:
+        b = io.BytesIO(_upload_bytes(f))
+        b.name = getattr(f, 'name', 'file')
+        copies.append(b)
+    return _XLSX_POOL.submit(merge_gstr2b_files, copies)
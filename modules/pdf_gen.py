@@ -17,6 +17,9 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os as _os
 
+from .recon_cube import build_cube
+from .status_codes import Flag, ISSUE, has_flag
+
 # Font chain: Segoe UI (₹ native) → DejaVuSans (₹ support) → Helvetica (fallback)
 _BASE_FONT = _BASE_FONT_BOLD = None
 _SEGOE_REG  = 'C:/Windows/Fonts/segoeui.ttf'
@@ -492,7 +495,7 @@ def create_vendor_pdf(df, vendor_name, company_name, gst_in_company):
     W=A4[0]-36*mm
     today=date.today().strftime('%d-%m-%Y')
 
-    issue_mask=df['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error',na=False)
+    issue_mask=has_flag(df['Recon_Status'], ISSUE)
     vendor_df=df[(df['Name of Party']==vendor_name)&issue_mask].copy()
     if vendor_df.empty:
         buffer.seek(0)
@@ -615,11 +618,12 @@ def create_vendor_pdf(df, vendor_name, company_name, gst_in_company):
 # ITC AT-RISK SUMMARY PDF  (Feature 5)
 # ══════════════════════════════════════════════════════════════════════════════
 
-def create_itc_risk_pdf(df, company_name, gstin, period, fy):
+def create_itc_risk_pdf(df, company_name, gstin, period, fy, cube=None):
     """
     Single-page ITC At-Risk summary PDF.
     ITC BLOCKED = Only 'Invoices Not in GSTR-2B' (Section 16(2)(aa)).
     Other categories shown as discrepancies but NOT counted in ITC blocked total.
+    Totals and the category breakdown come from the result's ReconCube.
     """
     buffer = io.BytesIO()
     doc    = SimpleDocTemplate(buffer, pagesize=A4,
@@ -628,12 +632,11 @@ def create_itc_risk_pdf(df, company_name, gstin, period, fy):
     W     = A4[0] - 36*mm
     today = date.today().strftime('%d-%m-%Y')
 
+    cube = cube or build_cube(df, 'Recon_Status')
+
     # ITC BLOCKED = only Not in GSTR-2B
     itc_blocked_df = df[df['Recon_Status'] == 'Invoices Not in GSTR-2B'].copy()
 
-    # All issues (for discrepancy breakdown table)
-    ISSUE_MASK = 'Not in|Mismatch|Suggestion|Manual|Tax Error'
-    issue_df   = df[df['Recon_Status'].str.contains(ISSUE_MASK, na=False)].copy()
 
     STATUS_LABELS = {
         "Invoices Not in GSTR-2B":        ("ITC BLOCKED — Missing from Portal",  ACCENT_RED),
@@ -675,7 +678,7 @@ def create_itc_risk_pdf(df, company_name, gstin, period, fy):
 
     # ── KPI row — ITC Blocked only ────────────────────────────────────────────
     total_blocked_inv     = len(itc_blocked_df)
-    total_blocked_taxable = itc_blocked_df['Final_Taxable'].sum() if 'Final_Taxable' in itc_blocked_df.columns else 0
+    total_blocked_taxable = cube.total('final', Flag.NOT_IN_2B)
     total_vendors_blocked = itc_blocked_df['Name of Party'].nunique() if not itc_blocked_df.empty else 0
 
     def kpi(label, value, color):
@@ -702,10 +705,10 @@ def create_itc_risk_pdf(df, company_name, gstin, period, fy):
 
     cat_hdr = [Paragraph(h, S("tbl_hdr")) for h in ["Issue Category", "Invoices", "Taxable Value (₹)", "ITC Impact"]]
     cat_data = [cat_hdr]
-    status_grp = issue_df.groupby('Recon_Status').agg(
-        count=('Recon_Status', 'count'),
-        taxable=('Final_Taxable', 'sum')
-    ).reset_index().sort_values('taxable', ascending=False)
+    status_grp = (cube.by_status(ISSUE)[['rows', 'final']]
+                  .rename(columns={'rows': 'count', 'final': 'taxable'})
+                  .rename_axis('Recon_Status').reset_index()
+                  .sort_values('taxable', ascending=False))
 
     for _, row in status_grp.iterrows():
         lbl, clr = STATUS_LABELS.get(row['Recon_Status'], (row['Recon_Status'][:30], MID_BLUE))
@@ -1029,8 +1032,7 @@ def create_action_report_pdf(df, company_name, gstin, period, fy):
     W     = A4[0] - 36*mm
     today = date.today().strftime('%d-%m-%Y')
 
-    ISSUE_MASK = 'Not in|Mismatch|Suggestion|Manual|Tax Error'
-    issue_df   = df[df['Recon_Status'].str.contains(ISSUE_MASK, na=False)].copy() if 'Recon_Status' in df.columns else df.copy()
+    issue_df   = df[has_flag(df['Recon_Status'], ISSUE)].copy() if 'Recon_Status' in df.columns else df.copy()
 
     elements = []
 
@@ -1137,7 +1139,7 @@ def create_action_report_pdf(df, company_name, gstin, period, fy):
         elements.append(v_hdr)
 
         # Group by status
-        for status, sdf in vdf.groupby('Recon_Status'):
+        for status, sdf in vdf.groupby('Recon_Status', observed=True):
             amap     = _ACTION_MAP.get(status, {
                 "label": status, "color": "#333333",
                 "action": "Review this item with your CA and reconcile manually."
@@ -2,6 +2,11 @@
 import pandas as pd
 import streamlit as st
 import re
+import itertools
+import numpy as np
+from .sheet_reader import is_csv_upload, list_sheets, iter_sheet_rows, positional_frame
+from .gstr2b_json import is_json_upload, read_gstr2b_json
+from .upload_cache import disk_cached
 
 def normalize_text(series):
     """
@@ -26,94 +31,145 @@ def get_col_name(df, possible_names):
                 return df.columns[i]
     return None
 
+def b2ba_from_raw(df_raw):
+    """
+    Positional B2BA data rows (columns 0..n, no header) → OLD_INV_NO / NEW_*
+    layout. Shared by smart_read_b2ba and the multi-file merger.
+    """
+    # 3. Rename Columns manually by Index (A=0, B=1, C=2, E=4...)
+    # Verify we have enough columns (At least up to Col O which is index 14)
+    if df_raw.shape[1] < 15:
+        # If sheet is cut off, we can't map taxes, but let's try mapping what we have
+        pass 
+
+    # MAPPING DICTIONARY (Based on your blue text request)
+    # A(0): OLD_INV_NO
+    # C(2): GSTIN (Shared)
+    # E(4): NEW_INV_NO
+    # G(6): NEW_DATE
+    # L(11): NEW_TAXABLE
+    # M(12): NEW_IGST
+    # N(13): NEW_CGST
+    # O(14): NEW_SGST
+    
+    rename_map = {
+        0: 'OLD_INV_NO',
+        2: 'GSTIN',
+        4: 'NEW_INV_NO',
+        6: 'NEW_DATE',
+        11: 'NEW_TAXABLE',
+        12: 'NEW_IGST',
+        13: 'NEW_CGST',
+        14: 'NEW_SGST'
+    }
+    
+    df_raw.rename(columns=rename_map, inplace=True)
+
+    # 4. Filter empty rows (Must have GSTIN and Old Inv)
+    df_raw = df_raw.dropna(subset=['GSTIN', 'OLD_INV_NO'])
+    
+    # 5. Ensure numeric columns are actually numbers (handle potential header junk)
+    num_cols = ['NEW_TAXABLE', 'NEW_IGST', 'NEW_CGST', 'NEW_SGST']
+    for c in num_cols:
+        if c in df_raw.columns:
+            df_raw[c] = pd.to_numeric(df_raw[c], errors='coerce').fillna(0.0)
+
+    # Try to find Name (Trade/Legal name) - usually Col D (Index 3)
+    if 3 in df_raw.columns:
+        df_raw.rename(columns={3: 'Name of Party'}, inplace=True)
+    else:
+        df_raw['Name of Party'] = 'Amendment'
+
+    return df_raw
+
+@disk_cached('b2ba')
 def smart_read_b2ba(file_obj):
     """
     Reads B2BA sheet using STRICT POSITIONAL MAPPING based on user layout.
     Original: Col A (Inv), Col B (Date), Col C (GSTIN)
     Revised:  Col E (Inv), Col G (Date), Col L (Taxable), M, N, O (Taxes)
     """
+    if is_json_upload(file_obj):
+        df_json = read_gstr2b_json(file_obj, ('b2ba',))['b2ba']
+        return (df_json, "Success") if not df_json.empty else (None, "No B2BA sheet found.")
+    if is_csv_upload(file_obj):
+        return None, "No B2BA sheet found."
     try:
-        xls = pd.ExcelFile(file_obj)
         # Find sheet name containing 'b2ba'
-        sheet_name = next((s for s in xls.sheet_names if 'b2ba' in s.lower()), None)
+        sheet_name = next((s for s in list_sheets(file_obj) if 'b2ba' in s.lower()), None)
         if not sheet_name: return None, "No B2BA sheet found."
 
-        # 1. Find Header Row (Anchor: "Original Details")
-        df_scan = pd.read_excel(file_obj, sheet_name=sheet_name, header=None, nrows=20)
-        anchor_idx = -1
-        for idx, row in df_scan.iterrows():
-            row_str = " ".join([str(x) for x in row.values])
+        # Single streaming read: scan for the header anchor ("Original Details"),
+        # skip the column-header row below it, positional data from there on.
+        rows = iter_sheet_rows(file_obj, sheet_name)
+        anchor_found = False
+        for row in itertools.islice(rows, 20):
+            row_str = " ".join([str(x) for x in row])
             if "Original Details" in row_str:
-                anchor_idx = idx
+                anchor_found = True
                 break
         
-        if anchor_idx == -1: return None, "Critical: 'Original Details' header not found."
+        if not anchor_found: return None, "Critical: 'Original Details' header not found."
 
-        # 2. Read Data (Data starts 2 rows below Anchor)
         # Example: Anchor at Row 6 -> Headers at 7 -> Data at 8
-        data_start_row = anchor_idx + 2 
-        
-        # Read without headers so we can access by Index (0, 1, 2...)
-        df_raw = pd.read_excel(file_obj, sheet_name=sheet_name, header=None, skiprows=data_start_row)
-        
-        # 3. Rename Columns manually by Index (A=0, B=1, C=2, E=4...)
-        # Verify we have enough columns (At least up to Col O which is index 14)
-        if df_raw.shape[1] < 15:
-            # If sheet is cut off, we can't map taxes, but let's try mapping what we have
-            pass 
-
-        # MAPPING DICTIONARY (Based on your blue text request)
-        # A(0): OLD_INV_NO
-        # C(2): GSTIN (Shared)
-        # E(4): NEW_INV_NO
-        # G(6): NEW_DATE
-        # L(11): NEW_TAXABLE
-        # M(12): NEW_IGST
-        # N(13): NEW_CGST
-        # O(14): NEW_SGST
+        next(rows, None)
+        df_raw = positional_frame(rows)
+        file_obj.seek(0)
+        if df_raw.empty: return None, "No B2BA entries found."
         
-        rename_map = {
-            0: 'OLD_INV_NO',
-            2: 'GSTIN',
-            4: 'NEW_INV_NO',
-            6: 'NEW_DATE',
-            11: 'NEW_TAXABLE',
-            12: 'NEW_IGST',
-            13: 'NEW_CGST',
-            14: 'NEW_SGST'
-        }
-        
-        df_raw.rename(columns=rename_map, inplace=True)
-
-        # 4. Filter empty rows (Must have GSTIN and Old Inv)
-        df_raw = df_raw.dropna(subset=['GSTIN', 'OLD_INV_NO'])
-        
-        # 5. Ensure numeric columns are actually numbers (handle potential header junk)
-        num_cols = ['NEW_TAXABLE', 'NEW_IGST', 'NEW_CGST', 'NEW_SGST']
-        for c in num_cols:
-            if c in df_raw.columns:
-                df_raw[c] = pd.to_numeric(df_raw[c], errors='coerce').fillna(0.0)
-
-        # Try to find Name (Trade/Legal name) - usually Col D (Index 3)
-        if 3 in df_raw.columns:
-            df_raw.rename(columns={3: 'Name of Party'}, inplace=True)
-        else:
-            df_raw['Name of Party'] = 'Amendment'
-
-        return df_raw, "Success"
+        return b2ba_from_raw(df_raw), "Success"
 
     except Exception as e:
         return None, f"Error processing B2BA: {e}"
 
-def process_amendments(df_b2b, df_b2ba):
+def _encode_keys(gstins, invoices):
+    """
+    (GSTIN, invoice) pairs from several series pairs → int64 codes in one
+    shared code space (-1 where either part is missing). Text is normalised
+    and factorised once per component; no per-row key strings are built.
+    """
+    sizes = [len(s) for s in gstins]
+    g_codes, _      = pd.factorize(pd.concat([normalize_text(s) for s in gstins], ignore_index=True))
+    i_codes, i_uniq = pd.factorize(pd.concat([normalize_text(s) for s in invoices], ignore_index=True))
+    codes = g_codes.astype(np.int64) * max(len(i_uniq), 1) + i_codes
+    codes[(g_codes < 0) | (i_codes < 0)] = -1
+    return np.split(codes, np.cumsum(sizes)[:-1])
+
+
+def _resolve_chains(old_key, new_key):
+    """
+    Row positions of the B2BA entries to inject.
+    - Same original amended more than once → the latest row wins
+    - Chains (X→Y in month 2, Y→Z in month 5) → only the final revision is
+      injected; a revision is superseded when a LATER row amends it again
+    Looked up through a sorted index of original keys (searchsorted), one pass.
+    """
+    latest = (~pd.Series(old_key).duplicated(keep='last').to_numpy()) & (old_key >= 0)
+    pos = np.flatnonzero(latest)
+    if len(pos) == 0:
+        return pos
+    order      = np.argsort(old_key[pos], kind='stable')
+    sorted_old = old_key[pos][order]
+    sorted_pos = pos[order]
+    at   = np.searchsorted(sorted_old, new_key[pos])
+    at_c = np.minimum(at, len(pos) - 1)
+    superseded = (at < len(pos)) & (sorted_old[at_c] == new_key[pos]) & (sorted_pos[at_c] > pos)
+    return pos[~superseded]
+
+
+def process_amendments(df_b2b, df_b2ba, report=False):
     """
     Kill & Replace Logic.
     1. Finds target columns in df_b2b dynamically.
-    2. Deletes rows matching (GSTIN + OLD_INV_NO).
-    3. Maps B2BA columns to B2B columns and Adds them.
+    2. Deletes rows matching (GSTIN + OLD_INV_NO) — every original in the
+       amendment chain.
+    3. Maps the final revision of each chain to B2B columns and adds it.
+    Returns (df_final, deleted_count, added_count); with report=True a fourth
+    element lists what was killed, injected and superseded.
     """
+    empty_report = pd.DataFrame(columns=['Action', 'GSTIN', 'Invoice', 'Revised Invoice'])
     if df_b2ba is None or df_b2ba.empty:
-        return df_b2b, 0, 0
+        return (df_b2b, 0, 0, empty_report) if report else (df_b2b, 0, 0)
 
     # --- STEP 1: Find the Columns in B2B (Target) ---
     b2b_inv_col = get_col_name(df_b2b, ["Invoice number", "Invoice Number", "Inv No", "Invoice No."])
@@ -128,28 +184,19 @@ def process_amendments(df_b2b, df_b2ba):
 
     if not b2b_inv_col or not b2b_gst_col:
         st.error(f"⚠️ Amendment Failed: Could not identify Invoice/GSTIN columns in B2B data. Found: {list(df_b2b.columns)}")
-        return df_b2b, 0, 0
+        return (df_b2b, 0, 0, empty_report) if report else (df_b2b, 0, 0)
     
-    # --- STEP 2: Normalize Keys for Matching ---
-    df_b2b['Key_GSTIN'] = normalize_text(df_b2b[b2b_gst_col])
-    df_b2b['Key_Inv']   = normalize_text(df_b2b[b2b_inv_col])
-    df_b2b['Unique_Match_Key'] = df_b2b['Key_GSTIN'] + "_" + df_b2b['Key_Inv']
-    
-    df_b2ba['Key_GSTIN'] = normalize_text(df_b2ba['GSTIN'])
-    df_b2ba['Key_Old_Inv'] = normalize_text(df_b2ba['OLD_INV_NO'])
-    kill_list = (df_b2ba['Key_GSTIN'] + "_" + df_b2ba['Key_Old_Inv']).unique().tolist()
+    # --- STEP 2: Encode Keys for Matching ---
+    b2b_key, old_key, new_key = _encode_keys(
+        [df_b2b[b2b_gst_col], df_b2ba['GSTIN'], df_b2ba['GSTIN']],
+        [df_b2b[b2b_inv_col], df_b2ba['OLD_INV_NO'], df_b2ba['NEW_INV_NO']])
+    inject_pos = _resolve_chains(old_key, new_key)
     
     # --- STEP 3: DELETE OLD RECORDS ---
-    initial_count = len(df_b2b)
-    df_clean = df_b2b[~df_b2b['Unique_Match_Key'].isin(kill_list)].copy()
-    deleted_count = initial_count - len(df_clean)
-    
-    # Cleanup temp keys
-    df_clean = df_clean.drop(columns=['Key_GSTIN', 'Key_Inv', 'Unique_Match_Key'])
+    kill_mask = np.isin(b2b_key, np.unique(old_key[old_key >= 0]))
+    deleted_count = int(kill_mask.sum())
 
-    # --- STEP 4: PREPARE & INJECT NEW RECORDS ---
-    df_to_add = df_b2ba.copy()
-    
+    # --- STEP 4: PREPARE NEW RECORDS (straight into B2B column order) ---
     # MAP B2BA Internal Names -> B2B Actual Names
     final_rename_map = {
         'NEW_INV_NO': b2b_inv_col,
@@ -160,25 +207,39 @@ def process_amendments(df_b2b, df_b2ba):
     if b2b_igst: final_rename_map['NEW_IGST'] = b2b_igst
     if b2b_cgst: final_rename_map['NEW_CGST'] = b2b_cgst
     if b2b_sgst: final_rename_map['NEW_SGST'] = b2b_sgst
-    
-    df_to_add.rename(columns=final_rename_map, inplace=True)
-    
-    # Ensure all B2B columns exist in the new data
+    source_of = {}
+    for c in df_b2ba.columns:
+        source_of.setdefault(final_rename_map.get(c, c), c)
+
+    src = df_b2ba.iloc[inject_pos]
+    new_cols = {}
     for col in df_b2b.columns:
-        if col in ['Key_GSTIN', 'Key_Inv', 'Unique_Match_Key']: continue 
-        
-        if col not in df_to_add.columns:
-            # Default values
-            if 'Value' in str(col) or 'Tax' in str(col):
-                df_to_add[col] = 0.0
-            else:
-                df_to_add[col] = ""
-    
-    # Select matching columns
-    cols_to_keep = [c for c in df_b2b.columns if c not in ['Key_GSTIN', 'Key_Inv', 'Unique_Match_Key']]
-    df_to_add = df_to_add[cols_to_keep]
+        if col in source_of:
+            new_cols[col] = src[source_of[col]].to_numpy()
+        elif 'Value' in str(col) or 'Tax' in str(col):
+            new_cols[col] = 0.0
+        else:
+            new_cols[col] = ""
+    df_to_add = pd.DataFrame(new_cols, index=range(len(src)), columns=df_b2b.columns)
     
     # --- STEP 5: MERGE ---
-    df_final = pd.concat([df_clean, df_to_add], ignore_index=True)
-    
-    return df_final, deleted_count, len(df_to_add)
\ No newline at end of file
+    df_final = pd.concat([df_b2b[~kill_mask], df_to_add], ignore_index=True)
+    if not report:
+        return df_final, deleted_count, len(df_to_add)
+
+    superseded = np.setdiff1d(np.arange(len(df_b2ba)), inject_pos)
+    amend_report = pd.concat([
+        pd.DataFrame({'Action': 'Killed',
+                      'GSTIN': df_b2b[b2b_gst_col].to_numpy()[kill_mask],
+                      'Invoice': df_b2b[b2b_inv_col].to_numpy()[kill_mask],
+                      'Revised Invoice': ""}),
+        pd.DataFrame({'Action': 'Injected',
+                      'GSTIN': src['GSTIN'].to_numpy(),
+                      'Invoice': src['OLD_INV_NO'].to_numpy(),
+                      'Revised Invoice': src['NEW_INV_NO'].to_numpy()}),
+        pd.DataFrame({'Action': 'Superseded',
+                      'GSTIN': df_b2ba['GSTIN'].to_numpy()[superseded],
+                      'Invoice': df_b2ba['OLD_INV_NO'].to_numpy()[superseded],
+                      'Revised Invoice': df_b2ba['NEW_INV_NO'].to_numpy()[superseded]}),
+    ], ignore_index=True)
+    return df_final, deleted_count, len(df_to_add), amend_report
\ No newline at end of file
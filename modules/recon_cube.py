@@ -0,0 +1,139 @@
+# modules/recon_cube.py  — v1.0
+# Aggregate cube of a reconciliation result
+#   - build_cube() makes one pass over a B2B or CDNR result and keeps, per
+#     (status, GSTIN): row counts (all / books side present / portal side
+#     present) and integer-paise sums of every tax head on both sides plus
+#     Final_Taxable — over all rows (the old column sums) and over the rows
+#     whose side is present (the old notna-filtered source grids)
+#   - Reports, the ITC PDF, the history summary and the dashboard read their
+#     KPI counts and totals from the cube instead of rescanning the result
+#     with str.contains / column sums. Status selectors (a regex or a
+#     status_codes.Flag) are resolved against the handful of distinct
+#     statuses, not every row
+#   - Sums are exact in paise; rupee values are returned as float
+#   - The cube describes the frame it was built from: rebuild it when
+#     statuses or amounts change (party-name edits don't matter)
+
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+from .status_codes import label_flags, status_column
+
+TAX_HEADS = [('taxable', 'Taxable Value'), ('igst', 'IGST'), ('cgst', 'CGST'), ('sgst', 'SGST')]
+SIDES     = [('books', '_BOOKS'), ('gst', '_GST')]
+
+
+def _paise(series):
+    values = pd.to_numeric(series, errors='coerce').fillna(0).to_numpy(dtype='float64')
+    return np.rint(values * 100).astype('int64')
+
+
+def build_cube(df, status_col=None, gstin_col='GSTIN'):
+    """One pass over a result frame → ReconCube."""
+    status_col = status_col or status_column(df)
+    n = len(df)
+    status = (df[status_col].astype(object).where(df[status_col].notna(), '')
+              if status_col in df.columns else pd.Series('', index=df.index))
+    gstin = (df[gstin_col].astype(object).where(df[gstin_col].notna(), '')
+             if gstin_col in df.columns else pd.Series('', index=df.index))
+
+    cols = {'rows': np.ones(n, dtype='int64')}
+    for side, sx in SIDES:
+        present = (df['Taxable Value' + sx].notna().to_numpy()
+                   if 'Taxable Value' + sx in df.columns else np.zeros(n, dtype=bool))
+        cols[f'rows_{side}'] = present.astype('int64')
+        for head, name in TAX_HEADS:
+            c = name + sx
+            paise = _paise(df[c]) if c in df.columns else np.zeros(n, dtype='int64')
+            cols[f'{head}_{side}'] = paise
+            cols[f'{head}_{side}_present'] = np.where(present, paise, 0)
+    cols['final'] = _paise(df['Final_Taxable']) if 'Final_Taxable' in df.columns else np.zeros(n, dtype='int64')
+
+    table = (pd.DataFrame(cols, index=df.index)
+             .groupby([status.astype(str).to_numpy(), gstin.astype(str).to_numpy()], sort=True)
+             .sum())
+    table.index.names = ['status', 'gstin']
+    return ReconCube(table)
+
+
+class ReconCube:
+    """Counts and paise sums per (status, GSTIN); queries take an optional status regex or Flag."""
+
+    def __init__(self, table):
+        self.table = table
+        self.by_status_paise = table.groupby(level='status').sum()
+        self._matches = {}
+        h = hashlib.sha1(pd.util.hash_pandas_object(table).to_numpy().tobytes())
+        self._digest = h.hexdigest()[:16]
+
+    def __repr__(self):
+        # content-based, so report job keys stay stable across reruns
+        return f"ReconCube({len(self.table)} cells, {self._digest})"
+
+    def statuses(self, pattern=None):
+        """
+        Distinct statuses matching pattern: a regex (re.search, like
+        Series.str.contains) or a status_codes.Flag (any of its bits).
+        """
+        if pattern is None:
+            return [s for s in self.by_status_paise.index if s]
+        if pattern not in self._matches:
+            if isinstance(pattern, int):
+                hit = lambda s: label_flags(s) & pattern
+            else:
+                hit = re.compile(pattern).search
+            self._matches[pattern] = [s for s in self.by_status_paise.index if s and hit(s)]
+        return self._matches[pattern]
+
+    def _slice(self, pattern):
+        if pattern is None:
+            return self.by_status_paise
+        return self.by_status_paise.loc[self.statuses(pattern)]
+
+    def count(self, pattern=None, side=None):
+        """Rows (with the books / gst side present when side is given)."""
+        return int(self._slice(pattern)['rows' if side is None else f'rows_{side}'].sum())
+
+    def total(self, column, pattern=None):
+        """Rupees: a cube column such as 'taxable_books', 'igst_gst' or 'final'."""
+        return int(self._slice(pattern)[column].sum()) / 100
+
+    def row8(self, side, pattern=None):
+        """
+        [rows, taxable, igst, cgst, sgst, cess, total tax, invoice value] for
+        one side, over the rows where that side is present.
+        """
+        s = self._slice(pattern)
+        tv, ig, cg, sg = (int(s[f'{h}_{side}_present'].sum()) / 100 for h, _ in TAX_HEADS)
+        tg = ig + cg + sg
+        return [int(s[f'rows_{side}'].sum()), tv, ig, cg, sg, 0.0, tg, tv + tg]
+
+    def totals(self, side, pattern=None):
+        """row8 layout over every row: the sums of the side's columns (TOTALS rows)."""
+        s = self._slice(pattern)
+        tv, ig, cg, sg = (int(s[f'{h}_{side}'].sum()) / 100 for h, _ in TAX_HEADS)
+        tg = ig + cg + sg
+        return [int(s['rows'].sum()), tv, ig, cg, sg, 0.0, tg, tv + tg]
+
+    def by_status(self, pattern=None):
+        """Per status: rows and rupee sums (one row per status)."""
+        s = self._slice(pattern)
+        out = s[['rows', 'rows_books', 'rows_gst']].copy()
+        for c in s.columns.drop(['rows', 'rows_books', 'rows_gst']):
+            out[c] = s[c] / 100
+        return out
+
+    def by_gstin(self, pattern=None):
+        """Per GSTIN over the matching statuses: rows and rupee sums."""
+        s = self.table if pattern is None else self.table.loc[self.statuses(pattern)]
+        s = s.groupby(level='gstin').sum()
+        out = s[['rows', 'rows_books', 'rows_gst']].copy()
+        for c in s.columns.drop(['rows', 'rows_books', 'rows_gst']):
+            out[c] = s[c] / 100
+        return out
+
+    def status_counts(self):
+        return {s: int(n) for s, n in self.by_status_paise['rows'].items() if s}
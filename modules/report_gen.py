@@ -4,114 +4,157 @@ import io
 import xlsxwriter
 import numpy as np
 import zipfile
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .recon_cube import build_cube
+from .status_codes import Flag, ISSUE, has_flag, status_flags
+from .xlsx_formats import format_cache
+from .xlsx_stream import use_streaming, open_workbook, close_workbook, write_frame, spacer_row
 
 def safe_date_format(series):
     temp = pd.to_datetime(series, dayfirst=True, errors='coerce')
     return temp.fillna(series)
 
+# ── Vendor split ─────────────────────────────────────────────────────────────
+# One Discrepancy Report workbook per vendor with open issues. The export
+# columns are built once for all rows, the frame is partitioned with one
+# groupby, and large splits render their workbooks in a process pool
+# (launcher.py calls freeze_support for the frozen .exe). Workers are always
+# spawned: a forked child of the Streamlit server would inherit its threads
+# and open database connection, and spawn is what Windows does anyway.
+_SPLIT_PARALLEL_MIN = 40        # vendors; below this a process pool costs more than it saves
+_SPLIT_NUM_COLS = {'Portal Taxable','Portal IGST','Portal CGST','Portal SGST','Portal Total',
+                   'Books Taxable','Books IGST','Books CGST','Books SGST','Books Total','Diff Total'}
+_SPLIT_STATUS_COLORS = {
+    'Invoices Not in GSTR-2B':       ('#FFF2F2','#C00000'),
+    'Invoices Not in Purchase Books': ('#FFFBEA','#B8860B'),
+    'AI Matched (Mismatch)':          ('#FFF0F0','#C00000'),
+    'Matched (Tax Error)':            ('#FFFBEA','#B8860B'),
+    'AI Matched (Date Mismatch)':     ('#EBF3FB','#2E75B6'),
+    'AI Matched (Invoice Mismatch)':  ('#EBF3FB','#2E75B6'),
+    'Suggestion':                     ('#EBF3FB','#2E75B6'),
+    'Suggestion (Group Match)':       ('#EBF3FB','#2E75B6'),
+    'Manually Linked':                ('#F0FFF4','#1E6B3C'),
+}
+
+
+def _vendor_export_frame(df):
+    """Portal vs Books columns of the vendor split for every row of df."""
+    def col(name, default):
+        return df[name] if name in df.columns else pd.Series(default, index=df.index)
+    b_inv, g_inv = col('Invoice Number_BOOKS', ''), col('Invoice Number_GST', '')
+    b = {k: col(f'{k}_BOOKS', 0) for k in ('Taxable Value', 'IGST', 'CGST', 'SGST')}
+    g = {k: col(f'{k}_GST', 0)   for k in ('Taxable Value', 'IGST', 'CGST', 'SGST')}
+    b_total = b['Taxable Value'] + b['IGST'] + b['CGST'] + b['SGST']
+    g_total = g['Taxable Value'] + g['IGST'] + g['CGST'] + g['SGST']
+    has_g_inv = g_inv.notna() & (g_inv.astype(str) != 'nan')
+    return pd.DataFrame({
+        'Status': col('Recon_Status', ''), 'Inv No': g_inv.where(has_g_inv, b_inv),
+        'Portal Date': safe_date_format(col('Invoice Date_GST', '')),
+        'Portal Taxable': g['Taxable Value'], 'Portal IGST': g['IGST'],
+        'Portal CGST': g['CGST'], 'Portal SGST': g['SGST'], 'Portal Total': g_total,
+        'Books Date': safe_date_format(col('Invoice Date_BOOKS', '')),
+        'Books Taxable': b['Taxable Value'], 'Books IGST': b['IGST'],
+        'Books CGST': b['CGST'], 'Books SGST': b['SGST'], 'Books Total': b_total,
+        'Diff Total': pd.to_numeric(b_total - g_total, errors='coerce').round(2),
+    })
+
+
+def _vendor_workbook(export_df):
+    """Discrepancy Report xlsx bytes for one vendor (runs in a worker process)."""
+    excel_buffer = io.BytesIO()
+    wb = xlsxwriter.Workbook(excel_buffer)
+    ws = wb.add_worksheet('Discrepancy Report')
+    _f = format_cache(wb)
+    # Formats
+    fmt_portal_hdr = _f({'bold':True,'bg_color':'#1F3864','font_color':'white','border':1,'align':'center','valign':'vcenter'})
+    fmt_books_hdr  = _f({'bold':True,'bg_color':'#C00000','font_color':'white','border':1,'align':'center','valign':'vcenter'})
+    fmt_info_hdr   = _f({'bold':True,'bg_color':'#2E75B6','font_color':'white','border':1,'align':'center','valign':'vcenter'})
+    fmt_diff_hdr   = _f({'bold':True,'bg_color':'#7030A0','font_color':'white','border':1,'align':'center','valign':'vcenter'})
+    # Status row formats
+    row_fmts = {}
+    for st,(bg,fc_c) in _SPLIT_STATUS_COLORS.items():
+        row_fmts[st] = {
+            'normal': _f({'bg_color':bg,'border':1,'valign':'vcenter'}),
+            'number': _f({'bg_color':bg,'border':1,'valign':'vcenter','num_format':'#,##0.00'}),
+            'bold':   _f({'bg_color':bg,'border':1,'valign':'vcenter','bold':True,'num_format':'#,##0.00','font_color':fc_c}),
+        }
+    default_fmts = {
+        'normal': _f({'border':1,'valign':'vcenter'}),
+        'number': _f({'border':1,'valign':'vcenter','num_format':'#,##0.00'}),
+        'bold':   _f({'border':1,'valign':'vcenter','bold':True,'num_format':'#,##0.00'}),
+    }
+    # Header row 1: group labels
+    ws.merge_range(0,0,0,1,'INVOICE DETAILS',fmt_info_hdr)
+    ws.merge_range(0,2,0,7,'GST PORTAL DATA (GSTR-1 Filed by Supplier)',fmt_portal_hdr)
+    ws.merge_range(0,8,0,13,'PURCHASE BOOKS DATA (Our Records)',fmt_books_hdr)
+    ws.write(0,14,'DIFFERENCE',fmt_diff_hdr)
+    # Header row 2: column names
+    cols = list(export_df.columns)
+    for cn,v in enumerate(cols):
+        fmt = fmt_portal_hdr if 'Portal' in v else fmt_books_hdr if 'Books' in v else fmt_diff_hdr if 'Diff' in v else fmt_info_hdr
+        ws.write(2,cn,v,fmt)
+    # Data rows with status coloring
+    cell_fmt = [('bold' if c == 'Diff Total' else 'number') if c in _SPLIT_NUM_COLS else None for c in cols]
+    for rn, values in enumerate(zip(*(export_df[c].tolist() for c in cols)), 3):
+        fmts = row_fmts.get(str(values[0]), default_fmts)
+        for cn, val in enumerate(values):
+            if cell_fmt[cn]:
+                try:
+                    ws.write_number(rn, cn, float(val) if pd.notna(val) else 0, fmts[cell_fmt[cn]])
+                except:
+                    ws.write(rn, cn, val or '', fmts['normal'])
+            else:
+                ws.write(rn, cn, str(val) if pd.notna(val) else '', fmts['normal'])
+    # Column widths
+    ws.set_column(0,0,18); ws.set_column(1,1,14); ws.set_column(2,14,13)
+    ws.set_row(0,20); ws.set_row(2,18)
+    ws.freeze_panes(3,2)
+    wb.close()
+    return excel_buffer.getvalue()
+
+
+def _vendor_workbooks(frames, n):
+    """Workbook bytes for each frame, in order — as they finish when a pool is used."""
+    workers = min(os.cpu_count() or 1, n)
+    if n < _SPLIT_PARALLEL_MIN or workers < 2:
+        yield from map(_vendor_workbook, frames)
+        return
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        yield from pool.map(_vendor_workbook, frames, chunksize=max(1, n // (workers * 4)))
+
+
 def generate_vendor_split_zip(full_df):
-    issue_mask = full_df['Recon_Status'].str.contains('Not in|Mismatch|Suggestion|Manual|Tax Error', na=False)
+    issue_mask = has_flag(full_df['Recon_Status'], ISSUE)
     vendors = full_df[issue_mask]['Name of Party'].unique().tolist()
     vendors = [v for v in vendors if v and str(v) != 'nan']
+    rows = full_df[full_df['Name of Party'].isin(vendors)]
+    export_df = _vendor_export_frame(rows)
+    positions = rows.groupby('Name of Party', sort=False).indices
+    frames = [export_df.iloc[positions[v]].reset_index(drop=True) for v in vendors]
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-        for vendor in vendors:
-            sub_df = full_df[full_df['Name of Party'] == vendor].copy()
-            export_data = []
-            for idx, row in sub_df.iterrows():
-                status = row.get('Recon_Status', '')
-                b_inv=row.get('Invoice Number_BOOKS',''); b_date=row.get('Invoice Date_BOOKS','')
-                b_tax=row.get('Taxable Value_BOOKS',0); b_igst=row.get('IGST_BOOKS',0)
-                b_cgst=row.get('CGST_BOOKS',0); b_sgst=row.get('SGST_BOOKS',0)
-                b_total=b_tax+b_igst+b_cgst+b_sgst
-                g_inv=row.get('Invoice Number_GST',''); g_date=row.get('Invoice Date_GST','')
-                g_tax=row.get('Taxable Value_GST',0); g_igst=row.get('IGST_GST',0)
-                g_cgst=row.get('CGST_GST',0); g_sgst=row.get('SGST_GST',0)
-                g_total=g_tax+g_igst+g_cgst+g_sgst
-                ref_inv=g_inv if pd.notna(g_inv) and str(g_inv)!='nan' else b_inv
-                export_data.append({'Status':status,'Inv No':ref_inv,
-                    'Portal Date':g_date,'Portal Taxable':g_tax,'Portal IGST':g_igst,
-                    'Portal CGST':g_cgst,'Portal SGST':g_sgst,'Portal Total':g_total,
-                    'Books Date':b_date,'Books Taxable':b_tax,'Books IGST':b_igst,
-                    'Books CGST':b_cgst,'Books SGST':b_sgst,'Books Total':b_total,
-                    'Diff Total':round(b_total-g_total,2)})
-            export_df = pd.DataFrame(export_data)
-            if 'Portal Date' in export_df.columns: export_df['Portal Date']=safe_date_format(export_df['Portal Date'])
-            if 'Books Date'  in export_df.columns: export_df['Books Date'] =safe_date_format(export_df['Books Date'])
-            excel_buffer = io.BytesIO()
-            with pd.ExcelWriter(excel_buffer,engine='xlsxwriter',datetime_format='dd/mm/yyyy') as writer:
-                export_df.to_excel(writer,index=False,startrow=2,sheet_name='Discrepancy Report')
-                wb=writer.book; ws=writer.sheets['Discrepancy Report']
-                # Formats
-                fmt_portal_hdr = wb.add_format({'bold':True,'bg_color':'#1F3864','font_color':'white','border':1,'align':'center','valign':'vcenter'})
-                fmt_books_hdr  = wb.add_format({'bold':True,'bg_color':'#C00000','font_color':'white','border':1,'align':'center','valign':'vcenter'})
-                fmt_info_hdr   = wb.add_format({'bold':True,'bg_color':'#2E75B6','font_color':'white','border':1,'align':'center','valign':'vcenter'})
-                fmt_diff_hdr   = wb.add_format({'bold':True,'bg_color':'#7030A0','font_color':'white','border':1,'align':'center','valign':'vcenter'})
-                # Status row formats
-                STATUS_ROW_COLORS = {
-                    'Invoices Not in GSTR-2B':       ('#FFF2F2','#C00000'),
-                    'Invoices Not in Purchase Books': ('#FFFBEA','#B8860B'),
-                    'AI Matched (Mismatch)':          ('#FFF0F0','#C00000'),
-                    'Matched (Tax Error)':            ('#FFFBEA','#B8860B'),
-                    'AI Matched (Date Mismatch)':     ('#EBF3FB','#2E75B6'),
-                    'AI Matched (Invoice Mismatch)':  ('#EBF3FB','#2E75B6'),
-                    'Suggestion':                     ('#EBF3FB','#2E75B6'),
-                    'Suggestion (Group Match)':       ('#EBF3FB','#2E75B6'),
-                    'Manually Linked':                ('#F0FFF4','#1E6B3C'),
-                }
-                row_fmts = {}
-                for st,(bg,fc_c) in STATUS_ROW_COLORS.items():
-                    row_fmts[st] = {
-                        'normal': wb.add_format({'bg_color':bg,'border':1,'valign':'vcenter'}),
-                        'number': wb.add_format({'bg_color':bg,'border':1,'valign':'vcenter','num_format':'#,##0.00'}),
-                        'bold':   wb.add_format({'bg_color':bg,'border':1,'valign':'vcenter','bold':True,'num_format':'#,##0.00','font_color':fc_c}),
-                    }
-                default_fmts = {
-                    'normal': wb.add_format({'border':1,'valign':'vcenter'}),
-                    'number': wb.add_format({'border':1,'valign':'vcenter','num_format':'#,##0.00'}),
-                    'bold':   wb.add_format({'border':1,'valign':'vcenter','bold':True,'num_format':'#,##0.00'}),
-                }
-                # Header row 1: group labels
-                ws.merge_range(0,0,0,1,'INVOICE DETAILS',fmt_info_hdr)
-                ws.merge_range(0,2,0,7,'GST PORTAL DATA (GSTR-1 Filed by Supplier)',fmt_portal_hdr)
-                ws.merge_range(0,8,0,13,'PURCHASE BOOKS DATA (Our Records)',fmt_books_hdr)
-                ws.write(0,14,'DIFFERENCE',fmt_diff_hdr)
-                # Header row 2: column names
-                cols = list(export_df.columns)
-                for cn,v in enumerate(cols):
-                    fmt = fmt_portal_hdr if 'Portal' in v else fmt_books_hdr if 'Books' in v else fmt_diff_hdr if 'Diff' in v else fmt_info_hdr
-                    ws.write(2,cn,v,fmt)
-                # Data rows with status coloring
-                num_cols = {'Portal Taxable','Portal IGST','Portal CGST','Portal SGST','Portal Total',
-                            'Books Taxable','Books IGST','Books CGST','Books SGST','Books Total','Diff Total'}
-                for rn, (_, row) in enumerate(export_df.iterrows()):
-                    st = str(row.get('Status',''))
-                    fmts = row_fmts.get(st, default_fmts)
-                    for cn, col in enumerate(cols):
-                        val = row[col]
-                        is_diff = col == 'Diff Total'
-                        if col in num_cols:
-                            try:
-                                ws.write_number(rn+3, cn, float(val) if pd.notna(val) else 0, fmts['bold'] if is_diff else fmts['number'])
-                            except:
-                                ws.write(rn+3, cn, val or '', fmts['normal'])
-                        else:
-                            ws.write(rn+3, cn, str(val) if pd.notna(val) else '', fmts['normal'])
-                # Column widths
-                ws.set_column(0,0,18); ws.set_column(1,1,14); ws.set_column(2,14,13)
-                ws.set_row(0,20); ws.set_row(2,18)
-                ws.freeze_panes(3,2)
-            zip_file.writestr(f"{vendor}_Discrepancy.xlsx".replace('/','_'),excel_buffer.getvalue())
+        for vendor, xlsx in zip(vendors, _vendor_workbooks(frames, len(frames))):
+            zip_file.writestr(f"{vendor}_Discrepancy.xlsx".replace('/','_'), xlsx)
     return zip_buffer
 
 
-def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=None):
-    output = io.BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter', datetime_format='dd/mm/yyyy')
-    wb = writer.book
+def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=None,
+                   path=None, streaming=None, cube=None, cdnr_cube=None):
+    """
+    B2B report as xlsx bytes, or written to `path` (returns the path). Large
+    runs written to a path use constant-memory streaming (see xlsx_stream);
+    streaming=True / False forces the mode. cube / cdnr_cube: the results'
+    ReconCube when the caller already has it (built here otherwise).
+    """
+    streaming = use_streaming(len(full_df), path, streaming)
+    wb, writer, target = open_workbook(path, streaming)
 
     # ── Base formats ──────────────────────────────────────────────────────────
-    def _f(**kw): return wb.add_format(kw)
+    _f = format_cache(wb)
     fmt_orange   = _f(bold=True,bg_color='#ED7D31',border=1,font_color='white',align='center',valign='vcenter',text_wrap=True)
     fmt_green    = _f(bold=True,bg_color='#70AD47',border=1,font_color='white',align='center',valign='vcenter',text_wrap=True)
     fmt_gray     = _f(bold=True,bg_color='#D9D9D9',border=1,align='center',valign='vcenter',text_wrap=True)
@@ -128,31 +171,15 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         ws.write(3,4,"Period:",fmt_bold);    ws.write(3,5,period)
         ws.merge_range(4,0,4,cols,title,_f(bold=True,bg_color='#BDD7EE',border=1,align='center'))
 
-    def _money(df_s, col):
-        return float(df_s[col].fillna(0).sum()) if col in df_s.columns else 0.0
-
-    def _row8(df_s, use_books=True):
-        suffix = '_BOOKS' if use_books else '_GST'
-        tv=_money(df_s,'Taxable Value'+suffix); ig=_money(df_s,'IGST'+suffix)
-        cg=_money(df_s,'CGST'+suffix);          sg=_money(df_s,'SGST'+suffix)
-        tg=ig+cg+sg
-        return [len(df_s), tv, ig, cg, sg, 0.0, tg, tv+tg]
-
-    def _sub(pat):
-        try:    return full_df[full_df['Recon_Status'].str.contains(pat, na=False)]
-        except: return full_df.iloc[0:0]
-
     # Pull source totals for grid
-    bk_df  = full_df[full_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in full_df.columns else full_df.iloc[0:0]
-    gst_df = full_df[full_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in full_df.columns else full_df.iloc[0:0]
-    bk_b2b  = _row8(bk_df,  True)
-    gst_b2b = _row8(gst_df, False)
+    cube = cube or build_cube(full_df, 'Recon_Status')
+    bk_b2b  = cube.row8('books')
+    gst_b2b = cube.row8('gst')
 
     if cdnr_df is not None and not cdnr_df.empty:
-        cdnr_bk_df  = cdnr_df[cdnr_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in cdnr_df.columns else cdnr_df.iloc[0:0]
-        cdnr_gst_df = cdnr_df[cdnr_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in cdnr_df.columns else cdnr_df.iloc[0:0]
-        bk_cdnr  = _row8(cdnr_bk_df,  True)
-        gst_cdnr = _row8(cdnr_gst_df, False)
+        cdnr_cube = cdnr_cube or build_cube(cdnr_df)
+        bk_cdnr  = cdnr_cube.row8('books')
+        gst_cdnr = cdnr_cube.row8('gst')
     else:
         bk_cdnr  = [0]*8
         gst_cdnr = [0]*8
@@ -196,7 +223,7 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     ws_exec.set_column(2,2,20); ws_exec.set_column(3,6,16)
     ws_exec.set_column(7,7,18); ws_exec.set_column(8,8,20)
 
-    ws_exec.set_row(4,6)
+    spacer_row(wb, ws_exec, 4, 6)
     COL_H=['','','TAXABLE (₹)','IGST (₹)','CGST (₹)','SGST (₹)','CESS (₹)','TOTAL TAX (₹)','TOTAL (₹)']
     ws_exec.set_row(5,26)
     for ci,h in enumerate(COL_H): ws_exec.write(5,ci,h,FHDR)
@@ -219,7 +246,7 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     for ci,v in enumerate(bk_total[1:],2): ws_exec.write(9,ci,v,FBK_TV)
 
     # GSTR-2B
-    ws_exec.set_row(10,6); ws_exec.set_row(11,22)
+    spacer_row(wb, ws_exec, 10, 6); ws_exec.set_row(11,22)
     ws_exec.merge_range(11,0,11,8,'  GSTR-2B  (Portal Data)',FGT_T)
     for row,l1,l2,vals,amend,is_cdnr in [
             (12,'GSTR-2B','B2B', gst_b2b,  False, False),
@@ -240,7 +267,7 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     for ci,v in enumerate(gst_grand[1:],2): ws_exec.write(16,ci,v,FGT_TV)
 
     # DIFFERENCE
-    ws_exec.set_row(17,6); ws_exec.set_row(18,22)
+    spacer_row(wb, ws_exec, 17, 6); ws_exec.set_row(18,22)
     ws_exec.merge_range(18,0,18,8,'  DIFFERENCE  (GSTR-2B  −  Books)',FDF_T)
     diff_b2b =[gst_b2b[i]-bk_b2b[i]   for i in range(8)]
     diff_cdn =[gst_cdnr[i]-bk_cdnr[i] for i in range(8)]
@@ -249,7 +276,7 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         ws_exec.set_row(row,20)
         ws_exec.write(row,0,l1,FDF_L); ws_exec.write(row,1,l2,FDF_L)
         for ci,v in enumerate(vals[1:],2): ws_exec.write(row,ci,v,dfmt(v))
-    ws_exec.set_row(22,6); ws_exec.set_row(23,28)
+    spacer_row(wb, ws_exec, 22, 6); ws_exec.set_row(23,28)
     ws_exec.merge_range(23,0,23,8,
         '🔴 Red = GSTR-2B < Books (ITC may be at risk)   '
         '🟢 Green = GSTR-2B > Books (supplier reported more)   '
@@ -336,24 +363,17 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     ws_sum.write(3,0,'Period:',fmt_bold);    ws_sum.write(3,1,period)
 
     # ── Compact KPI row ───────────────────────────────────────────────────────
-    bkdf_s  = full_df[full_df['Taxable Value_BOOKS'].notna()] if 'Taxable Value_BOOKS' in full_df.columns else full_df.iloc[0:0]
-    gstdf_s = full_df[full_df['Taxable Value_GST'].notna()]   if 'Taxable Value_GST'   in full_df.columns else full_df.iloc[0:0]
-
-    def _bsub(pat):
-        try:    return full_df[full_df['Recon_Status'].str.contains(pat,na=False)]
-        except: return full_df.iloc[0:0]
-
     kpi_data = [
-        ('Books Invoices',      len(bkdf_s)),
-        ('Portal Invoices',     len(gstdf_s)),
-        ('Matched',             len(_bsub(r'Matched'))),
-        ('Mismatched',          len(_bsub(r'Mismatch'))),
-        ('Not in GSTR-2B',      len(_bsub(r'Not in GSTR-2B'))),
-        ('Not in Books',        len(_bsub(r'Not in.*Books'))),
-        ('Suggestions',         len(_bsub(r'Suggestion'))),
-        ('AI Matched',          len(_bsub(r'AI Matched'))),
+        ('Books Invoices',      cube.count(side='books')),
+        ('Portal Invoices',     cube.count(side='gst')),
+        ('Matched',             cube.count(Flag.MATCHED)),
+        ('Mismatched',          cube.count(Flag.MISMATCH)),
+        ('Not in GSTR-2B',      cube.count(Flag.NOT_IN_2B)),
+        ('Not in Books',        cube.count(Flag.NOT_IN_BOOKS)),
+        ('Suggestions',         cube.count(Flag.SUGGESTION)),
+        ('AI Matched',          cube.count(Flag.AI)),
     ]
-    ws_sum.set_row(4,6)
+    spacer_row(wb, ws_sum, 4, 6)
     ws_sum.merge_range(5,0,5,15,'B2B Reconciliation — Individual Record View',FBANNER)
     ws_sum.set_row(5,26)
     for ki,(lbl,val) in enumerate(kpi_data):
@@ -371,7 +391,7 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         'Diff Taxable', 'Diff GST', 'Status',
     ]
     TOTAL_COLS = len(REC_COLS)  # 18
-    ws_sum.set_row(7,6)
+    spacer_row(wb, ws_sum, 7, 6)
     ws_sum.set_row(8,18)
     ws_sum.write(8, 0,'#',       FHDR_IDX)
     ws_sum.merge_range(8,1,8,2,  'PARTY DETAILS',  FGRP_ST)
@@ -392,6 +412,17 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     data_start_row = 10
     ws_sum.freeze_panes(10, 3)
 
+    fmt_idx = _f(bg_color='#F5F5F5', font_color='#9E9E9E', border=1, align='center', valign='vcenter', font_size=8)
+
+    # Diff columns — colour based on sign
+    def _diff_fmt(v, stat):
+        bg,fc = '#FFFFFF','#37474F'
+        for k,(b,f) in _STATUS_FMT.items():
+            if k in stat: bg,fc=b,f; break
+        if   v > 0.5:  return _f(bold=True,bg_color=bg,font_color='#C00000',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
+        elif v < -0.5: return _f(bold=True,bg_color=bg,font_color='#2E7D32',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
+        else:           return _f(bg_color=bg,font_color='#757575',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
+
     for ri, row in df_for_reco.iterrows():
         excel_row = data_start_row + ri
         status = str(row.get('Recon_Status',''))
@@ -399,7 +430,6 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
 
         fmt_txt = _row_fmt(status, num=False)
         fmt_num = _row_fmt(status, num=True)
-        fmt_idx = _f(bg_color='#F5F5F5', font_color='#9E9E9E', border=1, align='center', valign='vcenter', font_size=8)
 
         b_tax  = _n(row.get('Taxable Value_BOOKS'));  b_igst = _n(row.get('IGST_BOOKS'))
         b_cgst = _n(row.get('CGST_BOOKS'));           b_sgst = _n(row.get('SGST_BOOKS'))
@@ -424,15 +454,6 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         ws_sum.write(excel_row, 13, g_cgst,  fmt_num)
         ws_sum.write(excel_row, 14, g_sgst,  fmt_num)
 
-        # Diff columns — colour based on sign
-        def _diff_fmt(v, stat):
-            bg,fc = '#FFFFFF','#37474F'
-            for k,(b,f) in _STATUS_FMT.items():
-                if k in stat: bg,fc=b,f; break
-            if   v > 0.5:  return _f(bold=True,bg_color=bg,font_color='#C00000',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
-            elif v < -0.5: return _f(bold=True,bg_color=bg,font_color='#2E7D32',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
-            else:           return _f(bg_color=bg,font_color='#757575',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
-
         ws_sum.write(excel_row, 15, d_tax, _diff_fmt(d_tax,  status))
         ws_sum.write(excel_row, 16, d_gst, _diff_fmt(d_gst,  status))
 
@@ -447,17 +468,15 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
     FTOT = _f(bold=True,bg_color='#1F3864',font_color='white',border=1,align='right',valign='vcenter',font_size=9,num_format='#,##0.00')
     FTOT_L = _f(bold=True,bg_color='#1F3864',font_color='white',border=1,align='center',valign='vcenter',font_size=9)
     ws_sum.merge_range(tot_row,0,tot_row,4,'TOTALS',FTOT_L)
-    def _col_sum(col):
-        return float(full_df[col].fillna(0).sum()) if col in full_df.columns else 0.0
-    for ci,col in enumerate(['Taxable Value_BOOKS','IGST_BOOKS','CGST_BOOKS','SGST_BOOKS'],5):
-        ws_sum.write(tot_row, ci, _col_sum(col), FTOT)
+    bk_tot, gst_tot = cube.totals('books'), cube.totals('gst')
+    for ci,v in enumerate(bk_tot[1:5],5):
+        ws_sum.write(tot_row, ci, v, FTOT)
     ws_sum.write(tot_row, 9,  '', FTOT_L)
     ws_sum.write(tot_row, 10, '', FTOT_L)
-    for ci,col in enumerate(['Taxable Value_GST','IGST_GST','CGST_GST','SGST_GST'],11):
-        ws_sum.write(tot_row, ci, _col_sum(col), FTOT)
-    d_tax_tot = _col_sum('Taxable Value_BOOKS') - _col_sum('Taxable Value_GST')
-    d_gst_tot = (_col_sum('IGST_BOOKS')+_col_sum('CGST_BOOKS')+_col_sum('SGST_BOOKS')) - \
-                (_col_sum('IGST_GST')  +_col_sum('CGST_GST')  +_col_sum('SGST_GST'))
+    for ci,v in enumerate(gst_tot[1:5],11):
+        ws_sum.write(tot_row, ci, v, FTOT)
+    d_tax_tot = bk_tot[1] - gst_tot[1]
+    d_gst_tot = bk_tot[6] - gst_tot[6]
     ws_sum.write(tot_row,15, d_tax_tot, FTOT)
     ws_sum.write(tot_row,16, d_gst_tot, FTOT)
     ws_sum.write(tot_row,17, f'{total_data_rows} records', FTOT_L)
@@ -498,15 +517,18 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         'Inv No (GSTR-2B)','Date','Taxable','IGST','CGST','SGST',
         'Diff Taxable','Diff IGST','Diff CGST','Diff SGST','Status','Match Logic']
 
+    _flags = status_flags(full_df['Recon_Status'])
+    def _in(flag, without=0):   # status flag → row mask (integer tests on the status codes)
+        return ((_flags & flag) != 0) & ((_flags & without) == 0)
     sheets={
         'All Data':      full_df,
-        'Matched':       full_df[full_df['Recon_Status'].str.contains('Matched',na=False)&~full_df['Recon_Status'].str.contains('AI',na=False)],
-        'Mismatch':      full_df[full_df['Recon_Status'].str.contains('Mismatch',na=False)],
-        'AI Matched':    full_df[full_df['Recon_Status'].str.contains('AI Matched',na=False)],
-        'Suggestions':   full_df[full_df['Recon_Status'].str.contains('Suggestion',na=False)],
-        'Manual':        full_df[full_df['Recon_Status'].str.contains('Manual',na=False)],
-        'Not In GSTR-2B':full_df[full_df['Recon_Status'].str.contains('Not in GSTR-2B',na=False)],
-        'Not In Books':  full_df[full_df['Recon_Status'].str.contains('Not in Books|Not in Purchase Books',na=False)],
+        'Matched':       full_df[_in(Flag.MATCHED, without=Flag.AI)],
+        'Mismatch':      full_df[_in(Flag.MISMATCH)],
+        'AI Matched':    full_df[_in(Flag.AI)],
+        'Suggestions':   full_df[_in(Flag.SUGGESTION)],
+        'Manual':        full_df[_in(Flag.MANUAL)],
+        'Not In GSTR-2B':full_df[_in(Flag.NOT_IN_2B)],
+        'Not In Books':  full_df[_in(Flag.NOT_IN_BOOKS)],
     }
     for name,df_sub in sheets.items():
         if df_sub.empty: continue
@@ -525,8 +547,8 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
         for c in cols:
             if c not in df_sub.columns: df_sub[c]=np.nan
         df_export=df_sub[cols].copy(); df_export.columns=heads
-        df_export.to_excel(writer,sheet_name=name,startrow=7,header=False,index=False)
-        ws=writer.sheets[name]
+        # Rows top to bottom (streaming mode): meta + headers first, data from row 7
+        ws=wb.add_worksheet(name)
         write_meta(ws,f"Report :: {name}",len(heads)-1)
         ws.freeze_panes(7,4)
         if name=='Suggestions':
@@ -544,6 +566,6 @@ def generate_excel(full_df, company_gstin, company_name, fy, period, cdnr_df=Non
                 ws.write(6,i,h,fmt_orange if 2<=i<=7 else fmt_green if 8<=i<=13 else fmt_gray if 14<=i<=17 else fmt_yellow if i==19 else fmt_blue)
             ws.set_column(3,3,12,fmt_date_col); ws.set_column(9,9,12,fmt_date_col)
         ws.set_column(0,1,20); ws.set_column(2,2,18); ws.set_column(8,8,18)
+        write_frame(wb,writer,df_export,name,startrow=7,header=False)
 
-    writer.close()
-    return output.getvalue()
+    return close_workbook(wb, writer, target)
@@ -0,0 +1,202 @@
+# modules/report_jobs.py  — v1.0
+# Background report jobs for the report hub
+#   - submit_report() queues a report builder (generate_excel, the CDNR /
+#     combined writers, the ITC PDF …) on a small thread pool
+#     (GST_REPORT_WORKERS, default 2) and returns a job id at once, so the
+#     Streamlit script run never waits for Excel / PDF generation
+#   - Every artifact is written into the client folder (a temp folder when
+#     there is none) under a temporary name and renamed when complete
+#   - report_jobs (created by db_handler.init_db) records status (queued /
+#     running / done / failed), the artifact path, timings and the error, so
+#     the UI can poll job_status() — a plain read
+#   - A job is keyed by report kind, file and a fingerprint of its inputs
+#     (DataFrame contents + arguments): script reruns and re-downloads reuse
+#     the running or finished job instead of rebuilding the report
+#   - Threads, not processes: builders get the session's DataFrames without
+#     pickling (DataFrame arguments are copied at submit, so edits made in
+#     the UI meanwhile don't race the writer)
+
+import datetime
+import hashlib
+import inspect
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from .db_handler import backend, connection, transaction
+
+REPORT_WORKERS = int(os.environ.get("GST_REPORT_WORKERS", 2))
+SCRATCH_DIR    = os.path.join(tempfile.gettempdir(), "gst_reports")
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_executor = None
+_futures  = {}                  # job id → Future, for jobs submitted by this process
+_lock     = threading.RLock()
+
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, REPORT_WORKERS),
+                                           thread_name_prefix="report-job")
+        return _executor
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# JOB KEYS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _frame_digest(df):
+    h = hashlib.sha1(repr((df.shape, list(df.columns))).encode())
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    except TypeError:
+        h.update(uuid.uuid4().bytes)            # unhashable cells: never shared
+    return h.digest()
+
+
+def job_key(kind, path, args=(), kwargs=None, memo=None):
+    """
+    Content key of a report: same kind, file and inputs → same artifact.
+    memo (id → digest) lets one batch hash each DataFrame once.
+    """
+    memo = {} if memo is None else memo
+    h = hashlib.sha1(f"{kind}|{path}".encode())
+    for name, value in list(enumerate(args)) + sorted((kwargs or {}).items()):
+        h.update(repr(name).encode())
+        if isinstance(value, pd.DataFrame):
+            if id(value) not in memo:
+                memo[id(value)] = _frame_digest(value)
+            h.update(memo[id(value)])
+        else:
+            h.update(repr(value).encode())
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# SUBMIT / RUN
+# ══════════════════════════════════════════════════════════════════════════════
+
+def _set(job_id, **cols):
+    with transaction() as conn:
+        conn.execute(f"UPDATE report_jobs SET {', '.join(f'{c}=?' for c in cols)} WHERE id=?",
+                     tuple(cols.values()) + (job_id,))
+
+
+def _run(job_id, path, builder, args, kwargs):
+    tmp = os.path.join(os.path.dirname(path), f".job{job_id}_{os.path.basename(path)}")
+    started = time.time()
+    _set(job_id, status=RUNNING, started_at=_now())
+    try:
+        if 'path' in inspect.signature(builder).parameters:
+            kwargs = dict(kwargs, path=tmp)
+        out = builder(*args, **kwargs)
+        if out is not None and not isinstance(out, str):    # bytes / BytesIO
+            with open(tmp, 'wb') as fh:
+                fh.write(out.getvalue() if hasattr(out, 'getvalue') else out)
+        os.replace(tmp, path)
+        with transaction() as conn:
+            _set(job_id, status=DONE, finished_at=_now(), seconds=round(time.time() - started, 2))
+            # the file now holds this job's report — older jobs for it are stale
+            conn.execute("DELETE FROM report_jobs WHERE path=? AND id<>?", (path, job_id))
+    except Exception as e:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        _set(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", finished_at=_now(),
+             seconds=round(time.time() - started, 2))
+    finally:
+        with _lock:
+            _futures.pop(job_id, None)
+
+
+def submit_report(kind, folder, fname, builder, *args, _memo=None, **kwargs):
+    """
+    Queues builder(*args, **kwargs) and returns the job id. Builders with a
+    `path` parameter write the file themselves; others return bytes / BytesIO.
+    An identical job that is still running, or finished with its file on
+    disk, is returned instead of starting a new one.
+    """
+    folder = folder or SCRATCH_DIR
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, fname)
+    key  = job_key(kind, path, args, kwargs, _memo)
+    with transaction() as conn:
+        row = conn.execute("SELECT id, status, path FROM report_jobs WHERE job_key=? "
+                           "ORDER BY id DESC LIMIT 1", (key,)).fetchone()
+        if row is not None:
+            job_id, status, done_path = row
+            if status == DONE and os.path.exists(done_path):
+                return job_id
+            if status in (QUEUED, RUNNING) and job_id in _futures:
+                return job_id
+        conn.execute("DELETE FROM report_jobs WHERE job_key=?", (key,))   # failed / stale
+        job_id = backend().insert_returning_id(
+            conn, "INSERT INTO report_jobs (job_key, kind, fname, path, status, submitted_at) "
+                  "VALUES (?,?,?,?,?,?)", (key, kind, fname, path, QUEUED, _now()))
+    args   = tuple(a.copy() if isinstance(a, pd.DataFrame) else a for a in args)
+    kwargs = {k: v.copy() if isinstance(v, pd.DataFrame) else v for k, v in kwargs.items()}
+    with _lock:
+        _futures[job_id] = _pool().submit(_run, job_id, path, builder, args, kwargs)
+    return job_id
+
+
+def submit_reports(folder, specs):
+    """
+    Batch submit for the report hub: specs is [(kind, fname, builder, args,
+    kwargs)]; returns {kind: job id}. Shared DataFrames are hashed once.
+    """
+    memo = {}
+    return {kind: submit_report(kind, folder, fname, builder, *args, _memo=memo, **kwargs)
+            for kind, fname, builder, args, kwargs in specs}
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+# STATUS / ARTIFACTS
+# ══════════════════════════════════════════════════════════════════════════════
+
+_JOB_COLS = ('id', 'kind', 'fname', 'path', 'status', 'error',
+             'submitted_at', 'started_at', 'finished_at', 'seconds')
+
+
+def job_status(job_id):
+    """The job's report_jobs row as a dict (None if unknown)."""
+    with connection() as conn:
+        row = conn.execute(f"SELECT {', '.join(_JOB_COLS)} FROM report_jobs WHERE id=?",
+                           (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(_JOB_COLS, row))
+    if job['status'] in (QUEUED, RUNNING) and job_id not in _futures:
+        job['status'], job['error'] = FAILED, "Interrupted — the app was restarted"
+    return job
+
+
+def is_pending(job):
+    return job is not None and job['status'] in (QUEUED, RUNNING)
+
+
+def read_artifact(job):
+    """The finished report's bytes (None until done, or if the file was removed)."""
+    if job is None or job['status'] != DONE or not os.path.exists(job['path']):
+        return None
+    with open(job['path'], 'rb') as fh:
+        return fh.read()
+
+
+def get_report_jobs(limit=200):
+    """Recent jobs, newest first (for the history / maintenance views)."""
+    with connection() as conn:
+        return pd.read_sql(f"SELECT {', '.join(_JOB_COLS)} FROM report_jobs ORDER BY id DESC LIMIT ?",
+                           conn, params=(int(limit),))
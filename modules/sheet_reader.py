@@ -0,0 +1,397 @@
+# modules/sheet_reader.py  — v1.0
+# Streaming sheet reader shared by the upload loaders.
+#   - Rows come from python-calamine when installed, else openpyxl read_only
+#   - Header row is detected while streaming (the sheet is read exactly once)
+#   - NIC two-row headers are merged from the row above the header
+#   - Values are collected column-wise and typed once per column at the end
+
+import csv
+import datetime
+import io
+import itertools
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    from python_calamine import CalamineWorkbook   # optional Rust-backed reader
+except ImportError:
+    CalamineWorkbook = None
+
+import openpyxl
+
+HEADER_SCAN_ROWS = 25
+
+
+# ────────────────────────────────────────────────────────────
+# HEADER HEURISTICS  (same rules the pandas loader used)
+# ────────────────────────────────────────────────────────────
+
+def _row_text(values):
+    return " ".join(str(v).lower() for v in values if v is not None)
+
+def is_primary_header(values):
+    """Row names the invoice number column — the strongest header signal."""
+    txt = _row_text(values)
+    return 'invoice number' in txt or 'invoice no' in txt
+
+def is_fallback_header(values):
+    """Row names both GSTIN and a date column (registers without 'Invoice No')."""
+    txt = _row_text(values)
+    return 'gstin' in txt and 'date' in txt
+
+def detect_header_index(rows):
+    """
+    Returns the header index inside a list of scanned rows.
+    Primary rule wins; otherwise the first GSTIN+Date row; otherwise 0.
+    """
+    for idx, row in enumerate(rows):
+        if is_primary_header(row):
+            return idx
+    for idx, row in enumerate(rows):
+        if is_fallback_header(row):
+            return idx
+    return 0
+
+def _blank(v):
+    return v is None or (isinstance(v, str) and v.strip() == "")
+
+def build_column_names(header, row_above=None):
+    """
+    Turns the raw header row into unique column names.
+    Blank header cells take the label from the row above (NIC layout:
+    'GSTIN of supplier' sits one row above 'Invoice number'); anything still
+    blank becomes 'Unnamed: i'. Duplicates get '.1', '.2' … like pandas.
+    """
+    names = []
+    for i, val in enumerate(header):
+        if _blank(val):
+            above = row_above[i] if row_above is not None and i < len(row_above) else None
+            names.append(str(above).strip() if not _blank(above) else f"Unnamed: {i}")
+        else:
+            names.append(val)
+
+    seen, unique = {}, []
+    for n in names:
+        if n in seen:
+            seen[n] += 1
+            unique.append(f"{n}.{seen[n]}")
+        else:
+            seen[n] = 0
+            unique.append(n)
+    return unique
+
+
+# ────────────────────────────────────────────────────────────
+# ROW SOURCES
+# ────────────────────────────────────────────────────────────
+
+def list_sheets(file_obj):
+    """Sheet names without parsing any sheet data."""
+    file_obj.seek(0)
+    if CalamineWorkbook is not None:
+        try:
+            return list(CalamineWorkbook.from_filelike(file_obj).sheet_names)
+        except Exception:
+            file_obj.seek(0)
+    wb = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+def _calamine_value(v):
+    """Aligns calamine cell values with what openpyxl / pandas would give."""
+    if isinstance(v, str):
+        return None if v == "" else v          # calamine reports empty cells as ""
+    if isinstance(v, float) and v.is_integer():
+        return int(v)                          # 2364.0 → 2364 (pandas convert_float)
+    if type(v) is datetime.date:
+        return datetime.datetime(v.year, v.month, v.day)
+    return v
+
+def _calamine_rows(sheet):
+    """
+    Rows from A1, like openpyxl, so header_idx (and the stored layout profile)
+    means the same row on both paths. calamine starts at the sheet's used
+    range: leading empty columns are put back, and so are leading empty rows
+    when the iterator skipped them (the first row it gives is then the first
+    used row, which is never blank).
+    """
+    if not hasattr(sheet, 'iter_rows'):
+        for row in sheet.to_python(skip_empty_area=False):
+            yield tuple(_calamine_value(v) for v in row)
+        return
+    start_row, start_col = getattr(sheet, 'start', None) or (0, 0)
+    pad = (None,) * start_col
+    rows = iter(sheet.iter_rows())
+    first = next(rows, None)
+    if first is None:
+        return
+    if start_row and any(v != "" for v in first):
+        blank = pad + (None,) * len(first)
+        for _ in range(start_row):
+            yield blank
+    for row in itertools.chain([first], rows):
+        yield pad + tuple(_calamine_value(v) for v in row)
+
+def _openpyxl_rows(file_obj, sheet_name):
+    wb = openpyxl.load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        yield from wb[sheet_name].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+def iter_sheet_rows(file_obj, sheet_name):
+    """Returns an iterator over the sheet's rows as tuples (None = empty cell)."""
+    file_obj.seek(0)
+    if CalamineWorkbook is not None:
+        try:
+            sheet = CalamineWorkbook.from_filelike(file_obj).get_sheet_by_name(sheet_name)
+            return _calamine_rows(sheet)
+        except Exception:
+            file_obj.seek(0)
+    return _openpyxl_rows(file_obj, sheet_name)
+
+
+# ────────────────────────────────────────────────────────────
+# COLUMNAR BUILDER
+# ────────────────────────────────────────────────────────────
+
+class ColumnCollector:
+    """
+    Accumulates data rows as per-column lists so the frame is built column by
+    column (each column typed on its own) instead of from a list of row dicts.
+    """
+
+    def __init__(self, names):
+        self.names   = list(names)
+        self.columns = [[] for _ in self.names]
+        self.n_rows  = 0
+
+    def add(self, row):
+        if all(_blank(v) for v in row):
+            return
+        width = len(self.names)
+        if len(row) > width and any(not _blank(v) for v in row[width:]):
+            # Data wider than the header — open extra columns, back-filled with None
+            for i in range(width, len(row)):
+                self.names.append(f"Unnamed: {i}")
+                self.columns.append([None] * self.n_rows)
+            width = len(self.names)
+        for i in range(width):
+            self.columns[i].append(row[i] if i < len(row) else None)
+        self.n_rows += 1
+
+    def to_frame(self):
+        names = build_column_names(self.names)
+        return pd.DataFrame({n: pd.Series(col) for n, col in zip(names, self.columns)},
+                            columns=names)
+
+
+def positional_frame(rows):
+    """
+    Header-less rows → frame with integer column labels 0..n (like
+    read_excel(header=None)), blank rows dropped, each column typed on its own.
+    """
+    rows = list(rows)
+    collector = ColumnCollector(range(max((len(r) for r in rows), default=0)))
+    for row in rows:
+        collector.add(row)
+    return collector.to_frame()
+
+
+def read_rows_with_header(rows, scan_rows=HEADER_SCAN_ROWS, header_idx=None):
+    """
+    Consumes a row iterator once: buffers at most `scan_rows` rows to find the
+    header, then streams the rest straight into a ColumnCollector.
+    Pass `header_idx` to skip detection for a known layout.
+    Returns (DataFrame, header_idx).
+    """
+    rows = iter(rows)
+    buffer = []
+    if header_idx is None:
+        for row in rows:
+            buffer.append(row)
+            if is_primary_header(row):
+                break
+            if len(buffer) >= scan_rows:
+                break
+        header_idx = detect_header_index(buffer)
+    else:
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) > header_idx:
+                break
+
+    if not buffer:
+        return pd.DataFrame(), 0
+    header_idx = min(header_idx, len(buffer) - 1)
+
+    header    = buffer[header_idx]
+    row_above = buffer[header_idx - 1] if header_idx > 0 else None
+    collector = ColumnCollector(build_column_names(header, row_above))
+
+    for row in buffer[header_idx + 1:]:
+        collector.add(row)
+    for row in rows:
+        collector.add(row)
+    return collector.to_frame(), header_idx
+
+
+def read_sheet(file_obj, sheet_name, header_idx=None):
+    """Streams one sheet into a DataFrame. Returns (DataFrame, header_idx)."""
+    return read_rows_with_header(iter_sheet_rows(file_obj, sheet_name), header_idx=header_idx)
+
+
+# ────────────────────────────────────────────────────────────
+# CSV SOURCE  (Tally / Busy / ERP exports)
+# ────────────────────────────────────────────────────────────
+
+CSV_CHUNK_ROWS  = 100_000
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS  = ',;\t|'
+
+# Header words that mark a money column — these are coerced to float per chunk.
+# Whole words only: 'State/UT' alone is a place of supply, 'State/UT Tax' is money
+_MONEY_RE = re.compile(
+    r'(?<![a-z])(value|amount|amt|taxable|tax paid|igst|cgst|sgst|utgst|cess|total'
+    r'|(integrated|central|state|state/ut|ut) tax)(?![a-z])')
+# …unless the header also names an identifier / text field ('Total Type',
+# 'Place of Supply (State/UT)', 'Invoice Value Date', 'Tax Period')
+_TEXT_RE = re.compile(
+    r'(?<![a-z])(date|period|place|supply|name|type|gstin|number|no|code|status|rate)(?![a-z])')
+
+try:
+    TEXT_DTYPE = pd.StringDtype(na_value=float('nan'))   # typed strings, NaN semantics
+except TypeError:                                        # pandas < 2.3
+    TEXT_DTYPE = str
+
+
+def is_csv_upload(file_obj):
+    """True for text uploads. xlsx files are zip archives and start with 'PK'."""
+    name = str(getattr(file_obj, 'name', '')).lower()
+    if name.endswith('.csv'):
+        return True
+    if name.endswith(('.xlsx', '.xlsm', '.xls', '.json')):
+        return False
+    file_obj.seek(0)
+    head = file_obj.read(64)
+    file_obj.seek(0)
+    if isinstance(head, str):
+        head = head.encode('utf-8', errors='ignore')
+    if head.lstrip(b'\xef\xbb\xbf \t\r\n')[:1] in (b'{', b'['):
+        return False                                     # GSTR-2B JSON
+    return not head.startswith(b'PK') and not head.startswith(b'\xd0\xcf')
+
+def sniff_csv(file_obj):
+    """
+    Returns (encoding, delimiter) from the first 64 KB.
+    BOMs win; otherwise UTF-8 if it decodes, else cp1252 (Windows ERP default).
+    """
+    file_obj.seek(0)
+    raw = file_obj.read(CSV_SNIFF_BYTES)
+    file_obj.seek(0)
+
+    if raw.startswith(b'\xef\xbb\xbf'):
+        encoding = 'utf-8-sig'
+    elif raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        encoding = 'utf-16'
+    else:
+        encoding = 'cp1252'
+        for enc in ('utf-8', 'cp1252'):
+            try:
+                # A multi-byte char may be cut at the sample edge — ignore the tail
+                raw.decode(enc) if len(raw) < CSV_SNIFF_BYTES else raw[:-4].decode(enc)
+                encoding = enc
+                break
+            except UnicodeDecodeError:
+                continue
+
+    sample = raw.decode(encoding, errors='ignore')
+    try:
+        delimiter = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        delimiter = ','
+    return encoding, delimiter
+
+def _is_money_column(name):
+    n = str(name).lower()
+    return bool(_MONEY_RE.search(n)) and not _TEXT_RE.search(n)
+
+def normalize_chunk(chunk, money_cols):
+    """
+    Per-chunk normalisation kernel:
+      1. strip text, blank → NaN, drop fully-empty rows
+      2. money columns → float64 (commas removed); a column whose text does
+         not parse is left as text and reported back so later chunks agree
+      3. everything else → typed string column
+    Returns (chunk, columns that failed numeric coercion).
+    """
+    chunk = chunk.apply(lambda s: s.str.strip()).replace('', np.nan)
+    chunk = chunk.dropna(how='all')
+    demoted = set()
+    for col in chunk.columns:
+        if col in money_cols:
+            num = pd.to_numeric(chunk[col].str.replace(',', '', regex=False), errors='coerce')
+            if num.notna().sum() == chunk[col].notna().sum():
+                chunk[col] = num.astype('float64')
+                continue
+            demoted.add(col)
+        chunk[col] = chunk[col].astype(TEXT_DTYPE)
+    return chunk, demoted
+
+def read_csv_sheet(file_obj, chunk_rows=CSV_CHUNK_ROWS, header_idx=None):
+    """
+    Chunked CSV loader sharing the Excel header heuristics.
+    Returns (DataFrame, header_idx).
+    """
+    encoding, delimiter = sniff_csv(file_obj)
+
+    # Header scan on the first rows only
+    text = io.TextIOWrapper(file_obj, encoding=encoding, errors='replace', newline='')
+    try:
+        scan = list(itertools.islice(csv.reader(text, delimiter=delimiter), HEADER_SCAN_ROWS))
+    finally:
+        text.detach()
+    scan = [tuple(None if _blank(v) else v.strip() for v in r) for r in scan]
+    if not scan:
+        return pd.DataFrame(), 0
+    if header_idx is None:
+        header_idx = detect_header_index(scan)
+    header_idx = min(header_idx, len(scan) - 1)
+
+    width = max(len(r) for r in scan)
+    header = list(scan[header_idx]) + [None] * (width - len(scan[header_idx]))
+    names  = build_column_names(header, scan[header_idx - 1] if header_idx > 0 else None)
+    money_cols = {n for n in names if _is_money_column(n)}
+
+    # header_idx counts csv records, not lines (a quoted cell may span lines):
+    # step over the same records with csv.reader, then hand pandas the rest
+    file_obj.seek(0)
+    text = io.TextIOWrapper(file_obj, encoding=encoding, errors='replace', newline='')
+    try:
+        for _ in itertools.islice(csv.reader(text, delimiter=delimiter), header_idx + 1):
+            pass
+        reader = pd.read_csv(text, sep=delimiter, header=None, names=names, index_col=False,
+                             dtype=str, keep_default_na=False, skip_blank_lines=True,
+                             chunksize=chunk_rows)
+        chunks, demoted = [], set()
+        for chunk in reader:
+            chunk, failed = normalize_chunk(chunk, money_cols - demoted)
+            demoted |= failed
+            chunks.append(chunk)
+    finally:
+        text.detach()
+    file_obj.seek(0)
+
+    if not chunks:
+        return pd.DataFrame(columns=names), header_idx
+    df = pd.concat(chunks, ignore_index=True)
+    for col in demoted:
+        # A later chunk held text in a money column — keep the whole column as
+        # text; clean_currency still parses the chunks converted earlier.
+        if df[col].dtype != TEXT_DTYPE:
+            df[col] = df[col].astype(TEXT_DTYPE)
+    return df, header_idx
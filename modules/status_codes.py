@@ -0,0 +1,195 @@
+# modules/status_codes.py  — v1.0
+# Reconciliation status codes
+#   - Status enumerates every label the B2B / CDNR engines (and the Old ITC
+#     re-tag) write into Recon_Status / Recon_Status_CDNR; the display labels
+#     themselves are unchanged
+#   - Flag is a bitmask describing a label (matched, AI, mismatch, not in 2B /
+#     books, suggestion, group, manual, tax error, old ITC) plus the side(s)
+#     of the row. label_flags() derives it from the label text with the same
+#     substring rules the old str.contains filters used, so statuses read back
+#     from imports or older runs classify exactly as before
+#   - encode_statuses() stores Recon_Status / Recon_Status_CDNR / Match_Logic
+#     as categoricals (known labels + whatever else the frame holds, sorted
+#     like plain strings). status_flags() then turns a status column into one
+#     flag per row by looking up the categories once and indexing with the
+#     codes: filters are integer comparisons, not a regex scan per row
+#   - Categories include labels a frame doesn't use: count statuses with
+#     status_counts(), not value_counts(), to skip the zero rows
+
+from enum import IntEnum, IntFlag
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+STATUS_COLUMNS = ('Recon_Status', 'Recon_Status_CDNR')
+
+
+class Status(IntEnum):
+    MATCHED                 = 1
+    AI_DATE_MISMATCH        = 2
+    AI_INVOICE_MISMATCH     = 3
+    AI_VALUE_MISMATCH       = 4
+    SUGGESTION              = 5
+    GROUP_SUGGESTION        = 6
+    MANUALLY_LINKED         = 7
+    NOT_IN_2B               = 8
+    NOT_IN_BOOKS            = 9
+    TAX_ERROR               = 10
+    OLD_ITC                 = 11
+    CDNR_MATCHED            = 21
+    CDNR_AI_DATE_MISMATCH   = 22
+    CDNR_AI_TAXABLE_MISMATCH = 23
+    CDNR_AI_MISMATCH        = 24
+    CDNR_SUGGESTION         = 25
+    CDNR_GROUP_SUGGESTION   = 26
+    CDNR_NOT_IN_2B          = 28
+    CDNR_NOT_IN_BOOKS       = 29
+    CDNR_TAX_ERROR          = 30
+
+    @property
+    def label(self):
+        return STATUS_LABELS[self]
+
+
+STATUS_LABELS = {
+    Status.MATCHED:                  'Matched',
+    Status.AI_DATE_MISMATCH:         'AI Matched (Date Mismatch)',
+    Status.AI_INVOICE_MISMATCH:      'AI Matched (Invoice Mismatch)',
+    Status.AI_VALUE_MISMATCH:        'AI Matched (Mismatch)',
+    Status.SUGGESTION:               'Suggestion',
+    Status.GROUP_SUGGESTION:         'Suggestion (Group Match)',
+    Status.MANUALLY_LINKED:          'Manually Linked',
+    Status.NOT_IN_2B:                'Invoices Not in GSTR-2B',
+    Status.NOT_IN_BOOKS:             'Invoices Not in Purchase Books',
+    Status.TAX_ERROR:                'Matched (Tax Error)',
+    Status.OLD_ITC:                  'Old ITC (Previous Year)',
+    Status.CDNR_MATCHED:             'CDNR Matched',
+    Status.CDNR_AI_DATE_MISMATCH:    'CDNR AI Matched (Date Mismatch)',
+    Status.CDNR_AI_TAXABLE_MISMATCH: 'CDNR AI Matched (Taxable Mismatch)',
+    Status.CDNR_AI_MISMATCH:         'CDNR AI Matched (Mismatch)',
+    Status.CDNR_SUGGESTION:          'CDNR Suggestion',
+    Status.CDNR_GROUP_SUGGESTION:    'CDNR Suggestion (Group Match)',
+    Status.CDNR_NOT_IN_2B:           'CDNR Not in GSTR-2B',
+    Status.CDNR_NOT_IN_BOOKS:        'CDNR Not in Books',
+    Status.CDNR_TAX_ERROR:           'CDNR Matched (Tax Error)',
+}
+STATUS_BY_LABEL = {label: status for status, label in STATUS_LABELS.items()}
+
+MATCH_LOGIC_LABELS = (
+    'Exact Match', 'Date Mismatch', 'Invoice Mismatch', 'Value Mismatch',
+    'Inv No + Val Match', 'Date + Val Match', 'Value Match (Approx)',
+    'Total Value Matches', 'User Selection', 'Unmatched',
+    'Exact: GSTIN+Date+Taxable', 'Taxable Mismatch', 'Type+Value Match',
+    'Cross-GSTIN Type+Value',
+)
+
+
+class Flag(IntFlag):
+    MATCHED      = 1 << 0       # label contains 'Matched'
+    AI           = 1 << 1
+    MISMATCH     = 1 << 2
+    NOT_IN_2B    = 1 << 3
+    NOT_IN_BOOKS = 1 << 4
+    NOT_IN       = 1 << 5       # any 'Not in …'
+    SUGGESTION   = 1 << 6
+    GROUP        = 1 << 7
+    MANUAL       = 1 << 8
+    TAX_ERROR    = 1 << 9
+    OLD_ITC      = 1 << 10
+    CDNR         = 1 << 11
+    EXACT        = 1 << 12      # plain 'Matched' / 'CDNR Matched'
+    BOOKS        = 1 << 13      # row has a Purchase Books side
+    GST          = 1 << 14      # row has a GSTR-2B side
+
+
+# Open issues: what 'Not in|Mismatch|Suggestion|Manual|Tax Error' selected
+ISSUE = Flag.NOT_IN | Flag.MISMATCH | Flag.SUGGESTION | Flag.MANUAL | Flag.TAX_ERROR
+# Substrings behind ISSUE (for SQL over stored status text)
+ISSUE_MARKERS = ('Not in', 'Mismatch', 'Suggestion', 'Manual', 'Tax Error')
+
+_MARKERS = (
+    ('Matched',     Flag.MATCHED),
+    ('AI',          Flag.AI),
+    ('Mismatch',    Flag.MISMATCH),
+    ('Not in',      Flag.NOT_IN),
+    ('Suggestion',  Flag.SUGGESTION),
+    ('Group Match', Flag.GROUP),
+    ('Manual',      Flag.MANUAL),
+    ('Tax Error',   Flag.TAX_ERROR),
+    ('Old ITC',     Flag.OLD_ITC),
+    ('CDNR',        Flag.CDNR),
+)
+
+
+@lru_cache(maxsize=1024)
+def label_flags(label):
+    """Flag of one status label (0 for a missing status)."""
+    if not isinstance(label, str) or not label:
+        return Flag(0)
+    f = Flag(0)
+    for marker, bit in _MARKERS:
+        if marker in label:
+            f |= bit
+    if 'Not in GSTR-2B' in label:
+        f |= Flag.NOT_IN_2B
+    if 'Not in Books' in label or 'Not in Purchase Books' in label:
+        f |= Flag.NOT_IN_BOOKS
+    if label in ('Matched', 'CDNR Matched'):
+        f |= Flag.EXACT
+    if f & Flag.NOT_IN_2B:
+        f |= Flag.BOOKS
+    elif f & (Flag.NOT_IN_BOOKS | Flag.OLD_ITC):
+        f |= Flag.GST
+    else:
+        f |= Flag.BOOKS | Flag.GST
+    return f
+
+
+def status_column(df):
+    """CDNR results carry Recon_Status_CDNR; B2B results Recon_Status."""
+    return 'Recon_Status_CDNR' if 'Recon_Status_CDNR' in df.columns else 'Recon_Status'
+
+
+def _categorical(series, known):
+    values = series.dropna().unique() if not isinstance(series.dtype, pd.CategoricalDtype) \
+        else series.cat.categories
+    cats = sorted(set(known) | {str(v) for v in values})
+    return series.astype(object).where(series.notna(), None).astype(pd.CategoricalDtype(cats))
+
+
+def encode_statuses(df):
+    """Stores the status / Match_Logic columns of df as categoricals (in place); returns df."""
+    if df is None:
+        return df
+    for col in STATUS_COLUMNS:
+        if col in df.columns:
+            df[col] = _categorical(df[col], STATUS_LABELS.values())
+    if 'Match_Logic' in df.columns:
+        df['Match_Logic'] = _categorical(df['Match_Logic'], MATCH_LOGIC_LABELS)
+    return df
+
+
+def status_flags(series):
+    """One Flag value per row (int64 ndarray); NaN → 0."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, cats = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, cats = pd.factorize(series)
+    table = np.array([int(label_flags(c)) for c in cats] + [0], dtype='int64')
+    return table[codes]                     # code -1 (NaN) picks the trailing 0
+
+
+def has_flag(series, flag, without=0):
+    """Boolean Series: rows whose status has any bit of `flag` and none of `without`."""
+    f = status_flags(series)
+    mask = (f & int(flag)) != 0
+    if without:
+        mask &= (f & int(without)) == 0
+    return pd.Series(mask, index=series.index)
+
+
+def status_counts(series):
+    """value_counts of the statuses present (no zero rows for unused categories)."""
+    counts = series.value_counts()
+    return counts[counts > 0]
@@ -0,0 +1,151 @@
+# modules/upload_cache.py  — v1.0
+# Disk cache for parsed uploads (GST_Clients_Data/_upload_cache)
+#   - Key = SHA-256 of the upload bytes + LOADER_VERSION + reader name, so the
+#     same 2B / books file re-uploaded next week (or after an exe restart)
+#     skips the xlsx parse entirely
+#   - Each cached result is a folder: manifest.json + one Parquet per frame
+#   - Size-bounded LRU: hits touch the manifest mtime, oldest entries are
+#     evicted once the folder grows past CACHE_MAX_BYTES
+#   - Best effort: pyarrow missing / disk errors simply fall through to the reader
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from .columnar import arrow_available, frame_to_parquet, parquet_to_frame
+from .file_manager import BASE_DIR
+
+# Bump whenever a wrapped reader's output changes shape or typing.
+LOADER_VERSION  = "2"
+CACHE_DIR       = os.path.join(BASE_DIR, "_upload_cache")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+_MANIFEST       = "manifest.json"
+
+
+def _upload_bytes(file_obj):
+    if hasattr(file_obj, 'getvalue'):
+        return file_obj.getvalue()
+    file_obj.seek(0)
+    data = file_obj.read()
+    file_obj.seek(0)
+    return data
+
+
+def content_key(file_obj, reader_name):
+    h = hashlib.sha256(_upload_bytes(file_obj))
+    h.update(f"|{LOADER_VERSION}|{reader_name}".encode())
+    return h.hexdigest()
+
+
+# ── Result ⇄ folder ───────────────────────────────────────────────────────────
+# Readers return a DataFrame, None, or a tuple of DataFrames / None / str.
+def _cacheable(result):
+    parts = result if isinstance(result, tuple) else (result,)
+    if not any(isinstance(p, pd.DataFrame) for p in parts):
+        return False      # failures / "not found" are cheap to recompute
+    return all(p is None or isinstance(p, (pd.DataFrame, str, int, float, bool)) for p in parts)
+
+
+def _store(key, result):
+    final = os.path.join(CACHE_DIR, key)
+    tmp   = f"{final}.tmp{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    try:
+        parts = result if isinstance(result, tuple) else (result,)
+        manifest = {'tuple': isinstance(result, tuple), 'parts': []}
+        for i, p in enumerate(parts):
+            if isinstance(p, pd.DataFrame):
+                with open(os.path.join(tmp, f"{i}.parquet"), "wb") as f:
+                    f.write(frame_to_parquet(p))
+                manifest['parts'].append({'frame': f"{i}.parquet"})
+            else:
+                manifest['parts'].append({'value': p})
+        with open(os.path.join(tmp, _MANIFEST), "w") as f:
+            json.dump(manifest, f)
+        if os.path.isdir(final):
+            shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _load(key):
+    folder   = os.path.join(CACHE_DIR, key)
+    manifest = os.path.join(folder, _MANIFEST)
+    if not os.path.isfile(manifest):
+        return None, False
+    with open(manifest) as f:
+        spec = json.load(f)
+    parts = [parquet_to_frame(os.path.join(folder, p['frame'])) if 'frame' in p else p['value']
+             for p in spec['parts']]
+    os.utime(manifest)                       # LRU touch
+    return (tuple(parts) if spec['tuple'] else parts[0]), True
+
+
+def _entry_size(folder):
+    return sum(e.stat().st_size for e in os.scandir(folder) if e.is_file())
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """Drops least-recently-used entries until the cache fits in max_bytes."""
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for e in os.scandir(CACHE_DIR):
+        if not e.is_dir():
+            continue
+        manifest = os.path.join(e.path, _MANIFEST)
+        if not os.path.isfile(manifest):
+            # Orphaned temp folder from a crashed write — drop it once it is stale
+            if time.time() - e.stat().st_mtime > 3600:
+                shutil.rmtree(e.path, ignore_errors=True)
+            continue
+        entries.append((os.stat(manifest).st_mtime, _entry_size(e.path), e.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def clear_cache():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def disk_cached(reader_name):
+    """
+    Decorator for single-argument upload readers (file_obj → result).
+    Serves a previously parsed copy of the same bytes from disk; on a miss the
+    reader runs and its result is written back for next time.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(file_obj):
+            if not arrow_available() or file_obj is None:
+                return fn(file_obj)
+            key = None
+            try:
+                key = content_key(file_obj, reader_name)
+                result, hit = _load(key)
+                if hit:
+                    return result
+            except Exception:
+                pass    # unreadable entry — re-parse and overwrite it
+
+            result = fn(file_obj)
+            if key and _cacheable(result):
+                try:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    _store(key, result)
+                    evict()
+                except Exception:
+                    pass
+            return result
+        return inner
+    return wrap
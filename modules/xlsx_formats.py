@@ -0,0 +1,37 @@
+# modules/xlsx_formats.py
+# Shared cell-format cache for the xlsxwriter report writers.
+#   - Row loops ask for a format per cell (status colour × number / text ×
+#     bold); without a cache every call is a new Format object, which costs
+#     CPU and memory on large runs
+#   - One cache per workbook, so helpers that write extra sheets into the
+#     same workbook (combined report, CDNR, vendor split) reuse the same
+#     Format objects; cached formats must not be modified after creation
+
+
+class FormatCache:
+    """Callable returning one Format per distinct property set: fmt(bold=True, border=1)."""
+
+    def __init__(self, wb):
+        self.wb = wb
+        self._formats = {}
+
+    def __call__(self, props=None, **kw):
+        props = dict(props or {}, **kw)
+        key = tuple(sorted((k, v if isinstance(v, (str, int, float, bool)) else repr(v))
+                           for k, v in props.items()))
+        fmt = self._formats.get(key)
+        if fmt is None:
+            fmt = self._formats[key] = self.wb.add_format(props)
+        return fmt
+
+    def __len__(self):
+        return len(self._formats)
+
+
+def format_cache(wb):
+    """The FormatCache attached to this workbook (created on first use)."""
+    cache = getattr(wb, '_gst_format_cache', None)
+    if cache is None:
+        cache = FormatCache(wb)
+        wb._gst_format_cache = cache
+    return cache
@@ -0,0 +1,91 @@
+# modules/xlsx_stream.py
+# Streaming (constant-memory) mode for the large Excel reports.
+#   - Small runs keep the pandas ExcelWriter layout in a BytesIO, unchanged
+#   - From STREAM_MIN_ROWS rows the workbook is written straight to a file
+#     with xlsxwriter's constant_memory option: each row is flushed to disk
+#     as soon as the next one starts, so memory stays flat. Rows of a sheet
+#     must therefore be written strictly top to bottom (cells written to an
+#     earlier row are silently dropped by xlsxwriter)
+#   - DataFrame sheets go through write_frame(): DataFrame.to_excel in the
+#     normal mode, a row-ordered writer that renders cells the same way
+#     (blank NaN, dd/mm/yyyy dates, plain header) in streaming mode
+
+import datetime
+import io
+
+import pandas as pd
+import xlsxwriter
+
+from .xlsx_formats import format_cache
+
+STREAM_MIN_ROWS = 50_000
+_STREAM_CHUNK   = 10_000           # rows converted to Python values at a time
+DATETIME_FORMAT = 'dd/mm/yyyy'
+
+
+def use_streaming(n_rows, path, streaming=None):
+    """streaming=None → automatic: only when writing to a file and the run is large."""
+    if path is None:
+        return False
+    return n_rows >= STREAM_MIN_ROWS if streaming is None else bool(streaming)
+
+
+def open_workbook(path=None, streaming=False):
+    """
+    (wb, writer, target). writer is the pandas ExcelWriter (None in streaming
+    mode); target is the BytesIO / path handed to close_workbook.
+    """
+    if streaming:
+        wb = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+        return wb, None, path
+    target = path if path is not None else io.BytesIO()
+    writer = pd.ExcelWriter(target, engine='xlsxwriter', datetime_format=DATETIME_FORMAT)
+    return writer.book, writer, target
+
+
+def close_workbook(wb, writer, target):
+    """Bytes for an in-memory workbook, else the file path."""
+    if writer is not None:
+        writer.close()
+    else:
+        wb.close()
+    return target.getvalue() if isinstance(target, io.BytesIO) else target
+
+
+def spacer_row(wb, ws, row, height):
+    """set_row for an empty spacer row. constant_memory only flushes rows that
+    hold a cell, so a blank cell keeps the row height when streaming."""
+    ws.set_row(row, height)
+    if ws.constant_memory:
+        ws.write_blank(row, 0, None, format_cache(wb)())
+
+
+def write_frame(wb, writer, df, sheet_name, startrow=0, header=True):
+    """Writes df into sheet_name (created if missing) from startrow; returns the worksheet."""
+    if writer is not None:
+        df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, header=header, index=False)
+        return writer.sheets[sheet_name]
+
+    ws = wb.get_worksheet_by_name(sheet_name) or wb.add_worksheet(sheet_name)
+    _f = format_cache(wb)
+    fmt_dt   = _f(num_format=DATETIME_FORMAT)
+    fmt_date = _f(num_format='YYYY-MM-DD')
+    row = startrow
+    if header:
+        for c, name in enumerate(df.columns):
+            ws.write(row, c, name)
+        row += 1
+    for start in range(0, len(df), _STREAM_CHUNK):
+        part = df.iloc[start:start + _STREAM_CHUNK]
+        for values in zip(*(part.iloc[:, i].tolist() for i in range(part.shape[1]))):
+            for c, v in enumerate(values):
+                if v is None or v is pd.NaT or v is pd.NA or (isinstance(v, float) and v != v):
+                    continue
+                if isinstance(v, datetime.datetime):
+                    ws.write_datetime(row, c, v, fmt_dt)
+                elif isinstance(v, datetime.date):
+                    ws.write_datetime(row, c, v, fmt_date)
+                else:
+                    ws.write(row, c, v)
+            row += 1
+    return ws
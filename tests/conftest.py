@@ -0,0 +1,95 @@
+# tests/conftest.py
+# Shared fixtures
+#   - db: db_handler on a fresh SQLite file under tmp_path, queued audit /
+#     follow-up writes applied inline (set_sync_writes)
+#   - b2b_frame / cdnr_frame: synthetic reconciliation results with the
+#     engines' column layout and status labels
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+B2B_STATUSES = [
+    'Matched', 'AI Matched (Date Mismatch)', 'AI Matched (Invoice Mismatch)',
+    'AI Matched (Mismatch)', 'Suggestion', 'Suggestion (Group Match)', 'Manually Linked',
+    'Invoices Not in GSTR-2B', 'Invoices Not in Purchase Books', 'Matched (Tax Error)',
+    'Old ITC (Previous Year)',
+]
+CDNR_STATUSES = [
+    'CDNR Matched', 'CDNR AI Matched (Date Mismatch)', 'CDNR AI Matched (Taxable Mismatch)',
+    'CDNR AI Matched (Mismatch)', 'CDNR Suggestion', 'CDNR Suggestion (Group Match)',
+    'CDNR Not in GSTR-2B', 'CDNR Not in Books', 'CDNR Matched (Tax Error)',
+]
+
+
+def make_b2b(n=600, seed=0, vendors=40):
+    r = np.random.default_rng(seed)
+    gstins = [f'27AAAPV{i % vendors:04d}A1Z{i % 10}' for i in range(n)]
+    d = {
+        'GSTIN': gstins, 'GSTIN_GST': gstins,
+        'Name of Party': [f'Vendor {i % vendors}' for i in range(n)],
+        'Recon_Status': r.choice(B2B_STATUSES, n),
+        'Match_Logic': r.choice(['Exact Match', 'Date Mismatch', 'Unmatched'], n),
+        'Invoice Number_BOOKS': [f'INV/{i:05d}' for i in range(n)],
+        'Invoice Number_GST': [f'INV/{i:05d}' for i in range(n)],
+        'Invoice Date_BOOKS': pd.Timestamp('2024-04-01') + pd.to_timedelta(r.integers(0, 300, n), 'D'),
+        'Invoice Date_GST': ['01/05/2024'] * n,
+    }
+    for side in ('BOOKS', 'GST'):
+        d[f'Taxable Value_{side}'] = np.where(r.random(n) < .1, np.nan, (r.random(n) * 1e5).round(2))
+        for tax in ('IGST', 'CGST', 'SGST'):
+            d[f'{tax}_{side}'] = (r.random(n) * 1e3).round(2)
+    return pd.DataFrame(d)
+
+
+def make_cdnr(n=200, seed=1, vendors=20):
+    r = np.random.default_rng(seed)
+    gstins = [f'27AAAPV{i % vendors:04d}A1Z{i % 10}' for i in range(n)]
+    d = {
+        'GSTIN': gstins, 'GSTIN_BOOKS': gstins, 'GSTIN_GST': gstins,
+        'Name of Party': [f'Vendor {i % vendors}' for i in range(n)],
+        'Recon_Status_CDNR': r.choice(CDNR_STATUSES, n),
+        'Note Number_BOOKS': [f'CN{i}' for i in range(n)],
+        'Note Number_GST': [f'CN{i}' for i in range(n)],
+        'Note Date_BOOKS': ['01/06/2024'] * n, 'Note Date_GST': ['02/06/2024'] * n,
+        'Note Type_GST': r.choice(['C', 'D'], n),
+    }
+    for side in ('BOOKS', 'GST'):
+        d[f'Taxable Value_{side}'] = (r.random(n) * 1e4).round(2)
+        for tax in ('IGST', 'CGST', 'SGST'):
+            d[f'{tax}_{side}'] = (r.random(n) * 1e2).round(2)
+    return pd.DataFrame(d)
+
+
+@pytest.fixture
+def b2b_frame():
+    return make_b2b()
+
+
+@pytest.fixture
+def cdnr_frame():
+    return make_cdnr()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    from modules import db_handler
+    monkeypatch.delenv("GST_DB_URL", raising=False)
+    monkeypatch.setattr(db_handler, "DB_NAME", str(tmp_path / "recon_history.db"))
+    sync = db_handler._sync_writes
+    db_handler.set_sync_writes(True)
+    db_handler.init_db()
+    yield db_handler
+    db_handler.flush_writes()                 # drop failures a test left unreported
+    db_handler.set_sync_writes(sync)
+    db_handler.backend().close()
+
+
+META = {'gstin': '27AAACC1234C1Z5', 'name': 'Client One', 'fy': '2024-25', 'period': 'April'}
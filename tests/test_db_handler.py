@@ -0,0 +1,36 @@
+# tests/test_db_handler.py
+# History store on SQLite: migrations and the recon_rows index
+
+from tests.conftest import META
+
+
+def _unindex(db, record_id):
+    with db.transaction() as conn:
+        db._unindex_search(conn, record_id)
+        conn.execute("DELETE FROM recon_rows WHERE recon_id=?", (record_id,))
+
+
+def _indexed(db, record_id):
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM recon_rows WHERE recon_id=?",
+                            (record_id,)).fetchone()[0]
+
+
+def test_init_db_backfills_legacy_runs_once(db, b2b_frame):
+    rid = db.save_reconciliation(META, b2b_frame)
+    _unindex(db, rid)                       # a run saved before recon_rows existed
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM db_meta")
+
+    db.init_db()
+    assert _indexed(db, rid) == len(b2b_frame)
+    assert len(db.search_history('INV/00007')) >= 1
+
+    _unindex(db, rid)
+    db.init_db()                            # flag set — not rescanned on every start
+    assert _indexed(db, rid) == 0
+
+
+def test_backfill_skips_indexed_runs(db, b2b_frame):
+    db.save_reconciliation(META, b2b_frame)
+    assert db.backfill_recon_rows() == 0
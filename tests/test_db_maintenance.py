@@ -0,0 +1,44 @@
+# tests/test_db_maintenance.py
+# Retention / archival on the local SQLite history
+
+import os
+
+import pytest
+
+from modules import db_maintenance
+from tests.conftest import META, make_b2b
+
+
+@pytest.fixture
+def archive_dir(monkeypatch, tmp_path):
+    path = tmp_path / '_archive'
+    monkeypatch.setattr(db_maintenance, 'ARCHIVE_DIR', str(path))
+    return path
+
+
+def _save_periods(db, periods):
+    return [db.save_reconciliation(dict(META, period=p), make_b2b(n=50, seed=i))
+            for i, p in enumerate(periods)]
+
+
+def test_maintenance_archives_and_restores(db, archive_dir):
+    ids = _save_periods(db, ['April', 'May', 'June'])
+    report = db_maintenance.run_maintenance(default_keep=1)
+    assert report['archived'] == 2 and not report['errors']
+    assert set(db.get_history_list()['id']) == {ids[2]}
+
+    arch = db_maintenance.get_archived_runs()
+    assert len(arch) == 2
+    row = arch.iloc[0]
+    new_id = db_maintenance.restore_archived_run(row['archive_file'], int(row['recon_id']))
+    assert new_id is not None
+    assert len(db.load_reconciliation(new_id)[1]) == 50
+    assert len(db_maintenance.get_archived_runs()) == 1
+
+
+def test_restore_with_missing_archive_file_returns_none(db, archive_dir):
+    rid = _save_periods(db, ['April'])[0]
+    path = db_maintenance.archive_run(rid)
+    os.remove(path)
+    assert db_maintenance.restore_archived_run(os.path.basename(path), rid) is None
+    assert len(db_maintenance.get_archived_runs()) == 1
@@ -0,0 +1,74 @@
+# tests/test_gstr2b_merger.py
+# Multi-month GSTR-2B merge: header template replay (values, formats,
+# merges incl. multi-row ones) and cross-file deduplication
+
+import io
+
+import openpyxl
+from openpyxl.styles import Font, PatternFill
+
+from modules.gstr2b_merger import SHEET_KEY_COLS, encode_keys, merge_gstr2b_files, new_row_mask
+
+HEADER = ['GSTIN of supplier', 'Trade/Legal name', 'Invoice number', 'Invoice type',
+          'Invoice Date', 'Invoice Value']
+
+
+def _month(rows, name):
+    wb = openpyxl.Workbook()
+    wb.active.title = 'Read me'
+    wb.active['A1'] = 'Goods and Services Tax - GSTR-2B'
+    ws = wb.create_sheet('B2B')
+    ws['A1'] = 'Taxable inward supplies received from registered persons'
+    ws.merge_cells('A1:F1')
+    ws['A5'], ws['B5'], ws['C5'] = HEADER[0], HEADER[1], 'Invoice details'
+    ws.merge_cells('A5:A6')
+    ws.merge_cells('B5:B6')
+    ws.merge_cells('C5:F5')
+    for c, label in enumerate(HEADER[2:], start=3):
+        ws.cell(6, c, label)
+    for row in ws.iter_rows(min_row=5, max_row=6):
+        for cell in row:
+            cell.font = Font(bold=True)
+            cell.fill = PatternFill('solid', fgColor='FFDDEBF7')
+    for r, row in enumerate(rows, start=7):
+        for c, v in enumerate(row, start=1):
+            ws.cell(r, c, v)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    buf.name = name
+    return buf
+
+
+def _rows(month, n):
+    return [(f'27AAAPV{i:04d}A1Z5', f'Vendor {i}', f'{month}/{i}', 'R', f'0{month}-04-2024', 1000.0 + i)
+            for i in range(n)]
+
+
+def test_merge_keeps_header_template_and_dedupes():
+    apr, may = _rows(1, 5), _rows(2, 4)
+    data, err = merge_gstr2b_files([_month(apr, 'apr.xlsx'), _month(may + apr[:2], 'may.xlsx')])
+    assert err is None
+    wb = openpyxl.load_workbook(io.BytesIO(data))
+    ws = wb['B2B']
+
+    assert sorted(map(str, ws.merged_cells.ranges)) == ['A1:F1', 'A5:A6', 'B5:B6', 'C5:F5']
+    assert ws['A5'].value == HEADER[0] and ws['C5'].value == 'Invoice details'
+    assert [ws.cell(6, c).value for c in range(3, 7)] == HEADER[2:]
+    for coord in ('A5', 'C5', 'D6', 'F6'):
+        assert ws[coord].font.b and ws[coord].fill.fgColor.rgb == 'FFDDEBF7', coord
+
+    body = [r for r in ws.iter_rows(min_row=7, values_only=True)]
+    assert body == apr + may                       # April's repeats in May dropped
+    assert wb['Read me']['A1'].value == 'Goods and Services Tax - GSTR-2B'
+
+
+def test_keys_of_rows_shorter_than_the_key_columns():
+    short = [('27AAAPV0001A1Z5', 'Vendor', 'INV/1'), ('27AAAPV0002A1Z5',)]
+    keys = encode_keys(short, SHEET_KEY_COLS['B2BA'])       # every row ends before column G
+    assert keys.tolist() == ['INV/1\x1fNONE\x1fNone', 'NONE\x1fNONE\x1fNone']
+
+    mixed = short + [('27AAAPV0001A1Z5', 'Vendor', 'INV/1', None, None)]
+    keys = encode_keys(mixed)
+    assert keys[0] == keys[2] and keys[0] != keys[1]
+    assert new_row_mask(keys, set()).tolist() == [True, True, False]
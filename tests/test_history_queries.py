@@ -0,0 +1,74 @@
+# tests/test_history_queries.py
+# Cross-run queries over recon_rows / vendor_rollups and filtered reopening
+
+import pandas as pd
+
+from modules.status_codes import ISSUE, has_flag
+from tests.conftest import META, make_b2b
+
+NOT_IN_2B = 'Invoices Not in GSTR-2B'
+
+
+def _save(db, period, seed):
+    df = make_b2b(n=300, seed=seed)
+    return db.save_reconciliation(dict(META, period=period), df), df
+
+
+def test_query_invoices_across_runs(db):
+    (r1, d1), (r2, d2) = _save(db, 'April', 1), _save(db, 'May', 2)
+    gstin = d1.loc[d1['Recon_Status'] == NOT_IN_2B, 'GSTIN'].iloc[0]
+    got = db.query_invoices(gstin=gstin, statuses=NOT_IN_2B, client_gstin=META['gstin'])
+    expected = sum(((d['GSTIN'] == gstin) & (d['Recon_Status'] == NOT_IN_2B)).sum() for d in (d1, d2))
+    assert len(got) == expected
+    assert set(got['recon_id']) <= {r1, r2}
+    assert set(got['status']) == {NOT_IN_2B}
+
+    one = d1[(d1['GSTIN'] == gstin) & (d1['Recon_Status'] == NOT_IN_2B)]
+    got1 = got[got['recon_id'] == r1]
+    assert abs(got1['taxable_books'].sum() - one['Taxable Value_BOOKS'].sum()) < 0.01
+
+
+def test_repeat_offenders_need_min_runs(db):
+    _, d1 = _save(db, 'April', 1)
+    assert db.get_repeat_offenders(client_gstin=META['gstin']).empty
+    _, d2 = _save(db, 'May', 2)
+    rep = db.get_repeat_offenders(client_gstin=META['gstin'])
+    both = (set(d1.loc[d1['Recon_Status'] == NOT_IN_2B, 'GSTIN'])
+            & set(d2.loc[d2['Recon_Status'] == NOT_IN_2B, 'GSTIN']))
+    assert set(rep['gstin']) == both
+    assert (rep['runs'] == 2).all()
+
+
+def test_vendor_trend_matches_result_frames(db):
+    _, d1 = _save(db, 'April', 1)
+    _, d2 = _save(db, 'May', 2)
+    _save(db, 'May', 3)                             # re-save of May: the latest run wins
+    d3 = make_b2b(n=300, seed=3)
+    trend = db.get_vendor_trend(META['name'], META['gstin'], by='month')
+    assert list(dict.fromkeys(trend['Period'])) == ['2024-25 | April', '2024-25 | May']
+
+    may = trend[trend['Period'] == '2024-25 | May'].set_index('GSTIN')['issue_count']
+    expected = d3[has_flag(d3['Recon_Status'], ISSUE)].groupby('GSTIN').size()
+    pd.testing.assert_series_equal(may.sort_index(), expected.sort_index(),
+                                   check_names=False, check_dtype=False)
+
+    year = db.get_vendor_trend(META['name'], META['gstin'], by='year')
+    assert set(year['Period']) == {'2024-25'}
+    assert year['issue_count'].sum() == trend['issue_count'].sum()
+
+
+def test_load_filtered_by_vendor_and_status(db):
+    rid, df = _save(db, 'April', 1)
+    gstin = df.loc[df['Recon_Status'] == NOT_IN_2B, 'GSTIN'].iloc[1]
+    meta, part = db.load_reconciliation_filtered(rid, statuses=[NOT_IN_2B], gstins=[gstin],
+                                                 columns=['GSTIN', 'Recon_Status', 'Invoice Number_BOOKS',
+                                                          'No Such Column'])
+    want = df[(df['GSTIN'] == gstin) & (df['Recon_Status'] == NOT_IN_2B)]
+    assert meta['gstin'] == META['gstin']
+    assert list(part.columns) == ['GSTIN', 'Recon_Status', 'Invoice Number_BOOKS']
+    assert len(part) > 0
+    assert part['Invoice Number_BOOKS'].tolist() == want['Invoice Number_BOOKS'].tolist()
+
+
+def test_load_filtered_unknown_run(db):
+    assert db.load_reconciliation_filtered(999) == (None, None)
@@ -0,0 +1,70 @@
+# tests/test_recon_cube.py
+# Cube counts and totals equal the column sums / filtered frames they replaced
+
+import pandas as pd
+import pytest
+
+from modules.recon_cube import build_cube
+from modules.status_codes import Flag, ISSUE
+
+HEADS = ['Taxable Value', 'IGST', 'CGST', 'SGST']
+
+
+def _col_sum(df, col):
+    """The old report helper: float(df[col].fillna(0).sum())."""
+    return float(df[col].fillna(0).sum()) if col in df.columns else 0.0
+
+
+def _row8(df_s, suffix):
+    """The old source-grid row, over a notna-filtered frame."""
+    tv, ig, cg, sg = (_col_sum(df_s, h + suffix) for h in HEADS)
+    tg = ig + cg + sg
+    return [len(df_s), tv, ig, cg, sg, 0.0, tg, tv + tg]
+
+
+@pytest.fixture
+def frame(b2b_frame):
+    df = b2b_frame.copy()
+    df['Final_Taxable'] = df['Taxable Value_BOOKS'].fillna(df['Taxable Value_GST'])
+    df.loc[::7, 'Taxable Value_GST'] = None           # taxes present, taxable blank
+    return df
+
+
+@pytest.mark.parametrize('side, suffix', [('books', '_BOOKS'), ('gst', '_GST')])
+def test_row8_matches_notna_filtered_frame(frame, side, suffix):
+    cube = build_cube(frame)
+    old = _row8(frame[frame['Taxable Value' + suffix].notna()], suffix)
+    assert cube.row8(side) == pytest.approx(old, abs=0.005)
+
+
+@pytest.mark.parametrize('side, suffix', [('books', '_BOOKS'), ('gst', '_GST')])
+def test_totals_match_plain_column_sums(frame, side, suffix):
+    cube = build_cube(frame)
+    tot = cube.totals(side)
+    assert tot[1:5] == pytest.approx([_col_sum(frame, h + suffix) for h in HEADS], abs=0.005)
+    for head, col in [('igst', 'IGST'), ('cgst', 'CGST'), ('sgst', 'SGST')]:
+        assert cube.total(f'{head}_{side}') == pytest.approx(_col_sum(frame, col + suffix), abs=0.005)
+
+
+@pytest.mark.parametrize('pattern, old', [
+    ('Matched', 'Matched'),
+    (Flag.MISMATCH, 'Mismatch'),
+    (ISSUE, 'Not in|Mismatch|Suggestion|Manual|Tax Error'),
+    (r'^Invoices Not in GSTR-2B$', r'^Invoices Not in GSTR-2B$'),
+])
+def test_counts_and_final_by_status_pattern(frame, pattern, old):
+    cube = build_cube(frame)
+    sub = frame[frame['Recon_Status'].str.contains(old, na=False)]
+    assert cube.count(pattern) == len(sub)
+    assert cube.total('final', pattern) == pytest.approx(float(sub['Final_Taxable'].sum()), abs=0.005)
+
+
+def test_by_gstin_matches_groupby(frame):
+    cube = build_cube(frame)
+    sub = frame[frame['Recon_Status'] == 'Invoices Not in GSTR-2B']
+    old = sub.groupby('GSTIN').agg(rows=('GSTIN', 'size'), final=('Final_Taxable', 'sum'))
+    got = cube.by_gstin(Flag.NOT_IN_2B)
+    assert got['rows'].to_dict() == old['rows'].to_dict()
+    pd.testing.assert_series_equal(got['final'], old['final'], check_names=False,
+                                   check_index_type=False, atol=0.005)
+    assert sum(cube.status_counts().values()) == len(frame)
@@ -0,0 +1,38 @@
+# tests/test_report_gen.py
+# Vendor split ZIP: pooled (spawned workers) and serial rendering agree
+
+import io
+import zipfile
+
+from modules import report_gen
+
+
+def _parts(zip_buffer):
+    """{workbook name: {part: bytes}} — docProps/core.xml carries the creation time."""
+    out = {}
+    with zipfile.ZipFile(io.BytesIO(zip_buffer.getvalue())) as z:
+        for name in z.namelist():
+            with zipfile.ZipFile(io.BytesIO(z.read(name))) as book:
+                out[name] = {p: book.read(p) for p in book.namelist() if p != 'docProps/core.xml'}
+    return out
+
+
+def test_pooled_vendor_split_matches_serial(monkeypatch, b2b_frame):
+    serial = _parts(report_gen.generate_vendor_split_zip(b2b_frame))
+
+    monkeypatch.setattr(report_gen, '_SPLIT_PARALLEL_MIN', 2)
+    monkeypatch.setattr(report_gen.os, 'cpu_count', lambda: 2)
+    contexts = []
+
+    class _Pool(report_gen.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            contexts.append(kwargs['mp_context'].get_start_method())
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(report_gen, 'ProcessPoolExecutor', _Pool)
+    pooled = _parts(report_gen.generate_vendor_split_zip(b2b_frame))
+
+    assert contexts == ['spawn']
+    assert len(serial) > 2
+    assert list(pooled) == list(serial)
+    assert pooled == serial
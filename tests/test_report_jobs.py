@@ -0,0 +1,39 @@
+# tests/test_report_jobs.py
+# Background report jobs: status rows, artifacts, reuse of identical jobs
+
+import time
+
+import pytest
+
+from modules import report_jobs
+
+
+def _wait(job_id, timeout=30):
+    deadline = time.time() + timeout
+    while report_jobs.is_pending(report_jobs.job_status(job_id)):
+        if time.time() > deadline:
+            pytest.fail("report job did not finish")
+        time.sleep(0.05)
+    return report_jobs.job_status(job_id)
+
+
+def test_job_runs_and_is_reused(db, tmp_path, b2b_frame):
+    build = lambda df: df.to_csv(index=False).encode()
+    job = report_jobs.submit_report('csv', str(tmp_path), 'r.csv', build, b2b_frame)
+    status = _wait(job)
+    assert status['status'] == report_jobs.DONE
+    assert report_jobs.read_artifact(status) == build(b2b_frame)
+    assert report_jobs.submit_report('csv', str(tmp_path), 'r.csv', build, b2b_frame) == job
+
+
+def test_failed_job_records_error(db, tmp_path):
+    def broken():
+        raise ValueError("no rows")
+    status = _wait(report_jobs.submit_report('bad', str(tmp_path), 'x.xlsx', broken))
+    assert status['status'] == report_jobs.FAILED and 'no rows' in status['error']
+    assert report_jobs.read_artifact(status) is None
+
+
+def test_status_of_unknown_job_is_a_plain_read(db):
+    assert report_jobs.job_status(12345) is None
+    assert report_jobs.get_report_jobs().empty
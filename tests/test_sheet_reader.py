@@ -0,0 +1,107 @@
+# tests/test_sheet_reader.py
+# CSV loader: record-based header skip, money column detection
+
+import io
+
+import pytest
+
+from modules import sheet_reader
+
+
+def _csv(lines, name='books.csv'):
+    f = io.BytesIO('\r\n'.join(lines).encode('utf-8'))
+    f.name = name
+    return f
+
+
+def test_quoted_newlines_before_header_do_not_shift_rows():
+    lines = ['"Demo Traders\nUnit 2, MIDC"', '"Purchase Register\nFY 2024-25"', '',
+             'GSTIN of Supplier,Invoice Number,Invoice date,Taxable Value']
+    lines += [f'27AAAPV{i:04d}A1Z5,INV-{i:03d},01/04/2024,"1,{i:03d}.00"' for i in range(50)]
+    df, header_idx = sheet_reader.read_csv_sheet(_csv(lines), chunk_rows=16)
+    assert header_idx == 3
+    assert len(df) == 50
+    assert df['Invoice Number'].iloc[0] == 'INV-000'
+    assert df['Invoice Number'].iloc[-1] == 'INV-049'
+    assert df['Taxable Value'].iloc[0] == 1000.0
+
+
+def test_quoted_newline_in_data_row_stays_one_record():
+    lines = ['GSTIN,Invoice No,Date,Narration,IGST Amount',
+             '27AAAPV0001A1Z5,A1,01/04/2024,"two\nlines",18.00',
+             '27AAAPV0002A1Z5,A2,02/04/2024,plain,36.00']
+    df, _ = sheet_reader.read_csv_sheet(_csv(lines))
+    assert list(df['Invoice No']) == ['A1', 'A2']
+    assert list(df['IGST Amount']) == [18.0, 36.0]
+
+
+@pytest.mark.parametrize('name', [
+    'Taxable Value', 'Invoice Value(₹)', 'Integrated Tax(₹)', 'Central Tax Paid',
+    'State/UT Tax(₹)', 'Cess(₹)', 'IGST Amount', 'Total Invoice Value', 'Bill Amt',
+])
+def test_money_columns(name):
+    assert sheet_reader._is_money_column(name)
+
+
+@pytest.mark.parametrize('name', [
+    'Place of Supply (State/UT)', 'State/UT', 'Total Type', 'Value Date', 'Tax Period',
+    'Rate(%)', 'Invoice Number', 'Supplier Name', 'Integrated', 'Central Registration',
+    'Totalled By',
+])
+def test_text_columns(name):
+    assert not sheet_reader._is_money_column(name)
+
+
+def test_numeric_looking_text_column_stays_text():
+    lines = ['GSTIN,Invoice No,Date,Place of Supply (State/UT),Total Type,Taxable Value',
+             '27AAAPV0001A1Z5,A1,01/04/2024,27,01,100',
+             '27AAAPV0002A1Z5,A2,02/04/2024,09,02,200']
+    df, _ = sheet_reader.read_csv_sheet(_csv(lines))
+    assert list(df['Place of Supply (State/UT)']) == ['27', '09']
+    assert list(df['Total Type']) == ['01', '02']
+    assert list(df['Taxable Value']) == [100.0, 200.0]
+
+
+# ── Excel: calamine and openpyxl agree on the row origin ─────────────────────
+
+def _xlsx_with_leading_blanks():
+    openpyxl = pytest.importorskip('openpyxl')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'Purchase'
+    ws['C2'] = 'Purchase Register'
+    for col, name in enumerate(['GSTIN of Supplier', 'Invoice Number', 'Invoice Date',
+                                'Taxable Value'], start=2):
+        ws.cell(5, col, name)
+    for i in range(20):
+        ws.append([None, f'27AAAPV{i:04d}A1Z5', f'INV-{i:03d}', '01-04-2024', 100.0 + i])
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+
+def test_calamine_and_openpyxl_report_the_same_header_row(monkeypatch):
+    pytest.importorskip('python_calamine')
+    f = _xlsx_with_leading_blanks()
+    df_cal, idx_cal = sheet_reader.read_sheet(f, 'Purchase')
+    monkeypatch.setattr(sheet_reader, 'CalamineWorkbook', None)
+    df_opx, idx_opx = sheet_reader.read_sheet(f, 'Purchase')
+    assert idx_cal == idx_opx == 4
+    assert list(df_cal.columns) == list(df_opx.columns)
+    assert df_cal['Invoice Number'].tolist() == df_opx['Invoice Number'].tolist()
+    assert df_cal['Taxable Value'].tolist() == df_opx['Taxable Value'].tolist()
+
+
+class _UsedRangeSheet:
+    """calamine sheet whose iterator starts at the used range (older releases)."""
+    start = (2, 1)
+
+    def iter_rows(self):
+        return iter([['GSTIN', 'Invoice No'], ['27X', 'A1']])
+
+
+def test_calamine_rows_restore_skipped_leading_rows_and_columns():
+    rows = list(sheet_reader._calamine_rows(_UsedRangeSheet()))
+    assert rows[:2] == [(None, None, None)] * 2
+    assert rows[2:] == [(None, 'GSTIN', 'Invoice No'), (None, '27X', 'A1')]
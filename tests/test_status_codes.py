@@ -0,0 +1,85 @@
+# tests/test_status_codes.py
+# Flag masks select exactly the rows the old str.contains filters did
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.status_codes import (Flag, ISSUE, STATUS_LABELS, encode_statuses, has_flag,
+                                  label_flags, status_counts)
+from tests.conftest import B2B_STATUSES, CDNR_STATUSES
+
+# Labels from imports / older runs that the engines never write
+ODD_LABELS = ['Matched (Manual Override)', 'AI Matched (Mismatch) - reviewed',
+              'Not in GSTR-2B', 'Suggestion (Group Match) ', 'Old ITC', 'Pending', '']
+
+# (old pattern, negated pattern or None) → (flag, without)
+B2B_FILTERS = [
+    (('Matched', 'AI'),          (Flag.MATCHED, Flag.AI)),
+    (('Mismatch', None),         (Flag.MISMATCH, 0)),
+    (('AI', None),               (Flag.AI, 0)),
+    (('Suggestion', 'Group Match'), (Flag.SUGGESTION, Flag.GROUP)),
+    (('Group Match', None),      (Flag.GROUP, 0)),
+    (('Manual', None),           (Flag.MANUAL, 0)),
+    (('Not in', None),           (Flag.NOT_IN, 0)),
+    (('Not in|Mismatch|Suggestion|Manual|Tax Error', None), (ISSUE, 0)),
+]
+CDNR_FILTERS = [
+    ((r'CDNR Matched$', None),   (Flag.EXACT, 0)),
+    (('Tax Error', None),        (Flag.TAX_ERROR, 0)),
+    (('AI Matched', None),       (Flag.AI, 0)),
+    (('Mismatch', None),         (Flag.MISMATCH, 0)),
+    (('Not in GSTR-2B', None),   (Flag.NOT_IN_2B, 0)),
+    (('Not in Books', None),     (Flag.NOT_IN_BOOKS, 0)),
+    (('Suggestion', None),       (Flag.SUGGESTION, 0)),
+]
+
+
+def _series(labels, n=500, seed=0):
+    r = np.random.default_rng(seed)
+    values = r.choice(np.array(labels + [None], dtype=object), n)
+    return pd.Series(values, name='Recon_Status')
+
+
+def _old_mask(s, pattern, negated):
+    mask = s.str.contains(pattern, regex=True, na=False)
+    if negated:
+        mask &= ~s.str.contains(negated, regex=True, na=False)
+    return mask
+
+
+@pytest.mark.parametrize('categorical', [False, True])
+@pytest.mark.parametrize('old, new', B2B_FILTERS)
+def test_b2b_flags_match_old_patterns(old, new, categorical):
+    s = _series(B2B_STATUSES + ODD_LABELS)
+    expected = _old_mask(s, *old)
+    if categorical:
+        s = encode_statuses(s.to_frame())['Recon_Status']
+    assert has_flag(s, *new).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize('old, new', CDNR_FILTERS)
+def test_cdnr_flags_match_old_patterns(old, new):
+    s = _series(CDNR_STATUSES).rename('Recon_Status_CDNR')
+    expected = _old_mask(s, *old)
+    s = encode_statuses(s.to_frame())['Recon_Status_CDNR']
+    assert has_flag(s, *new).tolist() == expected.tolist()
+
+
+def test_every_engine_label_is_known():
+    assert set(B2B_STATUSES) | set(CDNR_STATUSES) == set(STATUS_LABELS.values())
+
+
+def test_side_bits():
+    assert label_flags('Invoices Not in GSTR-2B') & (Flag.BOOKS | Flag.GST) == Flag.BOOKS
+    assert label_flags('Invoices Not in Purchase Books') & (Flag.BOOKS | Flag.GST) == Flag.GST
+    assert label_flags('Old ITC (Previous Year)') & (Flag.BOOKS | Flag.GST) == Flag.GST
+    assert label_flags('Matched') & (Flag.BOOKS | Flag.GST) == Flag.BOOKS | Flag.GST
+    assert label_flags(None) == 0 and label_flags(float('nan')) == 0
+
+
+def test_status_counts_skip_unused_categories():
+    s = encode_statuses(pd.DataFrame({'Recon_Status': ['Matched', 'Matched', 'Suggestion']}))
+    counts = status_counts(s['Recon_Status'])
+    assert counts.to_dict() == {'Matched': 2, 'Suggestion': 1}
+    assert counts.to_dict() == s['Recon_Status'].astype(object).value_counts().to_dict()
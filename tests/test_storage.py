@@ -0,0 +1,85 @@
+# tests/test_storage.py
+# Result storage: content-addressed Parquet chunks round-trip exactly
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import columnar
+from modules.status_codes import STATUS_COLUMNS
+from tests.conftest import META
+
+pytestmark = pytest.mark.skipif(not columnar.arrow_available(), reason="pyarrow not installed")
+
+
+def _plain(df):
+    """Status categoricals back to plain labels, for comparison with the saved frame."""
+    df = df.copy()
+    for col in (*STATUS_COLUMNS, 'Match_Logic'):
+        if col in df.columns:
+            df[col] = df[col].astype(object)
+    return df
+
+
+def _chunk_count(db):
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM result_chunks").fetchone()[0]
+
+
+def test_chunks_round_trip_mixed_columns():
+    df = pd.DataFrame({
+        'Invoice Number': [101, 'INV/2', 3.5, None, True],
+        'Invoice Date': [datetime.datetime(2024, 4, 1), datetime.date(2024, 4, 2), 'x', None, 7],
+        'Taxable Value': [1.5, np.nan, 3.0, 4.25, 0.0],
+        'Recon_Status': pd.Categorical(['Matched', 'Suggestion', None, 'Matched', 'Suggestion']),
+    })
+    df.attrs['sheet_name'] = 'B2B'
+    chunks = columnar.frame_to_parquet_chunks(df, 2)
+    assert [n for _, n in chunks] == [2, 2, 1]
+    back = columnar.parquet_chunks_to_frame([(data, None) for data, _ in chunks])
+    assert back['Invoice Number'].tolist()[:3] == [101, 'INV/2', 3.5]
+    assert back['Invoice Date'].tolist()[:3] == [datetime.datetime(2024, 4, 1),
+                                                 datetime.date(2024, 4, 2), 'x']
+    assert back['Taxable Value'].equals(df['Taxable Value'])
+    assert back['Recon_Status'].tolist()[:2] == ['Matched', 'Suggestion']
+    assert back.attrs['sheet_name'] == 'B2B'
+
+
+def test_positional_columns_survive():
+    df = pd.DataFrame([[1, 'a'], [2, 'b']], columns=[0, 1])
+    back = columnar.parquet_chunks_to_frame([(columnar.frame_to_parquet(df), None)])
+    assert list(back.columns) == [0, 1]
+    assert back.equals(df)
+
+
+def test_saved_run_round_trips_through_chunks(db, monkeypatch, b2b_frame, cdnr_frame):
+    monkeypatch.setattr(db, '_CHUNK_ROWS', 128)
+    recon_id = db.save_reconciliation(META, b2b_frame)
+    db.save_cdnr_to_history(recon_id, cdnr_frame, {'total': len(cdnr_frame)})
+    meta, df, df_cdnr, summary = db.load_reconciliation(recon_id)
+    assert meta['gstin'] == META['gstin']
+    pd.testing.assert_frame_equal(_plain(df), b2b_frame, check_dtype=False)
+    pd.testing.assert_frame_equal(_plain(df_cdnr), cdnr_frame, check_dtype=False)
+    assert summary == {'total': len(cdnr_frame)}
+
+
+def test_identical_chunks_are_stored_once(db, monkeypatch, b2b_frame):
+    monkeypatch.setattr(db, '_CHUNK_ROWS', 128)
+    n_chunks = -(-len(b2b_frame) // 128)
+    first = db.save_reconciliation(META, b2b_frame)
+    assert _chunk_count(db) == n_chunks
+    db.save_reconciliation(dict(META, period='May'), b2b_frame)
+    assert _chunk_count(db) == n_chunks
+
+    edited = b2b_frame.copy()
+    edited.loc[len(edited) - 1, 'Name of Party'] = 'Renamed Vendor'
+    third = db.save_reconciliation(dict(META, period='June'), edited)
+    assert _chunk_count(db) == n_chunks + 1
+    assert db.load_reconciliation(third)[1]['Name of Party'].iloc[-1] == 'Renamed Vendor'
+
+    db.delete_reconciliation(third)
+    assert _chunk_count(db) == n_chunks
+    pd.testing.assert_frame_equal(_plain(db.load_reconciliation(first)[1]), b2b_frame,
+                                  check_dtype=False)
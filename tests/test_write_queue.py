@@ -0,0 +1,34 @@
+# tests/test_write_queue.py
+# Queued audit / follow-up writes: failures are logged and reported once
+
+import logging
+
+from tests.conftest import META
+
+
+def _bad_followup(db, recon_id):
+    db.upsert_followup(recon_id, 'Vendor X', {'not': 'bindable'})
+
+
+def test_sync_write_failure_is_reported_once(db, caplog):
+    with caplog.at_level(logging.ERROR, logger='modules.db_handler'):
+        _bad_followup(db, 1)
+    assert any('followup' in r.getMessage() for r in caplog.records)
+    failed = db.flush_writes()
+    assert [kind for kind, _ in failed] == ['followup']
+    assert db.flush_writes() == []
+
+
+def test_queued_failure_does_not_drop_the_batch(db, b2b_frame):
+    recon_id = db.save_reconciliation(META, b2b_frame)
+    db.set_sync_writes(False)
+    try:
+        db.upsert_followup(recon_id, 'Vendor A', '27AAAPV0001A1Z1', 3, 100.0)
+        _bad_followup(db, recon_id)
+        db.log_action(recon_id, 'notice', {'vendor': 'Vendor A'})
+        failed = db.flush_writes()
+    finally:
+        db.set_sync_writes(True)
+    assert [kind for kind, _ in failed] == ['followup']
+    assert db.get_followups(recon_id)['vendor_name'].tolist() == ['Vendor A']
+    assert 'notice' in db.get_audit_log(recon_id)['action_type'].tolist()
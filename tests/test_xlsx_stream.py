@@ -0,0 +1,78 @@
+# tests/test_xlsx_stream.py
+# Constant-memory workbooks hold the same cells, formats and layout as the
+# in-memory ones
+
+import datetime
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+openpyxl = pytest.importorskip('openpyxl')
+
+from modules import xlsx_stream
+from modules.combined_report_gen import generate_combined_excel
+from modules.report_gen import generate_excel
+
+
+def _dump(src):
+    """Every styled / non-empty cell plus merges, widths, heights and panes, per sheet."""
+    wb = openpyxl.load_workbook(io.BytesIO(src) if isinstance(src, bytes) else src)
+    out = {}
+    for ws in wb.worksheets:
+        cells = {c.coordinate: (c.value, c.number_format, c.font.b, c.fill.fgColor.rgb,
+                                c.border.left.style, c.alignment.horizontal)
+                 for row in ws.iter_rows() for c in row if c.value is not None or c.has_style}
+        out[ws.title] = (sorted(map(str, ws.merged_cells.ranges)),
+                         sorted((k, v.width) for k, v in ws.column_dimensions.items()),
+                         sorted((k, v.height) for k, v in ws.row_dimensions.items() if v.height),
+                         ws.freeze_panes, cells)
+    return out
+
+
+def _assert_same(memory, streamed):
+    assert list(streamed) == list(memory)
+    for sheet, layout in memory.items():
+        assert streamed[sheet] == layout, sheet
+
+
+@pytest.fixture
+def report_frame(b2b_frame):
+    df = b2b_frame.copy()
+    df['Final_Taxable'] = df['Taxable Value_BOOKS'].fillna(df['Taxable Value_GST'])
+    return df
+
+
+ARGS = ('27AAACC1234C1Z5', 'Client One', '2024-25', 'April')
+
+
+def test_b2b_report_streamed_matches_memory(tmp_path, report_frame, cdnr_frame):
+    memory = generate_excel(report_frame, *ARGS, cdnr_df=cdnr_frame)
+    path = generate_excel(report_frame, *ARGS, cdnr_df=cdnr_frame,
+                          path=str(tmp_path / 'b2b.xlsx'), streaming=True)
+    _assert_same(_dump(memory), _dump(path))
+
+
+def test_combined_report_streamed_matches_memory(tmp_path, report_frame, cdnr_frame):
+    memory = generate_combined_excel(report_frame, cdnr_frame, *ARGS)
+    path = generate_combined_excel(report_frame, cdnr_frame, *ARGS,
+                                   path=str(tmp_path / 'combined.xlsx'), streaming=True)
+    _assert_same(_dump(memory), _dump(path))
+
+
+def test_write_frame_renders_like_to_excel(tmp_path):
+    df = pd.DataFrame({
+        'Invoice': ['A1', None, 'A3'],
+        'Amount': [1.5, np.nan, 3.0],
+        'Count': [1, 2, 3],
+        'Date': pd.to_datetime(['2024-04-01', None, '2024-04-03']),
+        'Day': [datetime.date(2024, 4, 1), None, datetime.date(2024, 4, 3)],
+    })
+    dumps = []
+    for streaming in (False, True):
+        path = str(tmp_path / f'frame_{streaming}.xlsx')
+        wb, writer, target = xlsx_stream.open_workbook(path, streaming)
+        xlsx_stream.write_frame(wb, writer, df, 'Data', startrow=2)
+        dumps.append(_dump(xlsx_stream.close_workbook(wb, writer, target)))
+    _assert_same(*dumps)